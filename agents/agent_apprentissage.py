@@ -1,10 +1,12 @@
  # -*- coding: utf-8 -*-
 
 import logging
-from .agent_memoire import lire_donnees_json, ecrire_donnees_json
+from .agent_memoire import lire_donnees_json, ecrire_donnees_json, sous_verrou
 
 logger = logging.getLogger(__name__)
 NOM_FICHIER_APPRENTISSAGES = 'apprentissages.json'
+# Clés des informations "épinglées" : toujours rappelées à l'IA, quelle que soit la demande.
+NOM_FICHIER_EPINGLES = 'apprentissages_epingles.json'
 
 def _charger_apprentissages() -> dict:
     """
@@ -21,11 +23,34 @@ def _sauvegarder_apprentissages(apprentissages: dict):
     """Sauvegarde le dictionnaire des apprentissages dans le fichier JSON."""
     ecrire_donnees_json(NOM_FICHIER_APPRENTISSAGES, apprentissages)
 
-def enregistrer_apprentissage(cle: str, valeur: str) -> dict:
+def _charger_epingles() -> list:
+    data = lire_donnees_json(NOM_FICHIER_EPINGLES)
+    return data if isinstance(data, list) else []
+
+@sous_verrou(NOM_FICHIER_EPINGLES)
+def _epingler(cle: str, epingle: bool):
+    """Ajoute ou retire une clé de la liste des informations épinglées."""
+    epingles = _charger_epingles()
+    if epingle and cle not in epingles:
+        epingles.append(cle)
+    elif not epingle and cle in epingles:
+        epingles.remove(cle)
+    else:
+        return
+    ecrire_donnees_json(NOM_FICHIER_EPINGLES, epingles)
+
+def lister_epingles() -> list:
+    """Clés des informations épinglées (toujours incluses dans le contexte de l'IA)."""
+    return _charger_epingles()
+
+@sous_verrou(NOM_FICHIER_APPRENTISSAGES)
+def enregistrer_apprentissage(cle: str, valeur: str, epingle: bool = None) -> dict:
     """
     Enregistre ou met à jour une information clé-valeur dans la mémoire persistante.
     La clé est un identifiant unique pour l'information, la valeur est l'information elle-même.
     Exemple: cle='preference_theme', valeur='sombre'.
+    Si 'epingle' est vrai, l'information sera toujours rappelée à l'IA ; s'il est faux, elle ne le sera
+    que lorsqu'elle concerne la demande en cours. Non précisé : l'état précédent est conservé.
     """
     logger.info(f"🧠 APPRENTISSAGE: Enregistrement de la clé '{cle}' avec la valeur '{valeur}'.")
     if not isinstance(cle, str) or not isinstance(valeur, str) or not cle or not valeur:
@@ -36,6 +61,8 @@ def enregistrer_apprentissage(cle: str, valeur: str) -> dict:
     apprentissages = _charger_apprentissages()
     apprentissages[cle] = valeur
     _sauvegarder_apprentissages(apprentissages)
+    if epingle is not None:
+        _epingler(cle, bool(epingle))
     
     return {"succes": f"Information '{cle}' enregistrée avec succès."}
 
@@ -61,6 +88,7 @@ def lister_apprentissages() -> dict:
     logger.debug("🧠 APPRENTISSAGE: Demande de la liste complète des apprentissages.")
     return _charger_apprentissages()
 
+@sous_verrou(NOM_FICHIER_APPRENTISSAGES)
 def supprimer_apprentissage(cle: str) -> dict:
     """
     Supprime une information de la mémoire persistante en utilisant sa clé.
@@ -71,6 +99,7 @@ def supprimer_apprentissage(cle: str) -> dict:
     if cle in apprentissages:
         del apprentissages[cle]
         _sauvegarder_apprentissages(apprentissages)
+        _epingler(cle, False)
         return {"succes": f"Information '{cle}' supprimée avec succès."}
     else:
         logger.warning(f"⚠️ APPRENTISSAGE: Clé '{cle}' non trouvée, suppression impossible.")
@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+
+# Boîte d'envoi de la synchronisation tâches -> calendrier.
+# Avant, après ajouter_tache / modifier_tache / supprimer_tache, le routeur créait, modifiait ou supprimait
+# l'événement Google lié (puis liait la tâche) avant même de répondre à Gemini : chaque tâche datée
+# ajoutait plusieurs allers-retours avec Google au tour de l'utilisateur, et une erreur passagère
+# laissait la tâche et le calendrier désynchronisés pour toujours.
+# Maintenant, le routeur dépose seulement une opération dans une file enregistrée sur disque
+# (memoire/boite_envoi.json), et un thread de travail la traite en arrière-plan :
+#   - une opération par tâche (sa clé d'idempotence, 'tache:<id>') : plusieurs modifications rapprochées
+#     de la même tâche sont regroupées en une seule synchronisation,
+#   - l'opération ne transporte pas les modifications : le thread lit l'état ACTUEL de la tâche et aligne
+#     l'événement dessus (le rejouer ne fait rien de plus),
+#   - l'identifiant de l'événement à créer est choisi par le bot et enregistré dans l'opération AVANT
+#     l'appel à Google : une reprise (après une erreur, un délai dépassé ou un redémarrage) retrouve
+#     l'événement s'il a bien été créé, au lieu d'en créer un second,
+#   - en cas d'échec, nouvel essai avec un délai croissant ; après TENTATIVES_MAX, l'opération est
+#     mise de côté (statut 'abandonnee') et signalée dans les logs.
+
+import time
+import uuid
+import logging
+import threading
+
+from .agent_memoire import lire_donnees_json, ecrire_donnees_json, verrou_fichier
+from .agent_taches import lier_tache_a_evenement, NOM_FICHIER_TACHES
+from .agent_calendrier import (
+    creer_evenement_calendrier, modifier_evenement_calendrier, supprimer_evenement_calendrier, identifiant_evenement
+)
+from .agent_temps import vers_iso
+
+logger = logging.getLogger(__name__)
+
+NOM_FICHIER_BOITE_ENVOI = 'boite_envoi.json'
+OUTILS_SYNCHRONISES = ("ajouter_tache", "modifier_tache", "supprimer_tache")
+
+# Durée des événements créés pour les échéances (les tâches n'ont qu'une date d'échéance).
+DUREE_EVENEMENT_TACHE_SECONDES = 3600
+# Attente avant de traiter une opération, pour regrouper les modifications d'un même tour (en secondes).
+DELAI_REGROUPEMENT_SECONDES = 2.0
+# Nouvel essai après DELAI_REESSAI_SECONDES, puis le double à chaque échec, au plus DELAI_REESSAI_MAX_SECONDES.
+DELAI_REESSAI_SECONDES = 5.0
+DELAI_REESSAI_MAX_SECONDES = 600.0
+TENTATIVES_MAX = 10
+# Réveil périodique du thread, même sans nouvelle opération (en secondes).
+INTERVALLE_MAX_SECONDES = 60.0
+
+STATUT_EN_ATTENTE = "en_attente"
+STATUT_ABANDONNEE = "abandonnee"
+
+# Protège le fichier de la boîte d'envoi (lecture, modification, écriture).
+_lock = threading.Lock()
+_reveil = threading.Event()
+_arret = threading.Event()
+_thread = None
+_statistiques = {"deposees": 0, "regroupees": 0, "traitees": 0, "echecs": 0, "abandonnees": 0}
+
+
+class ErreurSynchronisation(Exception):
+    """Une étape de la synchronisation a échoué ; l'opération sera retentée."""
+
+
+def _cle(tache_id: str) -> str:
+    return f"tache:{tache_id}"
+
+def _lire_operations() -> list:
+    return lire_donnees_json(NOM_FICHIER_BOITE_ENVOI)
+
+def _trouver(operations: list, cle: str):
+    return next((op for op in operations if op["cle"] == cle), None)
+
+# --- Dépôt (appelé par le routeur, ne contacte jamais Google) ---
+
+def planifier_synchronisation(function_name: str, function_response_data):
+    """
+    Dépose dans la boîte d'envoi la synchronisation avec le calendrier qu'implique le résultat d'un outil
+    de tâches. Ne fait rien pour les autres outils ou si l'outil a échoué.
+    """
+    if function_name not in OUTILS_SYNCHRONISES or not isinstance(function_response_data, dict):
+        return
+    if "erreur" in function_response_data or not function_response_data.get("id"):
+        return
+    event_id = function_response_data.get("google_calendar_event_id")
+    if function_name != "supprimer_tache" and not function_response_data.get("date_echeance") and not event_id:
+        # Tâche sans échéance et sans événement : rien à synchroniser.
+        return
+
+    cle = _cle(function_response_data["id"])
+    maintenant = time.time()
+    with _lock:
+        operations = _lire_operations()
+        operation = _trouver(operations, cle)
+        if operation is None:
+            operation = {
+                "cle": cle, "tache_id": function_response_data["id"], "event_id": None, "event_id_cree": None,
+                "version": 0, "tentatives": 0, "statut": STATUT_EN_ATTENTE, "cree_le": maintenant, "derniere_erreur": None,
+            }
+            operations.append(operation)
+            _statistiques["deposees"] += 1
+        else:
+            _statistiques["regroupees"] += 1
+        # Chaque dépôt change la version : si le thread est en train de traiter l'opération,
+        # il la gardera pour une nouvelle passe au lieu de la retirer.
+        operation["version"] += 1
+        operation["event_id"] = event_id or operation["event_id"]
+        operation["statut"] = STATUT_EN_ATTENTE
+        operation["tentatives"] = 0
+        operation["prochain_essai"] = maintenant + DELAI_REGROUPEMENT_SECONDES
+        ecrire_donnees_json(NOM_FICHIER_BOITE_ENVOI, operations)
+    logger.info(f"📮 BOÎTE D'ENVOI: Synchronisation de la tâche '{function_response_data['id']}' planifiée ({function_name}).")
+    demarrer_boite_envoi()
+    _reveil.set()
+
+# --- Traitement (thread de travail) ---
+
+def _noter_evenement_cree(cle: str, event_id: str):
+    """Enregistre l'identifiant de l'événement avant sa création : une reprise le retrouvera au lieu d'en créer un autre."""
+    with _lock:
+        operations = _lire_operations()
+        operation = _trouver(operations, cle)
+        if operation is not None:
+            operation["event_id_cree"] = event_id
+            ecrire_donnees_json(NOM_FICHIER_BOITE_ENVOI, operations)
+
+def _introuvable(reponse: dict) -> bool:
+    erreur = str(reponse.get("erreur", "")).lower()
+    return "introuvable" in erreur or "non trouvé" in erreur
+
+def _verifier(reponse: dict, etape: str) -> dict:
+    if "erreur" in reponse:
+        raise ErreurSynchronisation(f"{etape}: {reponse['erreur']}")
+    return reponse
+
+def _supprimer_evenement(event_id: str):
+    reponse = supprimer_evenement_calendrier(event_id=event_id)
+    if not _introuvable(reponse):
+        _verifier(reponse, "suppression de l'événement")
+
+def _lire_tache(tache_id: str):
+    return next((t for t in lire_donnees_json(NOM_FICHIER_TACHES) if t.get("id") == tache_id), None)
+
+def _lier(tache_id: str, event_id):
+    """
+    Lie (ou délie) la tâche à l'événement, sous le verrou des tâches et d'après leur état ACTUEL :
+    les appels à Google ont pris du temps, l'utilisateur a pu modifier ou supprimer la tâche entre-temps.
+    """
+    with verrou_fichier(NOM_FICHIER_TACHES):
+        tache = _lire_tache(tache_id)
+        if tache is None:
+            # Supprimée pendant la synchronisation : la passe suivante supprimera l'événement.
+            raise ErreurSynchronisation("tâche supprimée pendant la synchronisation")
+        if tache.get("google_calendar_event_id") == event_id:
+            return
+        _verifier(lier_tache_a_evenement(id_tache=tache_id, id_evenement=event_id), "liaison de la tâche")
+
+def _synchroniser(operation: dict):
+    """Aligne l'événement lié sur l'état actuel de la tâche. Peut être rejouée sans effet supplémentaire."""
+    tache = _lire_tache(operation["tache_id"])
+
+    if tache is None:
+        # Tâche supprimée : on supprime l'événement qui lui était lié (ou celui créé entre-temps).
+        for event_id in {operation.get("event_id"), operation.get("event_id_cree")} - {None}:
+            _supprimer_evenement(event_id)
+        return
+
+    event_id = tache.get("google_calendar_event_id") or operation.get("event_id_cree")
+    if not tache.get("date_echeance_epoch"):
+        # Échéance retirée : on supprime l'événement et on délie la tâche.
+        if event_id:
+            _supprimer_evenement(event_id)
+            _lier(tache["id"], None)
+        return
+
+    debut = vers_iso(tache["date_echeance_epoch"], tache.get("date_echeance_tz"))
+    fin = vers_iso(tache["date_echeance_epoch"] + DUREE_EVENEMENT_TACHE_SECONDES, tache.get("date_echeance_tz"))
+    if event_id:
+        reponse = modifier_evenement_calendrier(
+            event_id=event_id, nouveau_titre=tache["description"], nouvelle_date_heure_debut=debut, nouvelle_date_heure_fin=fin
+        )
+        if not _introuvable(reponse):
+            _verifier(reponse, "modification de l'événement")
+            if tache.get("google_calendar_event_id") != event_id:
+                _lier(tache["id"], event_id)
+            return
+        # L'événement a été supprimé dans Google entre-temps : on en recrée un.
+        logger.info(f"📮 BOÎTE D'ENVOI: Événement '{event_id}' introuvable, recréation pour la tâche '{tache['description']}'.")
+
+    nouvel_id = identifiant_evenement(f"{operation['cle']}:{uuid.uuid4().hex}")
+    _noter_evenement_cree(operation["cle"], nouvel_id)
+    reponse = _verifier(
+        creer_evenement_calendrier(titre=tache["description"], date_heure_debut=debut, date_heure_fin=fin, event_id=nouvel_id),
+        "création de l'événement"
+    )
+    _lier(tache["id"], reponse["event_id"])
+
+def _delai_reessai(tentatives: int) -> float:
+    return min(DELAI_REESSAI_SECONDES * 2 ** (tentatives - 1), DELAI_REESSAI_MAX_SECONDES)
+
+def _terminer(operation: dict, erreur: Exception = None):
+    """Retire l'opération traitée, sauf si elle a été redéposée entre-temps ; en cas d'erreur, planifie un nouvel essai."""
+    with _lock:
+        operations = _lire_operations()
+        actuelle = _trouver(operations, operation["cle"])
+        if actuelle is None:
+            return
+        if erreur is None:
+            _statistiques["traitees"] += 1
+            if actuelle["version"] == operation["version"]:
+                operations.remove(actuelle)
+        elif actuelle["version"] == operation["version"]:
+            _statistiques["echecs"] += 1
+            actuelle["tentatives"] += 1
+            actuelle["derniere_erreur"] = str(erreur)
+            if actuelle["tentatives"] >= TENTATIVES_MAX:
+                actuelle["statut"] = STATUT_ABANDONNEE
+                _statistiques["abandonnees"] += 1
+                logger.error(f"🔥 BOÎTE D'ENVOI: Synchronisation de la tâche '{actuelle['tache_id']}' abandonnée après {TENTATIVES_MAX} tentatives: {erreur}")
+            else:
+                actuelle["prochain_essai"] = time.time() + _delai_reessai(actuelle["tentatives"])
+                logger.warning(f"⚠️ BOÎTE D'ENVOI: Échec de la synchronisation de la tâche '{actuelle['tache_id']}' (tentative {actuelle['tentatives']}), nouvel essai dans {_delai_reessai(actuelle['tentatives']):.0f} s: {erreur}")
+        ecrire_donnees_json(NOM_FICHIER_BOITE_ENVOI, operations)
+
+def traiter_boite_envoi():
+    """
+    Traite les opérations arrivées à échéance, une par une.
+    Retourne le délai (en secondes) avant la prochaine opération en attente, ou None s'il n'y en a pas.
+    """
+    with _lock:
+        operations = [op for op in _lire_operations() if op["statut"] == STATUT_EN_ATTENTE]
+    maintenant = time.time()
+    for operation in sorted(operations, key=lambda op: op["prochain_essai"]):
+        if _arret.is_set() or operation["prochain_essai"] > maintenant:
+            continue
+        try:
+            _synchroniser(operation)
+        except Exception as e:
+            _terminer(operation, e)
+        else:
+            _terminer(operation)
+
+    with _lock:
+        echeances = [op["prochain_essai"] for op in _lire_operations() if op["statut"] == STATUT_EN_ATTENTE]
+    return max(0.0, min(echeances) - time.time()) if echeances else None
+
+def _boucle_travail():
+    while not _arret.is_set():
+        _reveil.clear()
+        try:
+            attente = traiter_boite_envoi()
+        except Exception as e:
+            logger.error(f"🔥 BOÎTE D'ENVOI: Erreur inattendue du thread de travail: {repr(e)}", exc_info=True)
+            attente = DELAI_REESSAI_SECONDES
+        _reveil.wait(INTERVALLE_MAX_SECONDES if attente is None else min(attente, INTERVALLE_MAX_SECONDES))
+
+def demarrer_boite_envoi():
+    """Démarre le thread de travail (une seule fois). Les opérations restées en attente au dernier arrêt sont reprises."""
+    global _thread
+    with _lock:
+        if _thread is not None and _thread.is_alive():
+            return
+        _arret.clear()
+        _thread = threading.Thread(target=_boucle_travail, daemon=True, name="boite-envoi")
+        _thread.start()
+    logger.info("📮 BOÎTE D'ENVOI: Thread de synchronisation tâches -> calendrier démarré.")
+
+def arreter_boite_envoi(delai: float = 10.0):
+    """Arrête le thread après l'opération en cours. Les opérations non traitées restent enregistrées pour le prochain démarrage."""
+    _arret.set()
+    _reveil.set()
+    if _thread is not None:
+        _thread.join(delai)
+
+def statistiques_boite_envoi() -> dict:
+    """Opérations déposées, regroupées avec une opération en attente, traitées, échouées et abandonnées ; taille actuelle de la file."""
+    with _lock:
+        operations = _lire_operations()
+        stats = dict(_statistiques)
+    stats["en_attente"] = sum(1 for op in operations if op["statut"] == STATUT_EN_ATTENTE)
+    stats["abandonnees_en_file"] = sum(1 for op in operations if op["statut"] == STATUT_ABANDONNEE)
+    return stats
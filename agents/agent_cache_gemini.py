@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+# Gestionnaire du cache de contexte Gemini ("cached content").
+# La partie fixe de la requête (prompt système + déclarations des outils) fait plusieurs milliers de tokens
+# et ne change pas d'un message à l'autre : on la dépose une fois chez Google, qui nous renvoie un "handle".
+# Les appels suivants ne transmettent plus que ce handle et la partie variable (contexte du moment + conversation).
+#
+# - Un cache par (modèle, jeu d'outils) : le sous-ensemble d'outils choisi pour la requête (agent_groupes_outils)
+#   fait partie du cache, Gemini refusant une liste d'outils à côté d'un cache. Les combinaisons de groupes
+#   sont peu nombreuses ; un cache qui ne sert plus expire de lui-même (il n'est prolongé qu'à l'usage).
+#   Si le texte du prompt change, l'ancien cache est supprimé et un nouveau est créé.
+# - Le cache a une durée de vie (TTL). Quand il approche de son expiration, on la prolonge au lieu de le recréer.
+# - Les appels à Google (création, prolongation, suppression) se font hors du verrou général : un seul appel
+#   à la fois par cache, sans bloquer les autres caches ni la lecture d'un cache valide.
+# - Si le cache ne peut pas être créé (clé sans accès, prompt trop court pour le modèle, quota...),
+#   on retourne None : l'appelant envoie alors le prompt complet, comme avant. On ne réessaie qu'après un délai.
+
+import os
+import time
+import hashlib
+import logging
+import datetime
+import threading
+
+from google.generativeai import caching
+
+logger = logging.getLogger(__name__)
+
+# Mettre GEMINI_CONTEXT_CACHE=0 pour désactiver complètement le cache de contexte.
+CACHE_ACTIF = os.getenv("GEMINI_CONTEXT_CACHE", "1") != "0"
+# Durée de vie demandée pour chaque cache (en minutes).
+TTL_CACHE_MINUTES = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_MINUTES", "60"))
+# On prolonge le cache quand il lui reste moins que cette marge (en secondes).
+MARGE_RENOUVELLEMENT_SECONDES = 5 * 60
+# Après un échec de création, on envoie le prompt complet pendant ce délai avant de réessayer (en secondes).
+DELAI_NOUVEL_ESSAI_SECONDES = 30 * 60
+
+# Caches actifs : {(modèle, tuple des noms d'outils): {'empreinte': str, 'cache': CachedContent, 'expiration': float}}
+_caches = {}
+# Clés pour lesquelles la création a échoué : {(modèle, tuple des noms d'outils, empreinte): date du prochain essai}
+_indisponibles = {}
+# Un verrou par clé, tenu pendant les appels à Google pour ce cache.
+_verrous_caches = {}
+_lock = threading.Lock()
+
+
+def empreinte_prompt(system_prompt: str) -> str:
+    """Empreinte SHA-256 du texte du prompt : elle change dès que le texte change."""
+    return hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()
+
+def _ttl() -> datetime.timedelta:
+    return datetime.timedelta(minutes=TTL_CACHE_MINUTES)
+
+def _supprimer(cache):
+    """Supprime un cache côté Google (sans bloquer si c'est déjà fait ou impossible)."""
+    try:
+        cache.delete()
+        logger.info(f"🗑️ CACHE GEMINI: Cache '{cache.name}' supprimé.")
+    except Exception as e:
+        logger.warning(f"⚠️ CACHE GEMINI: Suppression du cache '{cache.name}' impossible : {repr(e)}")
+
+def _creer(nom_modele: str, system_prompt: str, outils, empreinte: str):
+    """Crée un nouveau cache pour le prompt et les outils donnés."""
+    cache = caching.CachedContent.create(
+        model=f"models/{nom_modele}" if not nom_modele.startswith("models/") else nom_modele,
+        display_name=f"orga-{empreinte[:12]}",
+        system_instruction=system_prompt,
+        tools=outils,
+        ttl=_ttl(),
+    )
+    logger.info(f"✅ CACHE GEMINI: Cache '{cache.name}' créé pour {nom_modele} (TTL {TTL_CACHE_MINUTES} min).")
+    return cache
+
+def _cache_valide(cle: tuple, empreinte: str, maintenant: float):
+    """Cache utilisable tel quel (appelé sous le verrou), ou None s'il faut le créer, le prolonger ou le remplacer."""
+    entree = _caches.get(cle)
+    if entree and entree['empreinte'] == empreinte and entree['expiration'] - maintenant > MARGE_RENOUVELLEMENT_SECONDES:
+        return entree['cache']
+    return None
+
+def obtenir_cache(nom_modele: str, system_prompt: str, noms_outils: tuple, outils):
+    """
+    Retourne le cache de contexte à utiliser pour ce prompt et ces outils, ou None si le cache
+    est indisponible (l'appelant doit alors envoyer le prompt complet).
+    Crée, prolonge ou remplace le cache selon le besoin : peut appeler Google, donc à appeler hors
+    de la boucle d'événements.
+    """
+    if not CACHE_ACTIF or not system_prompt:
+        return None
+
+    empreinte = empreinte_prompt(system_prompt)
+    cle = (nom_modele, noms_outils)
+    with _lock:
+        if _indisponibles.get(cle + (empreinte,), 0) > time.time():
+            return None
+        cache = _cache_valide(cle, empreinte, time.time())
+        if cache:
+            return cache
+        verrou_cache = _verrous_caches.setdefault(cle, threading.Lock())
+
+    with verrou_cache:
+        # Un autre thread a pu créer ou prolonger le cache pendant l'attente.
+        with _lock:
+            maintenant = time.time()
+            if _indisponibles.get(cle + (empreinte,), 0) > maintenant:
+                return None
+            cache = _cache_valide(cle, empreinte, maintenant)
+            if cache:
+                return cache
+            entree = _caches.get(cle)
+            remplace = None
+            if entree and entree['expiration'] <= maintenant:
+                # Cache resté sans usage jusqu'à son expiration : Google l'a déjà supprimé.
+                del _caches[cle]
+                entree = None
+            elif entree and entree['empreinte'] != empreinte:
+                del _caches[cle]
+                remplace, entree = entree['cache'], None
+
+        if remplace:
+            # Le texte du prompt a changé : l'ancien cache ne sert plus à rien.
+            logger.info("🔄 CACHE GEMINI: Le prompt système a changé, remplacement du cache.")
+            _supprimer(remplace)
+
+        if entree:
+            # Le cache arrive à expiration : on prolonge sa durée de vie.
+            try:
+                entree['cache'].update(ttl=_ttl())
+                with _lock:
+                    entree['expiration'] = maintenant + _ttl().total_seconds()
+                logger.debug(f"⏳ CACHE GEMINI: Cache '{entree['cache'].name}' prolongé de {TTL_CACHE_MINUTES} min.")
+                return entree['cache']
+            except Exception as e:
+                logger.warning(f"⚠️ CACHE GEMINI: Prolongation impossible ({repr(e)}), création d'un nouveau cache.")
+                with _lock:
+                    if _caches.get(cle) is entree:
+                        del _caches[cle]
+
+        try:
+            cache = _creer(nom_modele, system_prompt, outils, empreinte)
+        except Exception as e:
+            logger.warning(
+                f"⚠️ CACHE GEMINI: Création du cache impossible ({repr(e)}). "
+                f"Envoi du prompt complet pendant {DELAI_NOUVEL_ESSAI_SECONDES // 60} min."
+            )
+            with _lock:
+                _indisponibles[cle + (empreinte,)] = maintenant + DELAI_NOUVEL_ESSAI_SECONDES
+            return None
+
+        with _lock:
+            _caches[cle] = {'empreinte': empreinte, 'cache': cache, 'expiration': maintenant + _ttl().total_seconds()}
+        return cache
+
+def invalider_cache(nom_cache: str):
+    """
+    Oublie un cache que Gemini a refusé (expiré ou supprimé de son côté).
+    Le prochain appel à obtenir_cache en recréera un.
+    """
+    with _lock:
+        for cle, entree in list(_caches.items()):
+            if entree['cache'].name == nom_cache:
+                del _caches[cle]
+                logger.info(f"🔄 CACHE GEMINI: Cache '{nom_cache}' invalidé.")
+
+def vider_caches():
+    """Supprime tous les caches créés par ce processus (à l'arrêt du bot)."""
+    maintenant = time.time()
+    with _lock:
+        # Les caches déjà expirés ont été supprimés par Google.
+        caches = [entree['cache'] for entree in _caches.values() if entree['expiration'] > maintenant]
+        _caches.clear()
+    for cache in caches:
+        _supprimer(cache)
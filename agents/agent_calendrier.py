@@ -2,10 +2,14 @@
 
 # Importations nécessaires pour la gestion des dates, du système de fichiers et de l'API Google
 import datetime
+import os
 import os.path
+import json
+import hashlib
 import logging
+import threading
+import httplib2
 import pytz # On importe pytz pour gérer les fuseaux horaires de manière robuste
-from dateutil import parser # On importe le parseur de date pour comparer les heures de fin
 
 # Importations spécifiques à l'authentification et à l'API Google
 from google.auth.transport.requests import Request
@@ -17,12 +21,85 @@ from googleapiclient.errors import HttpError
 # On importe les fonctions des autres agents dont on a besoin
 from .agent_taches import lister_taches
 from .agent_projets import lister_projets
+from .agent_memoire import lire_donnees_json, ecrire_donnees_json, incrementer_version
+from .agent_quota_calendrier import executer, CalendrierIndisponible
+from .agent_temps import maintenant_epoch, depuis_epoch, borne_evenement_epoch
 
 # Les "scopes" définissent les permissions que nous demandons.
 # Ici, nous demandons la permission de lire et écrire sur le calendrier.
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 logger = logging.getLogger(__name__)
 
+# --- Miroir local des événements ---
+# Le miroir garde une copie des événements de chaque calendrier, tenue à jour grâce au
+# mécanisme de synchronisation incrémentale de l'API (syncToken). En régime de croisière,
+# chaque synchronisation ne transfère que les événements modifiés depuis la précédente.
+NOM_FICHIER_MIROIR = 'miroir_calendrier.json'
+# Lors d'une synchronisation complète, on ne récupère que les événements récents (et futurs).
+JOURS_HISTORIQUE_MIROIR = 7
+# ... et jusqu'à cet horizon : sans borne, chaque événement récurrent donne toutes ses occurrences futures.
+JOURS_HORIZON_MIROIR = 90
+# Les synchronisations incrémentales ne renvoient que les changements : un événement resté au-delà de l'horizon
+# n'arriverait jamais. Quand il reste moins que cette marge avant l'horizon, on refait une synchronisation complète.
+JOURS_MARGE_HORIZON = 30
+
+# Calendriers système ignorés pour le suivi et les disponibilités (comparaison en minuscules).
+CALENDRIERS_IGNORES = ['numéros de semaine', 'jours fériés']
+
+# Structure : {calendar_id: {"sync_token": str, "evenements": {event_id: evenement}}}
+_miroir = None
+# Dernière liste de calendriers obtenue, servie si Google est momentanément indisponible.
+_derniers_calendriers = None
+# Nom du magasin de données "liste des calendriers" pour les numéros de version de agent_memoire.
+MAGASIN_CALENDRIERS = 'calendriers'
+# Idem pour les événements modifiés par le bot : le miroir ne le saura qu'à la prochaine synchronisation.
+MAGASIN_EVENEMENTS = 'evenements'
+_miroir_lock = threading.RLock()
+
+# --- Masques de réponse partielle ("fields=") ---
+# Par défaut, l'API renvoie les ressources complètes (participants, descriptions, visio, rappels...).
+# On ne demande que les champs réellement utilisés, appel par appel, pour réduire la taille des
+# réponses et le coût de décodage JSON. Une valeur None redemande la ressource complète.
+# Chaque masque peut être surchargé via la variable d'environnement CALENDAR_FIELDS_MASKS,
+# au format JSON : {"events.list": "items(id,summary),nextPageToken"}.
+CHAMPS_PAR_APPEL = {
+    "calendarList.list": "items(id,summary,primary,accessRole)",
+    "events.list": "items(id,status,summary,start,end,transparency),nextPageToken,nextSyncToken",
+    "events.get.modification": "id,summary,start,end",
+    "events.get.suppression": "id",
+    "events.insert": "id",
+    "events.patch": "id,summary",
+    "events.move": "id",
+    "events.watch": "resourceId,expiration",
+    "calendars.insert": "id",
+    "calendars.patch": "id,summary",
+}
+def _masques_personnalises() -> dict:
+    """Masques lus dans CALENDAR_FIELDS_MASKS ; une valeur mal formée est ignorée (masques par défaut)."""
+    try:
+        masques = json.loads(os.getenv("CALENDAR_FIELDS_MASKS", "{}"))
+    except ValueError as e:
+        logger.warning(f"⚠️ CALENDRIER: CALENDAR_FIELDS_MASKS n'est pas un JSON valide ({e}), masques par défaut utilisés.")
+        return {}
+    if not isinstance(masques, dict):
+        logger.warning("⚠️ CALENDRIER: CALENDAR_FIELDS_MASKS doit être un objet JSON {appel: masque}, masques par défaut utilisés.")
+        return {}
+    return masques
+
+CHAMPS_PAR_APPEL.update(_masques_personnalises())
+
+# --- Serveur cible ---
+# Par défaut, les appels partent vers Google. Pour travailler hors ligne (tests, mesures de performance),
+# on peut les diriger vers un autre serveur compatible, par exemple le faux serveur de agent_faux_calendrier :
+#   - CALENDAR_API_URL=http://127.0.0.1:8090/calendar/v3 pour un serveur déjà lancé,
+#   - CALENDAR_FAKE=1 (et éventuellement CALENDAR_FAKE_FIXTURE=fichier.json) pour en démarrer un dans le processus.
+URL_API_CALENDRIER = os.getenv("CALENDAR_API_URL")
+
+def _champs(appel: str) -> dict:
+    """Retourne le paramètre 'fields' à passer pour un appel donné (vide si aucun masque)."""
+    masque = CHAMPS_PAR_APPEL.get(appel)
+    return {'fields': masque} if masque else {}
+
 def _get_credentials():
     """Gère l'authentification et retourne les credentials valides."""
     creds = None
@@ -42,24 +119,362 @@ def _get_credentials():
             token.write(creds.to_json())
     return creds
 
+def url_api_calendrier() -> str:
+    """
+    Retourne l'adresse de l'API à utiliser à la place de Google (ou None pour la vraie API).
+    Si CALENDAR_FAKE est définie, un faux serveur Calendar est démarré dans le processus au premier appel.
+    """
+    global URL_API_CALENDRIER
+    if URL_API_CALENDRIER is None and os.getenv("CALENDAR_FAKE"):
+        from .agent_faux_calendrier import demarrer_faux_serveur
+        URL_API_CALENDRIER = demarrer_faux_serveur(os.getenv("CALENDAR_FAKE_FIXTURE")).url
+    return URL_API_CALENDRIER
+
+def utiliser_url_api(url: str = None):
+    """Redirige les deux clients (bloquant et asynchrone) vers une autre adresse ; None revient à Google."""
+    global URL_API_CALENDRIER
+    URL_API_CALENDRIER = url
+    logger.info(f"📅 CALENDRIER: Appels dirigés vers {url or 'Google Calendar'}.")
+
+def _construire_service():
+    """Construit le client googleapiclient, branché sur Google ou sur le serveur choisi par url_api_calendrier()."""
+    url = url_api_calendrier()
+    if url:
+        # Le faux serveur n'a pas besoin d'authentification
+        return build('calendar', 'v3', http=httplib2.Http(), client_options={'api_endpoint': url.rstrip('/') + '/'})
+    return build('calendar', 'v3', credentials=_get_credentials())
+
+def _charger_miroir() -> dict:
+    """Charge le miroir depuis le disque au premier accès, puis le garde en mémoire."""
+    global _miroir
+    if _miroir is None:
+        data = lire_donnees_json(NOM_FICHIER_MIROIR)
+        # On s'assure que c'est bien un dictionnaire (le fichier peut être absent ou vide)
+        _miroir = data if isinstance(data, dict) else {}
+        # Migration : les miroirs enregistrés avant la normalisation des dates n'ont pas d'horodatages epoch
+        for entree in _miroir.values():
+            for event_id, event in entree.get("evenements", {}).items():
+                if 'fin_epoch' not in event:
+                    entree["evenements"][event_id] = _projeter_evenement(event)
+    return _miroir
+
+def _sauvegarder_miroir():
+    """Sauvegarde le miroir sur le disque pour ne pas refaire une synchronisation complète au redémarrage."""
+    with _miroir_lock:
+        ecrire_donnees_json(NOM_FICHIER_MIROIR, _charger_miroir())
+
+def _projeter_evenement(event: dict) -> dict:
+    """
+    Ne garde que les champs de l'événement dont on se sert réellement.
+    Les heures de début et de fin sont analysées une seule fois ici et stockées en epoch UTC
+    ('debut_epoch', 'fin_epoch') : les tris et filtres du miroir se font sur ces entiers.
+    """
+    return {
+        "id": event['id'],
+        "summary": event.get('summary'),
+        "start": event.get('start', {}),
+        "end": event.get('end', {}),
+        "debut_epoch": borne_evenement_epoch(event.get('start', {})),
+        "fin_epoch": borne_evenement_epoch(event.get('end', {})),
+        # 'transparent' = l'événement n'occupe pas l'agenda (affiché "Disponible")
+        "transparency": event.get('transparency', 'opaque'),
+    }
+
+def _appliquer_changements(calendar_id: str, items: list, sync_token: str, complet: bool) -> list:
+    """
+    Applique au miroir une page de résultats de l'API (complète ou incrémentale).
+    Les événements annulés sont retirés, les autres sont ajoutés ou remplacés.
+    Retourne la liste des changements appliqués (les événements annulés gardent le statut 'cancelled').
+    """
+    maintenant = maintenant_epoch()
+    limite = maintenant - JOURS_HISTORIQUE_MIROIR * 86400
+    changements = []
+    with _miroir_lock:
+        miroir = _charger_miroir()
+        entree = miroir.setdefault(calendar_id, {"sync_token": None, "evenements": {}})
+        if complet:
+            entree["evenements"] = {}
+            entree["horizon_epoch"] = maintenant + JOURS_HORIZON_MIROIR * 86400
+        horizon = entree.get("horizon_epoch")
+        evenements = entree["evenements"]
+        for event in items:
+            if event.get('status') == 'cancelled':
+                ancien = evenements.pop(event['id'], None)
+                # On garde les heures de l'événement supprimé pour juger de sa pertinence
+                changements.append(dict(ancien or {"id": event['id']}, status='cancelled'))
+                continue
+            evenements[event['id']] = _projeter_evenement(event)
+            changements.append(evenements[event['id']])
+
+        # Une synchronisation incrémentale peut renvoyer des événements très anciens ou au-delà de l'horizon :
+        # on les élague pour que le miroir ne grossisse pas indéfiniment.
+        for event_id, event in list(evenements.items()):
+            fin, debut = event.get('fin_epoch'), event.get('debut_epoch')
+            if (fin is not None and fin < limite) or (horizon and debut is not None and debut > horizon):
+                del evenements[event_id]
+
+        entree["sync_token"] = sync_token
+    return changements
+
+def _jeton_synchronisation(calendar_id: str):
+    """
+    syncToken du calendrier, ou None s'il faut une synchronisation complète : jamais synchronisé,
+    ou horizon trop proche (miroirs enregistrés sans horizon compris).
+    """
+    with _miroir_lock:
+        entree = _charger_miroir().get(calendar_id, {})
+        horizon = entree.get("horizon_epoch")
+        if horizon is None or horizon - maintenant_epoch() < JOURS_MARGE_HORIZON * 86400:
+            return None
+        return entree.get("sync_token")
+
+def _bornes_synchronisation_complete() -> dict:
+    """Paramètres 'timeMin' et 'timeMax' d'une synchronisation complète."""
+    maintenant = datetime.datetime.now(pytz.utc)
+    return {
+        'timeMin': (maintenant - datetime.timedelta(days=JOURS_HISTORIQUE_MIROIR)).isoformat(),
+        'timeMax': (maintenant + datetime.timedelta(days=JOURS_HORIZON_MIROIR)).isoformat(),
+    }
+
+def _synchroniser_calendrier(service, calendar_id: str) -> list:
+    """
+    Met à jour le miroir d'un calendrier. Utilise le syncToken s'il existe (synchronisation
+    incrémentale), sinon fait une synchronisation complète. Si Google répond 410 (jeton expiré),
+    on repart d'une synchronisation complète.
+    Retourne la liste des événements modifiés.
+    """
+    sync_token = _jeton_synchronisation(calendar_id)
+
+    params = {'calendarId': calendar_id, 'singleEvents': True}
+    if sync_token:
+        params['syncToken'] = sync_token
+    else:
+        params.update(_bornes_synchronisation_complete())
+
+    items = []
+    page_token = None
+    try:
+        while True:
+            events_result = executer(service.events().list(pageToken=page_token, **params, **_champs("events.list")), "events.list")
+            items.extend(events_result.get('items', []))
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                break
+    except HttpError as e:
+        if e.resp.status == 410 and sync_token:
+            logger.warning(f"⚠️ CALENDRIER: Jeton de synchronisation expiré pour '{calendar_id}', resynchronisation complète.")
+            with _miroir_lock:
+                _charger_miroir().pop(calendar_id, None)
+            return _synchroniser_calendrier(service, calendar_id)
+        raise
+
+    logger.debug(f"📅 CALENDRIER: Synchronisation {'incrémentale' if sync_token else 'complète'} de '{calendar_id}' : {len(items)} événement(s) reçu(s).")
+    changements = _appliquer_changements(calendar_id, items, events_result.get('nextSyncToken'), complet=not sync_token)
+    if changements or not sync_token:
+        _sauvegarder_miroir()
+    return changements
+
+def synchroniser_miroir(service, calendriers: list) -> None:
+    """
+    Synchronise le miroir local pour la liste de calendriers donnée.
+    Un calendrier inaccessible est ignoré : on garde sa dernière copie connue.
+    """
+    for calendar in calendriers:
+        try:
+            _synchroniser_calendrier(service, calendar['id'])
+        except (HttpError, CalendrierIndisponible) as e:
+            # On garde la dernière copie connue : mieux vaut des données un peu anciennes qu'une erreur.
+            logger.warning(f"⚠️ CALENDRIER: Impossible de synchroniser le calendrier '{calendar.get('summary')}' (ID: {calendar['id']}), utilisation du miroir. Erreur: {e}")
+
+def synchroniser_calendrier(calendar_id: str) -> list:
+    """
+    Synchronisation ciblée d'un seul calendrier (utilisée par les notifications push).
+    Retourne la liste des événements modifiés depuis la dernière synchronisation.
+    """
+    service = _construire_service()
+    return _synchroniser_calendrier(service, calendar_id)
+
+def prochaine_fin_evenement() -> datetime.datetime:
+    """Retourne l'heure de fin du prochain événement à se terminer, d'après le miroir (ou None)."""
+    now = maintenant_epoch()
+    prochaine = None
+    with _miroir_lock:
+        for entree in _charger_miroir().values():
+            for event in entree.get("evenements", {}).values():
+                fin = event.get('fin_epoch')
+                if fin is not None and fin > now and (prochaine is None or fin < prochaine):
+                    prochaine = fin
+    return depuis_epoch(prochaine, 'UTC') if prochaine is not None else None
+
+def _evenements_du_miroir(calendriers: list) -> list:
+    """Retourne une copie des événements du miroir pour les calendriers donnés, annotés avec leur calendrier."""
+    evenements = []
+    with _miroir_lock:
+        miroir = _charger_miroir()
+        for calendar in calendriers:
+            for event in miroir.get(calendar['id'], {}).get("evenements", {}).values():
+                evenements.append(dict(event, calendar_id=calendar['id'], calendar_summary=calendar['summary']))
+    return evenements
+
+def _formater_calendriers(items: list) -> list:
+    """Ne garde que les champs utiles de chaque calendrier renvoyé par l'API."""
+    return [{
+        "id": calendar_item['id'],
+        "summary": calendar_item['summary'],
+        "primary": calendar_item.get('primary', False),
+        "access_role": calendar_item.get('accessRole') # owner, writer, reader
+    } for calendar_item in items]
+
+def _memoriser_calendriers(calendriers: list):
+    """Garde la dernière liste de calendriers obtenue ; si elle a changé, sa version augmente."""
+    global _derniers_calendriers
+    if calendriers != _derniers_calendriers:
+        incrementer_version(MAGASIN_CALENDRIERS)
+    _derniers_calendriers = calendriers
+
+def _calendriers_suivis(calendriers: list) -> list:
+    """Exclut les calendriers système (numéros de semaine, jours fériés...)."""
+    return [cal for cal in calendriers if cal.get('summary', '').lower() not in CALENDRIERS_IGNORES]
+
+def _selectionner_prochains_evenements(evenements: list, nombre_evenements: int) -> list:
+    """Garde les 'n' prochains événements (pas encore terminés), triés par date de début."""
+    now = maintenant_epoch()
+    # Comme avec 'timeMin' côté API : on garde les événements qui ne sont pas encore terminés
+    all_events = [event for event in evenements if event.get('fin_epoch') is not None and event['fin_epoch'] > now]
+
+    # Trier tous les événements de tous les calendriers par date de début
+    all_events.sort(key=lambda x: x.get('debut_epoch') or 0)
+    
+    # Formatter les 'n' prochains événements
+    formatted_events = []
+    for event in all_events[:nombre_evenements]:
+        start = event['start'].get('dateTime', event['start'].get('date'))
+        end = event['end'].get('dateTime', event['end'].get('date'))
+        formatted_events.append({
+            "id": event['id'],
+            "summary": event.get('summary') or "Sans titre",
+            "start": start,
+            "end": end,
+            "calendar": event['calendar_summary']
+        })
+    return formatted_events
+
+def _selectionner_evenements_passes(evenements: list, jours: int) -> list:
+    """
+    Garde les événements terminés depuis 'jours' jours, triés par date de début.
+    Le miroir ne garde que JOURS_HISTORIQUE_MIROIR jours d'historique : une période plus longue est ramenée à cette durée.
+    """
+    if jours > JOURS_HISTORIQUE_MIROIR:
+        logger.warning(f"⚠️ CALENDRIER: Événements passés demandés sur {jours} jours, limités aux {JOURS_HISTORIQUE_MIROIR} jours gardés par le miroir.")
+        jours = JOURS_HISTORIQUE_MIROIR
+    # Les heures du miroir sont des epochs UTC : la comparaison ne dépend d'aucun fuseau.
+    now = maintenant_epoch()
+    time_min = now - jours * 86400
+
+    # La condition clé : on ne garde l'événement que si son heure de fin est passée, dans la fenêtre demandée.
+    ended_events = [event for event in evenements if event.get('fin_epoch') is not None and time_min < event['fin_epoch'] < now]
+
+    # On trie les événements terminés par date de début
+    ended_events.sort(key=lambda x: x.get('debut_epoch') or 0)
+    
+    # On ne garde que les champs utiles
+    formatted_events = []
+    for event in ended_events:
+        # On vérifie que l'événement a bien un titre ('summary') avant de le traiter.
+        if event.get('summary'):
+            start = event['start'].get('dateTime', event['start'].get('date'))
+            end = event['end'].get('dateTime', event['end'].get('date'))
+            formatted_events.append({
+                "id": event['id'],
+                "summary": event['summary'],
+                "start": start,
+                "end": end,
+                "calendar_summary": event['calendar_summary'],
+                "calendar_id": event['calendar_id']
+            })
+    return formatted_events
+
+def _preparer_modifications(event_to_modify: dict, nouveau_titre: str = None, nouvelle_date_heure_debut: str = None, nouvelle_date_heure_fin: str = None) -> dict:
+    """
+    Construit le corps du 'patch' à envoyer pour modifier un événement.
+    On n'envoie que les champs modifiés : l'événement a été lu avec un masque de champs,
+    un 'update' complet effacerait tout ce qui n'a pas été relu (description, invités...).
+    """
+    modifications = {}
+    if nouveau_titre:
+        modifications['summary'] = nouveau_titre
+    
+    # On calcule la nouvelle date de fin AVANT de modifier l'événement
+    # si seule la date de début est fournie.
+    if nouvelle_date_heure_debut and not nouvelle_date_heure_fin:
+        try:
+            debut = datetime.datetime.fromisoformat(nouvelle_date_heure_debut.replace('Z', '+00:00'))
+            fin = debut + datetime.timedelta(hours=1)
+            nouvelle_date_heure_fin = fin.isoformat()
+            logger.info(f"💡 CALENDRIER: Heure de fin non fournie pour la modification. Fin recalculée pour durer 1h : {nouvelle_date_heure_fin}")
+        except ValueError:
+            pass # On laisse la logique existante échouer si le format est invalide
+
+    if nouvelle_date_heure_debut:
+        modifications['start'] = {'dateTime': nouvelle_date_heure_debut, 'timeZone': 'Europe/Paris'}
+
+    if nouvelle_date_heure_fin:
+        nouvelle_fin = dict(event_to_modify['end'])
+        if 'dateTime' in nouvelle_fin:
+            nouvelle_fin['dateTime'] = nouvelle_date_heure_fin
+        else:
+            nouvelle_fin['date'] = nouvelle_date_heure_fin
+        modifications['end'] = nouvelle_fin
+    return modifications
+
+def lire_evenements_miroir(calendriers: list = None) -> list:
+    """
+    Synchronise puis retourne les événements bruts du miroir (avec 'calendar_id' et 'calendar_summary').
+    Par défaut, couvre tous les calendriers sauf les calendriers système ignorés.
+    """
+    if calendriers is None:
+        calendriers = _calendriers_suivis(c for c in lister_tous_les_calendriers() if 'erreur' not in c)
+    service = _construire_service()
+    synchroniser_miroir(service, calendriers)
+    return _evenements_du_miroir(calendriers)
+
+def horizon_miroir(calendriers: list = None):
+    """
+    Date (epoch) jusqu'à laquelle le miroir connaît tous les événements des calendriers donnés
+    (par défaut, les calendriers suivis) : le plus proche de leurs horizons, ou None s'il est inconnu.
+    """
+    if calendriers is None:
+        calendriers = _calendriers_suivis(_derniers_calendriers or [])
+    with _miroir_lock:
+        miroir = _charger_miroir()
+        horizons = [miroir[c['id']].get("horizon_epoch") for c in calendriers if c['id'] in miroir]
+    horizons = [h for h in horizons if h is not None]
+    return min(horizons) if horizons else None
+
+def prochains_evenements_miroir(nombre_evenements: int) -> list:
+    """
+    Les 'n' prochains événements de tous les calendriers, lus dans le miroir SANS synchronisation
+    (le superviseur et les notifications push le tiennent à jour). Seule la liste des calendriers
+    est demandée à Google si elle n'a encore jamais été obtenue.
+    """
+    calendriers = _derniers_calendriers
+    if calendriers is None:
+        calendriers = [c for c in lister_tous_les_calendriers() if 'erreur' not in c]
+    return _selectionner_prochains_evenements(_evenements_du_miroir(calendriers), nombre_evenements)
+
 def lister_tous_les_calendriers() -> list:
     """Récupère la liste de tous les calendriers de l'utilisateur avec leur niveau d'accès."""
     logger.info("📅 CALENDRIER: Récupération de la liste de tous les calendriers et des permissions.")
     try:
-        creds = _get_credentials()
-        service = build('calendar', 'v3', credentials=creds)
-        calendar_list = service.calendarList().list().execute()
-        
-        formatted_list = []
-        for calendar_item in calendar_list.get('items', []):
-            formatted_list.append({
-                "id": calendar_item['id'],
-                "summary": calendar_item['summary'],
-                "primary": calendar_item.get('primary', False),
-                "access_role": calendar_item.get('accessRole') # owner, writer, reader
-            })
+        service = _construire_service()
+        calendar_list = executer(service.calendarList().list(**_champs("calendarList.list")), "calendarList.list")
+        formatted_list = _formater_calendriers(calendar_list.get('items', []))
+        _memoriser_calendriers(formatted_list)
         return formatted_list
     except Exception as e:
+        if _derniers_calendriers is not None and isinstance(e, (HttpError, CalendrierIndisponible)):
+            logger.warning(f"⚠️ CALENDRIER: Liste des calendriers indisponible, utilisation de la dernière liste connue. Erreur: {e}")
+            return list(_derniers_calendriers)
         logger.error(f"🔥 CALENDRIER: Erreur lors de la récupération de la liste des calendriers: {e}")
         return [{"erreur": str(e)}]
 
@@ -67,6 +482,7 @@ def lister_prochains_evenements(nombre_evenements: int = 10, nom_calendrier: str
     """
     Liste les 'n' prochains événements. Si nom_calendrier est spécifié,
     cherche dans ce calendrier. Sinon, cherche dans tous les calendriers.
+    Les événements sont lus depuis le miroir local, synchronisé au préalable.
     """
     log_msg = f"📅 CALENDRIER: Récupération des {nombre_evenements} prochains événements"
     if nom_calendrier:
@@ -75,51 +491,21 @@ def lister_prochains_evenements(nombre_evenements: int = 10, nom_calendrier: str
         log_msg += " dans tous les calendriers."
     logger.info(log_msg)
     try:
-        creds = _get_credentials()
-        service = build('calendar', 'v3', credentials=creds)
-        now = datetime.datetime.utcnow().isoformat() + 'Z'
-        
-        calendar_ids_to_check = []
+        service = _construire_service()
+
+        all_calendars = lister_tous_les_calendriers()
         if nom_calendrier:
-            all_calendars = lister_tous_les_calendriers()
             target_calendar = next((c for c in all_calendars if nom_calendrier.lower() in c['summary'].lower()), None)
             if not target_calendar:
                 return [{"erreur": f"Calendrier '{nom_calendrier}' non trouvé."}]
-            calendar_ids_to_check.append(target_calendar['id'])
+            calendars_to_check = [target_calendar]
         else:
             # Si aucun nom n'est donné, on scanne tout
-            all_calendars = lister_tous_les_calendriers()
-            calendar_ids_to_check = [c['id'] for c in all_calendars]
-
-        all_events = []
-        for calendar_id in calendar_ids_to_check:
-            events_result = service.events().list(
-                calendarId=calendar_id, timeMin=now,
-                maxResults=nombre_evenements, singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            events = events_result.get('items', [])
-            for event in events:
-                event['calendar_summary'] = next((c['summary'] for c in all_calendars if c['id'] == calendar_id), 'Inconnu')
-            all_events.extend(events)
-
-        # Trier tous les événements de tous les calendriers par date de début
-        all_events.sort(key=lambda x: x['start'].get('dateTime', x['start'].get('date')))
-        
-        # Formatter les 'n' prochains événements
-        formatted_events = []
-        for event in all_events[:nombre_evenements]:
-            start = event['start'].get('dateTime', event['start'].get('date'))
-            # CORRECTION : On ajoute l'heure de fin !
-            end = event['end'].get('dateTime', event['end'].get('date'))
-            formatted_events.append({
-                "id": event['id'],
-                "summary": event['summary'],
-                "start": start,
-                "end": end, # Champ ajouté
-                "calendar": event['calendar_summary']
-            })
-        return formatted_events
+            calendars_to_check = all_calendars
+
+        # On ne transfère que les changements depuis la dernière synchronisation
+        synchroniser_miroir(service, calendars_to_check)
+        return _selectionner_prochains_evenements(_evenements_du_miroir(calendars_to_check), nombre_evenements)
 
     except Exception as e:
         logger.error(f"🔥 CALENDRIER: Erreur lors de la récupération des événements: {e}")
@@ -130,112 +516,45 @@ def lister_evenements_passes(jours: int = 1) -> list:
     Liste les événements terminés depuis le nombre de jours spécifié.
     Par défaut, cherche les événements des dernières 24 heures.
     Ignore certains calendriers système (ex: "Numéros de semaine").
+    Les événements sont lus depuis le miroir local, synchronisé au préalable.
     """
     log_msg = f"📅 CALENDRIER: Récupération des événements terminés depuis {jours} jour(s)."
     logger.info(log_msg)
     try:
-        creds = _get_credentials()
-        service = build('calendar', 'v3', credentials=creds)
-        
-        # CORRECTION : On utilise une heure "aware" (consciente de son fuseau horaire) 
-        # pour éviter toute ambiguïté lors de la comparaison avec les heures des événements.
-        now = datetime.datetime.now(pytz.utc) 
-        time_min = now - datetime.timedelta(days=jours)
-        
-        # Le formatage ISO gère maintenant correctement le fuseau horaire.
-        time_min_iso = time_min.isoformat()
-        now_iso = now.isoformat()
+        service = _construire_service()
         
-        # On définit ici une liste de noms de calendriers à ignorer.
-        # On utilise des minuscules pour une comparaison insensible à la casse.
-        CALENDARS_TO_IGNORE = ['numéros de semaine', 'jours fériés']
-
-        all_calendars = lister_tous_les_calendriers()
-
         # On filtre la liste des calendriers pour exclure ceux que l'on veut ignorer.
-        calendars_a_verifier = [
-            cal for cal in all_calendars
-            if cal.get('summary', '').lower() not in CALENDARS_TO_IGNORE
-        ]
+        calendars_a_verifier = _calendriers_suivis(lister_tous_les_calendriers())
         logger.debug(f"Calendriers à vérifier (après filtrage): {[c['summary'] for c in calendars_a_verifier]}")
 
-
-        all_events = []
-        # On boucle sur les objets calendrier pour avoir accès à leur ID et leur nom
-        for calendar in calendars_a_verifier:
-            calendar_id = calendar['id']
-            calendar_summary = calendar['summary']
-
-            try:
-                events_result = service.events().list(
-                    calendarId=calendar_id, 
-                    timeMin=time_min_iso,
-                    timeMax=now_iso,
-                    singleEvents=True,
-                    orderBy='startTime'
-                ).execute()
-                events = events_result.get('items', [])
-                for event in events:
-                    # On ajoute directement les informations du calendrier à l'événement
-                    event['calendar_id'] = calendar_id
-                    event['calendar_summary'] = calendar_summary
-                all_events.extend(events)
-            except HttpError as e:
-                # Si on n'a pas accès à un calendrier (très rare), on logue et on continue
-                logger.warning(f"⚠️ CALENDRIER: Impossible d'accéder au calendrier '{calendar_summary}' (ID: {calendar_id}). Erreur: {e}")
-                continue
-
-        # CORRECTION MAJEURE : On filtre maintenant les événements pour ne garder que ceux dont l'heure de fin est passée.
-        ended_events = []
-        for event in all_events:
-            try:
-                # On récupère l'heure de fin, qu'elle soit pour un événement d'une journée ou un événement horodaté
-                end_time_str = event.get('end', {}).get('dateTime', event.get('end', {}).get('date'))
-                if not end_time_str:
-                    continue
-
-                # On convertit l'heure de fin en objet datetime "aware" pour une comparaison fiable
-                end_time_dt = parser.isoparse(end_time_str)
-                if end_time_dt.tzinfo is None:
-                    end_time_dt = pytz.utc.localize(end_time_dt)
-
-                # La condition clé : on ne garde l'événement que si son heure de fin est passée
-                if end_time_dt < now:
-                    ended_events.append(event)
-            except Exception as e:
-                logger.error(f"🔥 CALENDRIER: Impossible de traiter l'heure de fin pour l'événement '{event.get('summary')}'. Erreur: {e}")
-                continue
-                
-        # On trie les événements terminés par date de début
-        ended_events.sort(key=lambda x: x['start'].get('dateTime', x['start'].get('date')))
-        
-        # On ne garde que les champs utiles
-        formatted_events = []
-        for event in ended_events:
-            # On vérifie que l'événement a bien un titre ('summary') avant de le traiter.
-            if 'summary' in event:
-                start = event['start'].get('dateTime', event['start'].get('date'))
-                end = event['end'].get('dateTime', event['end'].get('date'))
-                # On utilise maintenant les informations du calendrier qu'on a ajoutées.
-                formatted_events.append({
-                    "id": event['id'],
-                    "summary": event['summary'],
-                    "start": start,
-                    "end": end,
-                    "calendar_summary": event['calendar_summary'],
-                    "calendar_id": event['calendar_id']
-                })
-        return formatted_events
+        synchroniser_miroir(service, calendars_a_verifier)
+        return _selectionner_evenements_passes(_evenements_du_miroir(calendars_a_verifier), jours)
 
     except Exception as e:
         logger.error(f"🔥 CALENDRIER: Erreur lors de la récupération des événements passés: {e}", exc_info=True)
         return [{"erreur": str(e)}]
 
 
-def creer_evenement_calendrier(titre: str, date_heure_debut: str, date_heure_fin: str, nom_calendrier_cible: str = None) -> dict:
+def identifiant_evenement(cle: str) -> str:
+    """
+    Identifiant d'événement déterminé à partir d'une clé d'idempotence. Google accepte les identifiants
+    choisis par le client (5 à 1024 caractères parmi a-v et 0-9) et refuse (409) d'en créer un second :
+    un appel répété, ou un réessai après un délai dépassé, ne crée pas de doublon.
+    """
+    return hashlib.sha256(cle.encode('utf-8')).hexdigest()
+
+def _evenement_deja_cree(titre: str, event_id: str) -> dict:
+    """Réponse à une création refusée (409) parce que l'événement existe déjà : c'est le résultat attendu."""
+    logger.info("♻️ CALENDRIER: L'événement '%s' (ID: %s) existe déjà, création non répétée.", titre, event_id)
+    incrementer_version(MAGASIN_EVENEMENTS)
+    return {"succes": f"Événement '{titre}' créé.", "event_id": event_id}
+
+def creer_evenement_calendrier(titre: str, date_heure_debut: str, date_heure_fin: str, nom_calendrier_cible: str = None, event_id: str = None) -> dict:
     """
     Crée un événement. L'heure de début et de fin DOIVENT être fournies.
     La logique de choix du calendrier est maintenant entièrement gérée par l'IA.
+    'event_id' (optionnel, non exposé à l'IA) : identifiant choisi par le bot (voir identifiant_evenement).
+    Si un événement porte déjà cet identifiant, la création a déjà eu lieu : on le signale comme un succès.
     """
     logger.info("📅 CALENDRIER: Tentative de création de l'événement '%s' de %s à %s.", titre, date_heure_debut, date_heure_fin)
 
@@ -243,8 +562,7 @@ def creer_evenement_calendrier(titre: str, date_heure_debut: str, date_heure_fin
     # L'IA est maintenant responsable de fournir une date de fin.
 
     try:
-        creds = _get_credentials()
-        service = build('calendar', 'v3', credentials=creds)
+        service = _construire_service()
         
         calendar_id = 'primary'  # Par défaut
         if nom_calendrier_cible:
@@ -262,11 +580,20 @@ def creer_evenement_calendrier(titre: str, date_heure_debut: str, date_heure_fin
             'start': {'dateTime': date_heure_debut, 'timeZone': 'Europe/Paris'},
             'end': {'dateTime': date_heure_fin, 'timeZone': 'Europe/Paris'},
         }
+        if event_id:
+            event['id'] = event_id
         
-        created_event = service.events().insert(calendarId=calendar_id, body=event).execute()
+        # Sans identifiant choisi par le bot, un nouvel essai après une coupure pourrait créer un doublon.
+        created_event = executer(service.events().insert(calendarId=calendar_id, body=event, **_champs("events.insert")), "events.insert", idempotent=bool(event_id))
         logger.info("✅ CALENDRIER: Événement '%s' créé avec succès (ID: %s).", titre, created_event.get('id'))
+        incrementer_version(MAGASIN_EVENEMENTS)
         # On retourne non seulement un succès, mais aussi l'ID de l'événement créé
         return {"succes": f"Événement '{titre}' créé.", "event_id": created_event.get('id')}
+    except HttpError as e:
+        if event_id and e.resp.status == 409:
+            return _evenement_deja_cree(titre, event_id)
+        logger.error(f"🔥 CALENDRIER: Erreur lors de la création de l'événement: {e}")
+        return {"erreur": str(e)}
     except Exception as e:
         logger.error(f"🔥 CALENDRIER: Erreur lors de la création de l'événement: {e}")
         return {"erreur": str(e)}
@@ -281,8 +608,7 @@ def modifier_evenement_calendrier(event_id: str, nouveau_titre: str = None, nouv
     logger.info(log_message)
 
     try:
-        creds = _get_credentials()
-        service = build('calendar', 'v3', credentials=creds)
+        service = _construire_service()
         
         all_calendars = lister_tous_les_calendriers()
         
@@ -292,7 +618,7 @@ def modifier_evenement_calendrier(event_id: str, nouveau_titre: str = None, nouv
         # Étape 1: Trouver l'événement dans N'IMPORTE QUEL calendrier
         for calendar in all_calendars:
             try:
-                event = service.events().get(calendarId=calendar['id'], eventId=event_id).execute()
+                event = executer(service.events().get(calendarId=calendar['id'], eventId=event_id, **_champs("events.get.modification")), "events.get")
                 if event:
                     source_calendar = calendar
                     event_to_modify = event
@@ -333,54 +659,32 @@ def modifier_evenement_calendrier(event_id: str, nouveau_titre: str = None, nouv
 
             if source_calendar_id != destination_calendar_id:
                 logger.info(f"Déplacement de l'événement de '{source_calendar_id}' vers '{destination_calendar_id}'.")
-                service.events().move(
+                executer(service.events().move(
                     calendarId=source_calendar_id,
                     eventId=event_id,
-                    destination=destination_calendar_id
-                ).execute()
+                    destination=destination_calendar_id,
+                    **_champs("events.move")
+                ), "events.move", idempotent=False)
                 source_calendar_id = destination_calendar_id
             else:
                 logger.info("L'événement est déjà dans le bon calendrier. Pas de déplacement nécessaire.")
 
-        # Étape 4: Mettre à jour les autres détails de l'événement
-        modification_effectuee = False
-        if nouveau_titre:
-            event_to_modify['summary'] = nouveau_titre
-            modification_effectuee = True
-        
-        # On calcule la nouvelle date de fin AVANT de modifier l'événement
-        # si seule la date de début est fournie.
-        if nouvelle_date_heure_debut and not nouvelle_date_heure_fin:
-            try:
-                debut = datetime.datetime.fromisoformat(nouvelle_date_heure_debut.replace('Z', '+00:00'))
-                fin = debut + datetime.timedelta(hours=1)
-                nouvelle_date_heure_fin = fin.isoformat()
-                logger.info(f"💡 CALENDRIER: Heure de fin non fournie pour la modification. Fin recalculée pour durer 1h : {nouvelle_date_heure_fin}")
-            except ValueError:
-                pass # On laisse la logique existante échouer si le format est invalide
-
-        if nouvelle_date_heure_debut:
-            event_to_modify['start'] = {'dateTime': nouvelle_date_heure_debut, 'timeZone': 'Europe/Paris'}
-            modification_effectuee = True
-
-        if nouvelle_date_heure_fin:
-            if 'dateTime' in event_to_modify['end']:
-                event_to_modify['end']['dateTime'] = nouvelle_date_heure_fin
-            else:
-                event_to_modify['end']['date'] = nouvelle_date_heure_fin
-            modification_effectuee = True
-        
-        if modification_effectuee:
+        # Étape 4: Mettre à jour les autres détails de l'événement.
+        modifications = _preparer_modifications(event_to_modify, nouveau_titre, nouvelle_date_heure_debut, nouvelle_date_heure_fin)
+        if modifications:
             logger.info("Application des modifications de métadonnées (titre, date)...")
-            updated_event = service.events().update(
+            updated_event = executer(service.events().patch(
                 calendarId=source_calendar_id,
                 eventId=event_id,
-                body=event_to_modify
-            ).execute()
+                body=modifications,
+                **_champs("events.patch")
+            ), "events.patch")
             logger.info("✅ CALENDRIER: Événement ID '%s' entièrement mis à jour.", event_id)
+            incrementer_version(MAGASIN_EVENEMENTS)
             return {"succes": f"L'événement '{updated_event['summary']}' a été mis à jour avec succès."}
 
         if nouveau_nom_calendrier:
+             incrementer_version(MAGASIN_EVENEMENTS)
              return {"succes": f"L'événement a été déplacé avec succès vers le calendrier '{nouveau_nom_calendrier}'."}
 
         return {"info": "Aucune modification demandée sur l'événement."}
@@ -393,8 +697,7 @@ def supprimer_evenement_calendrier(event_id: str) -> dict:
     """Supprime un événement en se basant sur son ID, en le cherchant uniquement dans les calendriers modifiables."""
     logger.info("📅 CALENDRIER: Tentative de suppression de l'événement ID '%s' sur les calendriers modifiables.", event_id)
     try:
-        creds = _get_credentials()
-        service = build('calendar', 'v3', credentials=creds)
+        service = _construire_service()
 
         # On ne prend que les calendriers où on a les droits d'écriture.
         all_calendars = lister_tous_les_calendriers()
@@ -407,13 +710,18 @@ def supprimer_evenement_calendrier(event_id: str) -> dict:
         for calendar in writable_calendars:
             try:
                 # On s'assure que l'événement est bien dans ce calendrier avant de supprimer
-                service.events().get(calendarId=calendar['id'], eventId=event_id).execute()
-                service.events().delete(calendarId=calendar['id'], eventId=event_id).execute()
-                logger.info("✅ CALENDRIER: Événement ID '%s' supprimé avec succès du calendrier '%s'.", event_id, calendar['summary'])
-                return {"succes": "L'événement a été supprimé avec succès."}
+                executer(service.events().get(calendarId=calendar['id'], eventId=event_id, **_champs("events.get.suppression")), "events.get")
+            except HttpError:
+                continue  # L'événement n'est pas dans ce calendrier (404), on passe au suivant.
+            try:
+                executer(service.events().delete(calendarId=calendar['id'], eventId=event_id), "events.delete")
             except HttpError as e:
-                if e.resp.status == 404:
-                    continue  # L'événement n'est pas dans ce calendrier, on passe au suivant.
+                # L'événement vient d'être trouvé : un 404/410 ici veut dire qu'une tentative précédente l'a déjà supprimé.
+                if e.resp.status not in (404, 410):
+                    raise
+            logger.info("✅ CALENDRIER: Événement ID '%s' supprimé avec succès du calendrier '%s'.", event_id, calendar['summary'])
+            incrementer_version(MAGASIN_EVENEMENTS)
+            return {"succes": "L'événement a été supprimé avec succès."}
         
         logger.error("🔥 CALENDRIER: Impossible de supprimer, événement introuvable (ID: %s) dans les calendriers modifiables.", event_id)
         return {"erreur": "Événement non trouvé dans vos calendriers modifiables."}
@@ -428,8 +736,7 @@ def creer_calendrier(nom_calendrier: str) -> dict:
     """Crée un nouveau calendrier avec le nom spécifié."""
     logger.info(f"📅 CALENDRIER: Tentative de création du calendrier '{nom_calendrier}'.")
     try:
-        creds = _get_credentials()
-        service = build('calendar', 'v3', credentials=creds)
+        service = _construire_service()
 
         # Vérifier si un calendrier avec le même nom existe déjà pour éviter les doublons
         all_calendars = lister_tous_les_calendriers()
@@ -442,7 +749,9 @@ def creer_calendrier(nom_calendrier: str) -> dict:
             'summary': nom_calendrier,
             'timeZone': 'Europe/Paris'
         }
-        created_calendar = service.calendars().insert(body=calendar_body).execute()
+        # Google n'accepte pas d'identifiant choisi par le client pour un calendrier : pas de nouvel essai après une coupure.
+        created_calendar = executer(service.calendars().insert(body=calendar_body, **_champs("calendars.insert")), "calendars.insert", idempotent=False)
+        incrementer_version(MAGASIN_CALENDRIERS)
         
         logger.info(f"✅ CALENDRIER: Calendrier '{nom_calendrier}' créé avec succès (ID: {created_calendar['id']}).")
         return {"succes": f"Le calendrier '{nom_calendrier}' a été créé."}
@@ -454,8 +763,7 @@ def renommer_calendrier(nom_actuel: str, nouveau_nom: str) -> dict:
     """Renomme un calendrier existant."""
     logger.info(f"📅 CALENDRIER: Tentative de renommage du calendrier '{nom_actuel}' en '{nouveau_nom}'.")
     try:
-        creds = _get_credentials()
-        service = build('calendar', 'v3', credentials=creds)
+        service = _construire_service()
 
         all_calendars = lister_tous_les_calendriers()
         calendar_to_rename = next((c for c in all_calendars if c['summary'].lower() == nom_actuel.lower()), None)
@@ -469,7 +777,8 @@ def renommer_calendrier(nom_actuel: str, nouveau_nom: str) -> dict:
             return {"erreur": f"Vous n'avez pas les droits pour renommer le calendrier '{nom_actuel}'."}
 
         body = {'summary': nouveau_nom}
-        updated_calendar = service.calendars().patch(calendarId=calendar_to_rename['id'], body=body).execute()
+        updated_calendar = executer(service.calendars().patch(calendarId=calendar_to_rename['id'], body=body, **_champs("calendars.patch")), "calendars.patch")
+        incrementer_version(MAGASIN_CALENDRIERS)
         
         logger.info(f"✅ CALENDRIER: Calendrier '{nom_actuel}' renommé en '{nouveau_nom}'.")
         return {"succes": f"Le calendrier '{nom_actuel}' a été renommé en '{nouveau_nom}'."}
@@ -481,8 +790,7 @@ def supprimer_calendrier(nom_calendrier: str) -> dict:
     """Supprime un calendrier existant."""
     logger.info(f"📅 CALENDRIER: Tentative de suppression du calendrier '{nom_calendrier}'.")
     try:
-        creds = _get_credentials()
-        service = build('calendar', 'v3', credentials=creds)
+        service = _construire_service()
 
         all_calendars = lister_tous_les_calendriers()
         calendar_to_delete = next((c for c in all_calendars if c['summary'].lower() == nom_calendrier.lower()), None)
@@ -498,7 +806,13 @@ def supprimer_calendrier(nom_calendrier: str) -> dict:
         if calendar_to_delete.get('access_role') not in ['owner']:
             return {"erreur": f"Vous n'avez pas les droits pour supprimer le calendrier '{nom_calendrier}'. Il faut en être le propriétaire."}
 
-        service.calendars().delete(calendarId=calendar_to_delete['id']).execute()
+        try:
+            executer(service.calendars().delete(calendarId=calendar_to_delete['id']), "calendars.delete")
+        except HttpError as e:
+            # Déjà supprimé par une tentative précédente.
+            if e.resp.status not in (404, 410):
+                raise
+        incrementer_version(MAGASIN_CALENDRIERS)
         
         logger.info(f"✅ CALENDRIER: Le calendrier '{nom_calendrier}' a été supprimé.")
         return {"succes": f"Le calendrier '{nom_calendrier}' a été supprimé avec succès."}
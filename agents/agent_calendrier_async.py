@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+
+# Client asynchrone pour l'API Google Calendar, basé sur aiohttp.
+# Le client googleapiclient est bloquant : chaque appel immobilise un thread le temps de l'aller-retour
+# réseau. Ici, les appels sont de simples requêtes HTTP non bloquantes : le superviseur et le routeur
+# peuvent les attendre directement depuis la boucle d'événements et en lancer plusieurs à la fois
+# (synchronisation de tous les calendriers, recherche d'un événement dans tous les calendriers...).
+#
+# Ce module réutilise tout le reste de agent_calendrier : mêmes identifiants, même miroir local,
+# mêmes masques de champs, et le même limiteur de débit / disjoncteur (via executer_async).
+
+import json
+import asyncio
+import logging
+from urllib.parse import quote
+
+import aiohttp
+import httplib2
+from google.auth.transport.requests import Request
+from googleapiclient.errors import HttpError
+
+from . import agent_calendrier
+from .agent_calendrier import (
+    CHAMPS_PAR_APPEL, _miroir_lock, _charger_miroir, _sauvegarder_miroir, _jeton_synchronisation, _bornes_synchronisation_complete,
+    _get_credentials, _appliquer_changements, _evenements_du_miroir, _formater_calendriers,
+    _calendriers_suivis, _selectionner_prochains_evenements, _selectionner_evenements_passes,
+    _preparer_modifications, _evenement_deja_cree, MAGASIN_EVENEMENTS,
+)
+from .agent_memoire import incrementer_version
+from .agent_quota_calendrier import executer_async, CalendrierIndisponible
+
+logger = logging.getLogger(__name__)
+
+# Adresse de l'API Google ; agent_calendrier.url_api_calendrier() permet de la remplacer (faux serveur).
+URL_API = "https://www.googleapis.com/calendar/v3"
+# Délai maximal d'un appel (connexion + réponse), en secondes.
+DELAI_REQUETE_SECONDES = 30
+
+_session = None
+_creds = None
+_creds_lock = asyncio.Lock()
+
+
+async def _obtenir_session() -> aiohttp.ClientSession:
+    """Crée la session HTTP au premier appel ; elle est ensuite partagée (connexions réutilisées)."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=DELAI_REQUETE_SECONDES))
+    return _session
+
+async def fermer_session():
+    """Ferme la session HTTP (à l'arrêt du bot)."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+async def _obtenir_jeton() -> str:
+    """
+    Retourne un jeton d'accès valide. Les identifiants sont ceux de agent_calendrier (token.json) ;
+    leur chargement et leur rafraîchissement, bloquants, se font dans un thread.
+    """
+    global _creds
+    if agent_calendrier.url_api_calendrier():
+        return "faux-jeton"  # Serveur de test : pas d'authentification
+    async with _creds_lock:
+        if _creds is None:
+            _creds = await asyncio.to_thread(_get_credentials)
+        elif not _creds.valid:
+            logger.info("📅 CALENDRIER (async): Rafraîchissement du jeton d'accès Google...")
+            await asyncio.to_thread(_creds.refresh, Request())
+        return _creds.token
+
+def _erreur_http(statut: int, entetes, contenu: bytes, url: str) -> HttpError:
+    """Construit une HttpError identique à celle de googleapiclient, pour garder les mêmes traitements d'erreur."""
+    infos = {'status': statut}
+    if entetes.get('Retry-After'):
+        infos['retry-after'] = entetes['Retry-After']
+    return HttpError(httplib2.Response(infos), contenu, uri=url)
+
+async def _requete(methode: str, chemin: str, appel: str, params: dict = None, corps: dict = None, masque: str = None, idempotent: bool = True):
+    """
+    Envoie une requête à l'API (avec limiteur, disjoncteur et réessais) et retourne la réponse JSON.
+    'masque' désigne l'entrée de CHAMPS_PAR_APPEL à utiliser (par défaut, 'appel').
+    'idempotent' : voir agent_quota_calendrier.executer.
+    """
+    params = {k: str(v).lower() if isinstance(v, bool) else v for k, v in (params or {}).items() if v is not None}
+    champs = CHAMPS_PAR_APPEL.get(masque or appel)
+    if champs:
+        params['fields'] = champs
+    url = (agent_calendrier.url_api_calendrier() or URL_API).rstrip('/') + chemin
+
+    async def envoyer():
+        entetes = {'Authorization': f"Bearer {await _obtenir_jeton()}"}
+        session = await _obtenir_session()
+        try:
+            async with session.request(methode, url, params=params, json=corps, headers=entetes) as reponse:
+                contenu = await reponse.read()
+                if reponse.status >= 400:
+                    raise _erreur_http(reponse.status, reponse.headers, contenu, str(reponse.url))
+                return json.loads(contenu) if contenu else {}
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            # Même famille d'erreurs réseau que le client bloquant : elles seront réessayées.
+            raise ConnectionError(f"{appel}: {e!r}") from e
+
+    return await executer_async(envoyer, appel, idempotent)
+
+def _chemin_evenement(calendar_id: str, event_id: str = None) -> str:
+    chemin = f"/calendars/{quote(calendar_id, safe='')}/events"
+    return chemin + f"/{quote(event_id, safe='')}" if event_id else chemin
+
+# --- Synchronisation du miroir ---
+
+async def _synchroniser_calendrier_async(calendar_id: str) -> list:
+    """Équivalent asynchrone de agent_calendrier._synchroniser_calendrier (même miroir, même gestion du 410)."""
+    sync_token = _jeton_synchronisation(calendar_id)
+
+    params = {'singleEvents': True}
+    if sync_token:
+        params['syncToken'] = sync_token
+    else:
+        params.update(_bornes_synchronisation_complete())
+
+    items = []
+    page_token = None
+    try:
+        while True:
+            events_result = await _requete('GET', _chemin_evenement(calendar_id), "events.list", dict(params, pageToken=page_token))
+            items.extend(events_result.get('items', []))
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                break
+    except HttpError as e:
+        if e.resp.status == 410 and sync_token:
+            logger.warning(f"⚠️ CALENDRIER (async): Jeton de synchronisation expiré pour '{calendar_id}', resynchronisation complète.")
+            with _miroir_lock:
+                _charger_miroir().pop(calendar_id, None)
+            return await _synchroniser_calendrier_async(calendar_id)
+        raise
+
+    logger.debug(f"📅 CALENDRIER (async): Synchronisation {'incrémentale' if sync_token else 'complète'} de '{calendar_id}' : {len(items)} événement(s) reçu(s).")
+    changements = _appliquer_changements(calendar_id, items, events_result.get('nextSyncToken'), complet=not sync_token)
+    if changements or not sync_token:
+        await asyncio.to_thread(_sauvegarder_miroir)
+    return changements
+
+async def synchroniser_miroir_async(calendriers: list) -> None:
+    """Synchronise tous les calendriers donnés en parallèle. Un calendrier inaccessible garde sa dernière copie."""
+    resultats = await asyncio.gather(*(_synchroniser_calendrier_async(c['id']) for c in calendriers), return_exceptions=True)
+    for calendar, resultat in zip(calendriers, resultats):
+        if isinstance(resultat, (HttpError, CalendrierIndisponible, ConnectionError)):
+            logger.warning(f"⚠️ CALENDRIER (async): Impossible de synchroniser le calendrier '{calendar.get('summary')}' (ID: {calendar['id']}), utilisation du miroir. Erreur: {resultat}")
+        elif isinstance(resultat, BaseException):
+            raise resultat
+
+# --- Lecture ---
+
+async def lister_tous_les_calendriers_async() -> list:
+    """Récupère la liste de tous les calendriers (partage la dernière liste connue avec le client bloquant)."""
+    logger.info("📅 CALENDRIER (async): Récupération de la liste de tous les calendriers et des permissions.")
+    try:
+        calendar_list = await _requete('GET', "/users/me/calendarList", "calendarList.list")
+        formatted_list = _formater_calendriers(calendar_list.get('items', []))
+        agent_calendrier._memoriser_calendriers(formatted_list)
+        return formatted_list
+    except Exception as e:
+        if agent_calendrier._derniers_calendriers is not None and isinstance(e, (HttpError, CalendrierIndisponible, ConnectionError)):
+            logger.warning(f"⚠️ CALENDRIER (async): Liste des calendriers indisponible, utilisation de la dernière liste connue. Erreur: {e}")
+            return list(agent_calendrier._derniers_calendriers)
+        logger.error(f"🔥 CALENDRIER (async): Erreur lors de la récupération de la liste des calendriers: {e}")
+        return [{"erreur": str(e)}]
+
+async def lister_prochains_evenements_async(nombre_evenements: int = 10, nom_calendrier: str = None) -> list:
+    """Version asynchrone de lister_prochains_evenements (mêmes paramètres, même format de sortie)."""
+    logger.info(f"📅 CALENDRIER (async): Récupération des {nombre_evenements} prochains événements" + (f" dans le calendrier '{nom_calendrier}'." if nom_calendrier else " dans tous les calendriers."))
+    try:
+        all_calendars = await lister_tous_les_calendriers_async()
+        if nom_calendrier:
+            target_calendar = next((c for c in all_calendars if nom_calendrier.lower() in c['summary'].lower()), None)
+            if not target_calendar:
+                return [{"erreur": f"Calendrier '{nom_calendrier}' non trouvé."}]
+            all_calendars = [target_calendar]
+
+        await synchroniser_miroir_async(all_calendars)
+        return _selectionner_prochains_evenements(_evenements_du_miroir(all_calendars), nombre_evenements)
+    except Exception as e:
+        logger.error(f"🔥 CALENDRIER (async): Erreur lors de la récupération des événements: {e}")
+        return [{"erreur": str(e)}]
+
+async def lister_evenements_passes_async(jours: int = 1) -> list:
+    """Version asynchrone de lister_evenements_passes (mêmes paramètres, même format de sortie)."""
+    logger.info(f"📅 CALENDRIER (async): Récupération des événements terminés depuis {jours} jour(s).")
+    try:
+        calendars_a_verifier = _calendriers_suivis(await lister_tous_les_calendriers_async())
+        await synchroniser_miroir_async(calendars_a_verifier)
+        return _selectionner_evenements_passes(_evenements_du_miroir(calendars_a_verifier), jours)
+    except Exception as e:
+        logger.error(f"🔥 CALENDRIER (async): Erreur lors de la récupération des événements passés: {e}", exc_info=True)
+        return [{"erreur": str(e)}]
+
+# --- Écriture ---
+
+async def _trouver_evenement(calendriers: list, event_id: str, masque: str):
+    """
+    Cherche un événement dans plusieurs calendriers à la fois.
+    Retourne (calendrier, événement) pour le premier calendrier (dans l'ordre donné) qui le contient, sinon (None, None).
+    """
+    async def chercher(calendar):
+        try:
+            return await _requete('GET', _chemin_evenement(calendar['id'], event_id), "events.get", masque=masque)
+        except HttpError as e:
+            if e.resp.status != 404:
+                logger.error(f"Erreur HTTP en cherchant l'événement {event_id} dans {calendar['id']}: {e}")
+            return None
+
+    resultats = await asyncio.gather(*(chercher(c) for c in calendriers))
+    for calendar, event in zip(calendriers, resultats):
+        if event:
+            return calendar, event
+    return None, None
+
+async def creer_evenement_calendrier_async(titre: str, date_heure_debut: str, date_heure_fin: str, nom_calendrier_cible: str = None, event_id: str = None) -> dict:
+    """Version asynchrone de creer_evenement_calendrier (même identifiant choisi par le bot, même traitement du 409)."""
+    logger.info("📅 CALENDRIER (async): Tentative de création de l'événement '%s' de %s à %s.", titre, date_heure_debut, date_heure_fin)
+    try:
+        calendar_id = 'primary'  # Par défaut
+        if nom_calendrier_cible:
+            all_calendars = await lister_tous_les_calendriers_async()
+            target_calendar = next((c for c in all_calendars if nom_calendrier_cible.lower() in c['summary'].lower()), None)
+            if not target_calendar:
+                msg = f"Le calendrier '{nom_calendrier_cible}' est introuvable."
+                logger.error(f"🔥 CALENDRIER (async): {msg}")
+                return {"erreur": "calendrier_non_trouve", "details": msg}
+            calendar_id = target_calendar['id']
+
+        event = {
+            'summary': titre,
+            'start': {'dateTime': date_heure_debut, 'timeZone': 'Europe/Paris'},
+            'end': {'dateTime': date_heure_fin, 'timeZone': 'Europe/Paris'},
+        }
+        if event_id:
+            event['id'] = event_id
+        created_event = await _requete('POST', _chemin_evenement(calendar_id), "events.insert", corps=event, idempotent=bool(event_id))
+        logger.info("✅ CALENDRIER (async): Événement '%s' créé avec succès (ID: %s).", titre, created_event.get('id'))
+        incrementer_version(MAGASIN_EVENEMENTS)
+        return {"succes": f"Événement '{titre}' créé.", "event_id": created_event.get('id')}
+    except HttpError as e:
+        if event_id and e.resp.status == 409:
+            return _evenement_deja_cree(titre, event_id)
+        logger.error(f"🔥 CALENDRIER (async): Erreur lors de la création de l'événement: {e}")
+        return {"erreur": str(e)}
+    except Exception as e:
+        logger.error(f"🔥 CALENDRIER (async): Erreur lors de la création de l'événement: {e}")
+        return {"erreur": str(e)}
+
+async def modifier_evenement_calendrier_async(event_id: str, nouveau_titre: str = None, nouvelle_date_heure_debut: str = None, nouvelle_date_heure_fin: str = None, nouveau_nom_calendrier: str = None) -> dict:
+    """Version asynchrone de modifier_evenement_calendrier (l'événement est cherché dans tous les calendriers en parallèle)."""
+    logger.info(f"📅 CALENDRIER (async): Tentative de modification de l'événement ID '{event_id}'.")
+    try:
+        all_calendars = await lister_tous_les_calendriers_async()
+        source_calendar, event_to_modify = await _trouver_evenement(all_calendars, event_id, "events.get.modification")
+        if not event_to_modify:
+            logger.error(f"🔥 CALENDRIER (async): Impossible de trouver l'événement ID '{event_id}' dans TOUS les calendriers.")
+            return {"erreur": f"Événement avec l'ID '{event_id}' introuvable."}
+
+        if source_calendar.get('access_role') not in ['writer', 'owner']:
+            msg = f"L'événement se trouve dans le calendrier '{source_calendar['summary']}', qui est en lecture seule. Impossible de le modifier ou de le déplacer."
+            logger.warning(f"⚠️ CALENDRIER (async): {msg}")
+            return {"erreur": msg}
+        source_calendar_id = source_calendar['id']
+
+        if nouveau_nom_calendrier:
+            destination_calendar = next((c for c in all_calendars if nouveau_nom_calendrier.lower() in c['summary'].lower()), None)
+            if not destination_calendar:
+                logger.error(f"🔥 CALENDRIER (async): Calendrier de destination '{nouveau_nom_calendrier}' introuvable.")
+                return {"erreur": f"Le calendrier de destination '{nouveau_nom_calendrier}' n'existe pas."}
+            if destination_calendar.get('access_role') not in ['writer', 'owner']:
+                msg = f"Le calendrier de destination '{destination_calendar['summary']}' n'est pas modifiable."
+                logger.warning(f"⚠️ CALENDRIER (async): {msg}")
+                return {"erreur": msg}
+            if destination_calendar['id'] != source_calendar_id:
+                logger.info(f"Déplacement de l'événement de '{source_calendar_id}' vers '{destination_calendar['id']}'.")
+                await _requete('POST', _chemin_evenement(source_calendar_id, event_id) + "/move", "events.move", {'destination': destination_calendar['id']}, idempotent=False)
+                source_calendar_id = destination_calendar['id']
+
+        modifications = _preparer_modifications(event_to_modify, nouveau_titre, nouvelle_date_heure_debut, nouvelle_date_heure_fin)
+        if modifications:
+            updated_event = await _requete('PATCH', _chemin_evenement(source_calendar_id, event_id), "events.patch", corps=modifications)
+            logger.info("✅ CALENDRIER (async): Événement ID '%s' entièrement mis à jour.", event_id)
+            incrementer_version(MAGASIN_EVENEMENTS)
+            return {"succes": f"L'événement '{updated_event['summary']}' a été mis à jour avec succès."}
+
+        if nouveau_nom_calendrier:
+            incrementer_version(MAGASIN_EVENEMENTS)
+            return {"succes": f"L'événement a été déplacé avec succès vers le calendrier '{nouveau_nom_calendrier}'."}
+        return {"info": "Aucune modification demandée sur l'événement."}
+    except Exception as e:
+        logger.error(f"🔥 CALENDRIER (async): Erreur inattendue lors de la modification de l'événement: {e}", exc_info=True)
+        return {"erreur": str(e)}
+
+async def supprimer_evenement_calendrier_async(event_id: str) -> dict:
+    """Version asynchrone de supprimer_evenement_calendrier."""
+    logger.info("📅 CALENDRIER (async): Tentative de suppression de l'événement ID '%s' sur les calendriers modifiables.", event_id)
+    try:
+        all_calendars = await lister_tous_les_calendriers_async()
+        writable_calendars = [c for c in all_calendars if c.get('access_role') in ['writer', 'owner']]
+        if not writable_calendars:
+            logger.warning("⚠️ CALENDRIER (async): Aucun calendrier modifiable trouvé pour ce compte.")
+            return {"erreur": "Aucun calendrier modifiable n'a été trouvé."}
+
+        calendar, _ = await _trouver_evenement(writable_calendars, event_id, "events.get.suppression")
+        if not calendar:
+            logger.error("🔥 CALENDRIER (async): Impossible de supprimer, événement introuvable (ID: %s) dans les calendriers modifiables.", event_id)
+            return {"erreur": "Événement non trouvé dans vos calendriers modifiables."}
+
+        try:
+            await _requete('DELETE', _chemin_evenement(calendar['id'], event_id), "events.delete")
+        except HttpError as e:
+            # L'événement vient d'être trouvé : un 404/410 ici veut dire qu'une tentative précédente l'a déjà supprimé.
+            if e.resp.status not in (404, 410):
+                raise
+        logger.info("✅ CALENDRIER (async): Événement ID '%s' supprimé avec succès du calendrier '%s'.", event_id, calendar['summary'])
+        incrementer_version(MAGASIN_EVENEMENTS)
+        return {"succes": "L'événement a été supprimé avec succès."}
+    except Exception as e:
+        logger.error(f"🔥 CALENDRIER (async): Erreur inattendue lors de la suppression de l'événement: {e}")
+        return {"erreur": str(e)}
@@ -2,12 +2,22 @@
 
 import os
 import json
+import copy
+import html
 # On importe la nouvelle bibliothèque de Google
 import google.generativeai as genai
+from google.generativeai.types import content_types
+from google.api_core import exceptions as google_exceptions
 # On importe le convertisseur pour les logs
 # from google.generativeai.types import to_dict
 import datetime
 import logging
+import asyncio
+import time
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # Importation de TOUTES les fonctions de nos agents, qui deviendront des "outils" pour l'IA
 from .agent_taches import (
@@ -16,20 +26,43 @@ from .agent_taches import (
     reorganiser_taches, # On importe le nouvel outil
     ajouter_sous_tache, lister_sous_taches, modifier_sous_tache,
     supprimer_sous_tache, changer_statut_sous_tache,
-    lier_tache_a_evenement
+    lier_tache_a_evenement, NOM_FICHIER_TACHES
 )
 from .agent_projets import (
-    ajouter_projet, lister_projets, modifier_projet, supprimer_projet
+    ajouter_projet, lister_projets, modifier_projet, supprimer_projet, NOM_FICHIER_PROJETS
 )
 from .agent_calendrier import (
     lister_prochains_evenements, creer_evenement_calendrier, modifier_evenement_calendrier,
     supprimer_evenement_calendrier, lister_tous_les_calendriers,
-    creer_calendrier, renommer_calendrier, supprimer_calendrier
+    creer_calendrier, renommer_calendrier, supprimer_calendrier, MAGASIN_CALENDRIERS
 )
+from .agent_calendrier_async import (
+    lister_prochains_evenements_async, creer_evenement_calendrier_async, modifier_evenement_calendrier_async,
+    supprimer_evenement_calendrier_async, lister_tous_les_calendriers_async
+)
+from .agent_creneaux import trouver_creneaux_libres
+from .agent_cache_gemini import obtenir_cache, invalider_cache, empreinte_prompt
 # On importe le nouvel agent !
 from .agent_apprentissage import (
-    enregistrer_apprentissage, consulter_apprentissage, lister_apprentissages, supprimer_apprentissage
+    enregistrer_apprentissage, consulter_apprentissage, lister_apprentissages, supprimer_apprentissage,
+    NOM_FICHIER_APPRENTISSAGES
+)
+from .agent_memoire import version_donnees
+from .agent_reponses_outils import CompacteurReponses, OUTIL_SUITE_RESULTATS
+from .agent_historique import ROLE_RESUME
+from .agent_niveaux_modeles import (
+    NIVEAU_RAPIDE, NIVEAU_PRO, MODELES_PAR_NIVEAU, TOURS_OUTILS_MAX_RAPIDE,
+    choisir_niveau, enregistrer_latence, enregistrer_echec
 )
+from .agent_situation import instantane_situation
+from .agent_index_apprentissages import selectionner_apprentissages
+from .agent_groupes_outils import (
+    OUTIL_AUTRES_OUTILS, DECLARATION_AUTRES_OUTILS, choisir_outils, enregistrer_elargissement
+)
+from .agent_boite_envoi import planifier_synchronisation
+from .agent_idempotence import cle_idempotence, arguments_avec_identifiant, resultat_enregistre, enregistrer_resultat
+from .agent_journal import Charge
+from .agent_echeances import Echeance, RequeteInterrompue, MOTIF_ANNULATION, DELAI_MIN_APPEL_SECONDES
 
 # --- Configuration ---
 # On configure l'API Google Gemini
@@ -74,6 +107,7 @@ gemini_tools = [
     {"type": "function", "function": {"name": "creer_evenement_calendrier", "description": "Crée un nouvel événement dans le calendrier. Tu dois OBLIGATOIREMENT spécifier une heure de début ET de fin.", "parameters": {"type": "OBJECT", "properties": {"titre": {"type": "STRING", "description": "Titre de l'événement. Utiliser la description exacte d'une tâche si possible."}, "date_heure_debut": {"type": "STRING", "description": "Date et heure de début au format ISO 8601 (YYYY-MM-DDTHH:MM:SS)."}, "date_heure_fin": {"type": "STRING", "description": "Date et heure de fin au format ISO 8601 (YYYY-MM-DDTHH:MM:SS)."}, "nom_calendrier_cible": {"type": "STRING", "description": "Optionnel. Si ce paramètre est fourni, l'événement sera créé dans ce calendrier spécifique, ignorant toute autre logique d'association."}}, "required": ["titre", "date_heure_debut", "date_heure_fin"]}}},
     {"type": "function", "function": {"name": "modifier_evenement_calendrier", "description": "Modifier un événement existant (titre, début, fin, calendrier) via son ID.", "parameters": {"type": "OBJECT", "properties": {"event_id": {"type": "STRING", "description": "ID de l'événement à modifier."}, "nouveau_titre": {"type": "STRING", "description": "Optionnel. Le nouveau titre de l'événement."}, "nouvelle_date_heure_debut": {"type": "STRING", "description": "Optionnel. La nouvelle date et heure de début au format ISO 8601."}, "nouvelle_date_heure_fin": {"type": "STRING", "description": "Optionnel. La nouvelle date et heure de fin au format ISO 8601."}, "nouveau_nom_calendrier": {"type": "STRING", "description": "Optionnel. Le nom du calendrier de destination pour déplacer l'événement."}}, "required": ["event_id"]}}},
     {"type": "function", "function": {"name": "supprimer_evenement_calendrier", "description": "Supprimer un événement du calendrier avec son ID.", "parameters": {"type": "OBJECT", "properties": {"event_id": {"type": "STRING", "description": "ID de l'événement à supprimer."}}, "required": ["event_id"]}}},
+    {"type": "function", "function": {"name": "trouver_creneaux_libres", "description": "Trouve les prochains créneaux libres dans l'agenda de l'utilisateur (tous calendriers confondus) pour une durée donnée. À utiliser pour proposer des disponibilités, au lieu de les déduire de la liste des événements.", "parameters": {"type": "OBJECT", "properties": {"duree_minutes": {"type": "INTEGER", "description": "Durée minimale du créneau, en minutes."}, "jours": {"type": "INTEGER", "description": "Optionnel. Nombre de jours à examiner (7 par défaut)."}, "heure_debut": {"type": "INTEGER", "description": "Optionnel. Heure de début de journée de travail (9 par défaut)."}, "heure_fin": {"type": "INTEGER", "description": "Optionnel. Heure de fin de journée de travail (18 par défaut)."}, "nombre_creneaux": {"type": "INTEGER", "description": "Optionnel. Nombre maximum de créneaux à retourner (5 par défaut)."}, "date_debut": {"type": "STRING", "description": "Optionnel. Premier jour à examiner au format YYYY-MM-DD (aujourd'hui par défaut)."}, "nom_calendrier": {"type": "STRING", "description": "Optionnel. Limiter la recherche à un seul calendrier."}}, "required": ["duree_minutes"]}}},
 
     # Outils pour la GESTION des CALENDRIERS
     {"type": "function", "function": {"name": "creer_calendrier", "description": "Créer un tout nouveau calendrier.", "parameters": {"type": "OBJECT", "properties": {"nom_calendrier": {"type": "STRING", "description": "Le nom du nouveau calendrier à créer."}}, "required": ["nom_calendrier"]}}},
@@ -81,10 +115,11 @@ gemini_tools = [
     {"type": "function", "function": {"name": "supprimer_calendrier", "description": "Supprimer définitivement un calendrier. Cette action est irréversible.", "parameters": {"type": "OBJECT", "properties": {"nom_calendrier": {"type": "STRING", "description": "Le nom du calendrier à supprimer."}}, "required": ["nom_calendrier"]}}},
     
     # NOUVEAUX Outils pour la Mémoire Persistante (Apprentissage)
-    {"type": "function", "function": {"name": "enregistrer_apprentissage", "description": "Mémorise une information importante fournie par l'utilisateur (préférence, décision, fait). Utiliser une clé simple et une valeur claire. Ex: (cle='habitude_sport', valeur='Lundi et Mercredi soir').", "parameters": {"type": "OBJECT", "properties": {"cle": {"type": "STRING", "description": "La clé ou le nom de l'information à mémoriser. Doit être unique et descriptive."}, "valeur": {"type": "STRING", "description": "L'information ou la valeur à enregistrer."}}, "required": ["cle", "valeur"]}}},
+    {"type": "function", "function": {"name": "enregistrer_apprentissage", "description": "Mémorise une information importante fournie par l'utilisateur (préférence, décision, fait). Utiliser une clé simple et une valeur claire. Ex: (cle='habitude_sport', valeur='Lundi et Mercredi soir').", "parameters": {"type": "OBJECT", "properties": {"cle": {"type": "STRING", "description": "La clé ou le nom de l'information à mémoriser. Doit être unique et descriptive."}, "valeur": {"type": "STRING", "description": "L'information ou la valeur à enregistrer."}, "epingle": {"type": "BOOLEAN", "description": "Optionnel. Vrai pour une information à toujours garder en tête (prénom, règle de vie essentielle). Par défaut, une information n'est rappelée que lorsqu'elle concerne la demande en cours."}}, "required": ["cle", "valeur"]}}},
     {"type": "function", "function": {"name": "consulter_apprentissage", "description": "Consulte une information spécifique dans la mémoire en utilisant sa clé.", "parameters": {"type": "OBJECT", "properties": {"cle": {"type": "STRING", "description": "La clé de l'information à retrouver."}}, "required": ["cle"]}}},
     {"type": "function", "function": {"name": "lister_apprentissages", "description": "Affiche la totalité de ce que l'assistant a appris (toutes les paires clé-valeur mémorisées)."}},
     {"type": "function", "function": {"name": "supprimer_apprentissage", "description": "Oublie (supprime) une information de la mémoire en utilisant sa clé.", "parameters": {"type": "OBJECT", "properties": {"cle": {"type": "STRING", "description": "La clé de l'information à supprimer."}}, "required": ["cle"]}}},
+    {"type": "function", "function": {"name": OUTIL_SUITE_RESULTATS, "description": "Lit la suite d'une liste de résultats trop longue, quand une réponse d'outil contient 'suite_disponible'.", "parameters": {"type": "OBJECT", "properties": {"curseur": {"type": "STRING", "description": "Le curseur indiqué dans 'suite_disponible'."}}, "required": ["curseur"]}}},
 ]
 
 # Mapping complet des outils
@@ -95,32 +130,75 @@ available_functions = {
     "ajouter_sous_tache": ajouter_sous_tache, "lister_sous_taches": lister_sous_taches, "modifier_sous_tache": modifier_sous_tache, "supprimer_sous_tache": supprimer_sous_tache, "changer_statut_sous_tache": changer_statut_sous_tache,
     "lister_projets": lister_projets, "ajouter_projet": ajouter_projet, "modifier_projet": modifier_projet, "supprimer_projet": supprimer_projet,
     "lister_prochains_evenements": lister_prochains_evenements, "creer_evenement_calendrier": creer_evenement_calendrier, "modifier_evenement_calendrier": modifier_evenement_calendrier, "supprimer_evenement_calendrier": supprimer_evenement_calendrier,
-    "lister_tous_les_calendriers": lister_tous_les_calendriers,
+    "lister_tous_les_calendriers": lister_tous_les_calendriers, "trouver_creneaux_libres": trouver_creneaux_libres,
     "creer_calendrier": creer_calendrier, "renommer_calendrier": renommer_calendrier, "supprimer_calendrier": supprimer_calendrier,
     # On ajoute les nouvelles fonctions au mapping
     "enregistrer_apprentissage": enregistrer_apprentissage, "consulter_apprentissage": consulter_apprentissage, "lister_apprentissages": lister_apprentissages, "supprimer_apprentissage": supprimer_apprentissage,
 }
 
-# NOUVELLE FONCTION DE LOG SÉCURISÉE
-def _log_history(history: list) -> str:
-    """
-    Tente de convertir l'historique en JSON pour les logs.
-    En cas d'échec (objets non sérialisables), retourne un résumé sûr pour éviter un crash.
-    """
-    try:
-        # Tente la conversion normale
-        return json.dumps(history, indent=2, ensure_ascii=False)
-    except TypeError:
-        # En cas d'échec, on retourne une chaîne de caractères qui ne fera jamais planter le log
-        return f"L'historique contient {len(history)} messages (certains objets ne sont pas sérialisables en JSON)."
+# Outils disposant d'une version asynchrone (client Calendar aiohttp) : le routeur asynchrone les attend directement.
+fonctions_async = {
+    "lister_prochains_evenements": lister_prochains_evenements_async,
+    "creer_evenement_calendrier": creer_evenement_calendrier_async,
+    "modifier_evenement_calendrier": modifier_evenement_calendrier_async,
+    "supprimer_evenement_calendrier": supprimer_evenement_calendrier_async,
+    "lister_tous_les_calendriers": lister_tous_les_calendriers_async,
+}
+
+# Outils en lecture seule : plusieurs lectures demandées dans un même tour peuvent s'exécuter en parallèle.
+# Tous les autres outils sont considérés comme des écritures et exécutés un par un, dans l'ordre demandé.
+OUTILS_LECTURE_SEULE = frozenset({
+    "lister_taches", "lister_sous_taches", "lister_projets",
+    "lister_prochains_evenements", "lister_tous_les_calendriers", "trouver_creneaux_libres",
+    "consulter_apprentissage", "lister_apprentissages", OUTIL_SUITE_RESULTATS, OUTIL_AUTRES_OUTILS,
+})
 
-def generer_analyse_situation():
+# Lectures dont le résultat est mémorisé d'un tour à l'autre : {outil: magasins de données dont il dépend}.
+# Le résultat est réutilisé tant que les mêmes arguments sont demandés et que la version de chacun
+# de ces magasins n'a pas changé (toute écriture l'augmente, voir agent_memoire). Pas de durée de validité à deviner.
+DEPENDANCES_LECTURES = {
+    "lister_taches": (NOM_FICHIER_TACHES, NOM_FICHIER_PROJETS),
+    "lister_sous_taches": (NOM_FICHIER_TACHES, NOM_FICHIER_PROJETS),
+    "lister_projets": (NOM_FICHIER_PROJETS,),
+    "lister_apprentissages": (NOM_FICHIER_APPRENTISSAGES,),
+    "consulter_apprentissage": (NOM_FICHIER_APPRENTISSAGES,),
+    "lister_tous_les_calendriers": (MAGASIN_CALENDRIERS,),
+}
+TAILLE_MEMO_LECTURES = 128
+# {(outil, arguments en JSON): (versions des magasins au moment de la lecture, résultat)}
+_memo_lectures = OrderedDict()
+_memo_lectures_lock = threading.Lock()
+_statistiques_memo = {"reutilisations": 0, "executions": 0}
+
+# Exécuteur dédié aux outils bloquants (fichiers JSON, client Calendar synchrone) : il sert au routeur
+# asynchrone et aux lectures parallèles. Il est borné pour que plusieurs conversations ne multiplient pas les threads.
+OUTILS_THREADS_MAX = int(os.getenv("ROUTER_TOOL_THREADS", "8"))
+_executeur_outils = ThreadPoolExecutor(max_workers=OUTILS_THREADS_MAX, thread_name_prefix="outil-routeur")
+
+# --- Modèles et déclarations d'outils précompilées ---
+MODELE_GEMINI = MODELES_PAR_NIVEAU[NIVEAU_PRO]
+# On extrait la définition de la fonction de chaque outil, car c'est le format attendu par Gemini.
+# C'est fait une seule fois, à l'import, et non à chaque requête.
+_declarations_outils = {t['function']['name']: t['function'] for t in gemini_tools}
+TOUS_LES_OUTILS = tuple(_declarations_outils)
+# Outil du routeur ajouté aux sous-ensembles d'outils (voir agent_groupes_outils), jamais à la liste complète.
+_declarations_outils[OUTIL_AUTRES_OUTILS] = DECLARATION_AUTRES_OUTILS
+# Jeux d'outils déjà compilés : {tuple de noms: FunctionLibrary}
+_outils_compiles = {}
+# Cache LRU des modèles configurés : {(modèle, tuple de noms d'outils, empreinte du prompt système): GenerativeModel}
+TAILLE_CACHE_MODELES = 8
+_cache_modeles = OrderedDict()
+_cache_modeles_lock = threading.Lock()
+
+def generer_analyse_situation(situation: dict = None):
     """Génère un résumé textuel de la situation (projets, tâches, stats)."""
     # Cette fonction pourrait être enrichie pour générer un prompt d'analyse plus complexe
     # mais pour l'instant, on se contente de signaler que la logique est ici.
-    taches = lister_taches()
-    projets = lister_projets()
-    evenements = lister_prochains_evenements(5)
+    # Les données viennent de l'instantané de agent_situation : pas de relecture tant que rien n'a changé.
+    situation = situation or instantane_situation()
+    taches = situation["taches"]
+    projets = situation["projets"]
+    evenements = situation["evenements"]
 
     # Ici, au lieu d'appeler l'IA (puisque c'est elle qui nous a appelés), 
     # on formate simplement les informations. L'intelligence est déjà dans le choix de la fonction.
@@ -134,18 +212,21 @@ def generer_analyse_situation():
     (Cette section peut être enrichie pour une analyse plus détaillée sans re-appeler l'IA)
     """
 
-def generer_contexte_complet(date_actuelle: str):
+def generer_contexte_dynamique(date_actuelle: str, message: str = None, conversation: list = None):
     """
-    Génère un contexte complet (prompt système) pour l'IA, incluant
-    la situation actuelle (tâches, projets), les leçons apprises et la personnalité de l'assistant.
+    Génère la partie variable du contexte de l'IA : date et heure, situation actuelle (tâches, projets)
+    et leçons apprises. Les règles et la personnalité de l'assistant, elles, ne changent pas :
+    elles sont dans agent_prompt et envoyées comme prompt système (mis en cache par Gemini).
+    Si 'message' est fourni, seules les leçons épinglées et celles qui concernent le message
+    (et les derniers échanges de 'conversation') sont incluses (voir agent_index_apprentissages).
     """
-    logger.info("🧠 CONTEXTE: Génération du contexte complet pour l'IA...")
+    logger.info("🧠 CONTEXTE: Génération du contexte du moment pour l'IA...")
 
-    # On récupère l'analyse de la situation (tâches, projets, etc.)
-    analyse = generer_analyse_situation()
-    
-    # On récupère les leçons apprises
-    apprentissages = lister_apprentissages()
+    # On récupère l'analyse de la situation (tâches, projets, etc.) et les leçons apprises,
+    # depuis l'instantané tenu à jour par agent_situation.
+    situation = instantane_situation()
+    analyse = generer_analyse_situation(situation)
+    apprentissages = selectionner_apprentissages(situation["apprentissages"], situation["epingles"], message, conversation)
 
     # On formate les apprentissages pour les inclure dans le prompt
     partie_apprentissages = ""
@@ -154,34 +235,12 @@ def generer_contexte_complet(date_actuelle: str):
         apprentissages_formattes = "\n".join([f"- {cle}: {valeur}" for cle, valeur in apprentissages.items()])
         partie_apprentissages = f"""
 ### Leçons Apprises et Préférences (Mémoire)
-Voici les informations et préférences que tu as enregistrées pour t'en souvenir :
+Voici les informations et préférences que tu as enregistrées pour t'en souvenir{" (celles qui concernent cette demande ; `lister_apprentissages` donne tout le reste)" if len(apprentissages) < len(situation["apprentissages"]) else ""} :
 {apprentissages_formattes}
 """
 
-    prompt_systeme = f"""
-# RÈGLES IMPÉRATIVES
-1.  **L'ORDRE DE L'UTILISATEUR EST LA PRIORITÉ ABSOLUE :** Quand tu suggères la prochaine tâche à effectuer, tu dois OBLIGATOIREMENT suivre l'ordre numérique (1, 2, 3...) des tâches P1, puis P2, etc. N'utilise JAMAIS ta propre logique pour outrepasser cet ordre. Biensur si tu vois une incohérence ou tu as mieux à proposer tu peux suggérer mais tu dois être conscient de sa volonté
-2.  **VÉRIFICATION DES FAITS :** Avant de mentionner un projet, vérifie scrupuleusement le nom du projet associé à la tâche dans le contexte que tu as reçu. Ne jamais inventer ou supposer une association.
-3.  **ZÉRO BAVARDAGE :** N'annonce JAMAIS ce que tu vas faire. Ne dis jamais "Je vais vérifier...", "Un instant...", "Laissez-moi regarder...". Agis en silence.
-4.  **ACTION D'ABORD :** Ta première réponse à une requête utilisateur doit TOUJOURS être un appel d'outil (une `function_call`), sauf si la question est une salutation simple ou une conversation hors-sujet.
-5.  **RÉPONSE FINALE UNIQUEMENT :** Ne fournis une réponse textuelle que lorsque tu as rassemblé TOUTES les informations nécessaires et que tu as la réponse complète et définitive.
-
-# GESTION INTELLIGENTE DE LA DURÉE DES ÉVÉNEMENTS
-- **Principe : La durée n'est JAMAIS fixée à 1h par défaut.** Tu dois estimer la durée la plus logique.
-- **Processus de réflexion :**
-    1. **Analyse le titre et le contexte :** Une "Réunion rapide" dure 30 min. Un "Atelier de travail" dure 3h. Une "Session de sport" dure 1h30. Utilise le bon sens et le contexte de la conversation.
-    2. **Consulte l'agenda :** Avant de proposer un créneau, vérifie toujours les disponibilités de l'utilisateur avec `lister_prochains_evenements`.
-    3. **Stratégie : Proposer et Confirmer :** Si la durée n'est pas explicitement donnée par l'utilisateur, propose une durée logique et demande sa confirmation. Exemple : "Pour la tâche 'Préparer la présentation', je te propose de bloquer un créneau de 2h. Ça te va ?"
-    4. **Agir :** Une fois la durée confirmée ou si elle était claire dès le début, appelle l'outil `creer_evenement_calendrier` avec l'heure de début ET de fin.
-
-# PROFIL DE L'ASSISTANT
-Tu es un assistant personnel expert en organisation et productivité, agissant comme un coach proactif.
-Ton ton est encourageant, concis et orienté vers l'action.
-Tu dois anticiper les besoins de l'utilisateur, l'aider à décomposer ses projets en tâches actionnables et à maintenir son élan.
-Tu dois systématiquement utiliser les outils à ta disposition pour manipuler les données (tâches, projets, calendrier, mémoire). Ne réponds JAMAIS que tu as fait une action (créer, modifier, enregistrer) sans avoir VRAIMENT appelé l'outil correspondant.
-Quand tu analyses une situation, fais-le en silence et ne présente que la conclusion ou la prochaine étape pertinente pour l'utilisateur.
-Il doit rester concentré sur l'accomplissement des objectifs fixés.
-L'IA doit utiliser les emojis de manière pertinente et naturelle.
+    contexte = f"""
+# CONTEXTE DU MOMENT
 La date et l'heure actuelles sont : {date_actuelle}.
 
 # SITUATION ACTUELLE DE L'UTILISATEUR
@@ -189,171 +248,576 @@ La date et l'heure actuelles sont : {date_actuelle}.
 {partie_apprentissages}
 # FIN DU CONTEXTE
 """
-    logger.debug(f"CONTEXTE COMPLET: \n{prompt_systeme}")
-    return prompt_systeme
+    logger.debug("CONTEXTE DU MOMENT: \n%s", Charge(contexte))
+    return contexte
 
-def router_requete_utilisateur(historique_conversation: list):
+def _preparer_conversation(historique_conversation: list, contexte: str = None) -> tuple:
     """
-    Gère la conversation en utilisant Google Gemini.
-    Cette fonction est le nouveau cerveau de l'IA.
+    Sépare le prompt système et convertit l'historique au format attendu par Gemini.
+    Le contexte du moment est joint au dernier message de l'utilisateur (et seulement pour cet appel) :
+    le prompt système reste identique d'un message à l'autre et peut être mis en cache.
+    Le résumé des anciens échanges (voir agent_historique) est joint au message de l'utilisateur qui le suit.
     """
-    logger.info("🧠 ROUTEUR (GEMINI): Nouvelle requête reçue, début de l'analyse.")
-    
-    # 1. Préparation des données pour Gemini
     historique_pour_gemini = []
     system_prompt = ""
+    resume = None
     for message in historique_conversation:
         role = message["role"]
         if role == "system":
             system_prompt = message["content"]
             continue # Le prompt système est géré séparément par Gemini
+        if role == ROLE_RESUME:
+            resume = message["content"]
+            continue
         
         # On adapte les rôles pour Gemini ('assistant' devient 'model')
         if role == "assistant":
             role = "model"
             
-        historique_pour_gemini.append({'role': role, 'parts': [message["content"]]})
+        parts = [message["content"]]
+        if resume and role == "user":
+            parts.insert(0, f"# RÉSUMÉ DU DÉBUT DE LA CONVERSATION\n{resume}")
+            resume = None
+        historique_pour_gemini.append({'role': role, 'parts': parts})
+
+    if contexte:
+        for message in reversed(historique_pour_gemini):
+            if message['role'] == 'user':
+                message['parts'] = [contexte] + message['parts']
+                break
+    return system_prompt, historique_pour_gemini
+
+def _compiler_outils(noms_outils) -> content_types.FunctionLibrary:
+    """Compile (une seule fois par jeu d'outils) les déclarations au format interne de Gemini."""
+    if noms_outils not in _outils_compiles:
+        _outils_compiles[noms_outils] = content_types.to_function_library([_declarations_outils[nom] for nom in noms_outils])
+    return _outils_compiles[noms_outils]
+
+def _creer_modele(system_prompt: str, nom_modele: str = MODELE_GEMINI, noms_outils: tuple = None, sans_cache: bool = False):
+    """
+    Retourne le modèle Gemini configuré avec le prompt système et les outils.
+    Les modèles sont gardés dans un petit cache LRU, indexé par (modèle, jeu d'outils, empreinte du prompt) :
+    tant que ces trois éléments ne changent pas, la configuration n'est pas refaite.
+    Quand c'est possible, le prompt système et les outils sont lus depuis le cache de contexte de Gemini
+    (agent_cache_gemini) au lieu d'être renvoyés à chaque appel : un cache par (modèle, jeu d'outils).
+    Sinon, ou si 'sans_cache' est demandé, le modèle est configuré avec le prompt complet.
+    Peut appeler Google (cache de contexte) : depuis la boucle d'événements, passer par asyncio.to_thread.
+    """
+    noms_outils = noms_outils or TOUS_LES_OUTILS
+    cache = None if sans_cache else obtenir_cache(nom_modele, system_prompt, noms_outils, _compiler_outils(noms_outils))
+    cle = (nom_modele, noms_outils, empreinte_prompt(system_prompt), cache.name if cache else None)
+    with _cache_modeles_lock:
+        model = _cache_modeles.get(cle)
+        if model is not None:
+            _cache_modeles.move_to_end(cle)
+            return model
+        if cache:
+            model = genai.GenerativeModel.from_cached_content(cache)
+        else:
+            model = genai.GenerativeModel(
+                model_name=nom_modele,
+                system_instruction=system_prompt,
+                tools=_compiler_outils(noms_outils)
+            )
+        _cache_modeles[cle] = model
+        if len(_cache_modeles) > TAILLE_CACHE_MODELES:
+            _cache_modeles.popitem(last=False)
+        logger.debug(f"🧠 ROUTEUR: Nouveau modèle configuré ({nom_modele}, {len(noms_outils)} outils, cache de contexte: {cache.name if cache else 'non'}), {len(_cache_modeles)} en cache.")
+        return model
+
+def _outils_du_modele(model) -> tuple:
+    """Jeu d'outils avec lequel un modèle a été configuré (tous les outils s'il n'est plus dans le cache LRU)."""
+    with _cache_modeles_lock:
+        return next((cle[1] for cle, modele in _cache_modeles.items() if modele is model), TOUS_LES_OUTILS)
+
+def _erreur_cache_contexte(model, erreur: Exception) -> bool:
+    """
+    Indique si l'erreur vient du cache de contexte (expiré ou supprimé côté Gemini).
+    Un InvalidArgument n'est retenu que s'il porte sur le cache : les autres (contenu refusé,
+    arguments d'outils...) échoueraient de la même façon avec le prompt complet.
+    """
+    if not model.cached_content:
+        return False
+    if isinstance(erreur, (google_exceptions.NotFound, google_exceptions.PermissionDenied)):
+        return True
+    message = str(erreur).lower()
+    return isinstance(erreur, google_exceptions.InvalidArgument) and ("cachedcontent" in message or "cached content" in message)
+
+def _nom_modele(model) -> str:
+    """Nom du modèle sans le préfixe 'models/' ajouté par la bibliothèque."""
+    return model.model_name.split("/")[-1]
+
+# Texte retenu avant de commencer l'affichage en flux : un tour d'outils commence souvent par une courte
+# phrase ("Je regarde ton agenda...") suivie de l'appel d'outil, qui ne doit pas être montrée comme réponse.
+CARACTERES_AVANT_FLUX = 160
+
+async def _generer_flux_async(model, contenus: list, sur_fragment=None, request_options: dict = None):
+    """
+    Appelle Gemini de façon asynchrone. Si 'sur_fragment' est fourni, la réponse est reçue en flux
+    (streaming) : à chaque morceau de texte reçu, sur_fragment(texte reçu jusqu'ici) est attendu.
+    Le texte n'est transmis qu'une fois CARACTERES_AVANT_FLUX caractères reçus sans demande d'outil ;
+    dès qu'un morceau contient une demande d'outil, plus rien n'est transmis pour cet appel.
+    Retourne la réponse complète, comme generate_content_async.
+    """
+    if sur_fragment is None:
+        return await model.generate_content_async(contenus, request_options=request_options)
+
+    response = await model.generate_content_async(contenus, stream=True, request_options=request_options)
+    texte = ""
+    appel_outil = False
+    async for morceau in response:
+        if appel_outil or not morceau.candidates or not morceau.candidates[0].content.parts:
+            continue
+        parts = morceau.candidates[0].content.parts
+        if any(part.function_call for part in parts):
+            # Tour d'outils : le texte qui accompagne l'appel n'est pas la réponse.
+            appel_outil = True
+            continue
+        nouveau = "".join(part.text for part in parts if part.text)
+        if nouveau:
+            texte += nouveau
+            if len(texte) >= CARACTERES_AVANT_FLUX:
+                await sur_fragment(texte)
+    return response
 
+async def _appeler_gemini_async(model, contenus: list, sur_fragment=None, echeance: Echeance = None):
+    """
+    Appel à Gemini limité au temps restant de l'échéance (transmis comme timeout) ;
+    une annulation interrompt aussi l'attente en cours (RequeteInterrompue).
+    """
+    if echeance is None:
+        return await _generer_flux_async(model, contenus, sur_fragment)
+    echeance.verifier_appel_gemini()
+    appel = _generer_flux_async(model, contenus, sur_fragment, echeance.options_requete())
+    return await echeance.attendre(appel, "appel à Gemini")
+
+async def _generer_async(model, system_prompt: str, contenus: list, sur_fragment=None, echeance: Echeance = None):
+    """
+    Appelle Gemini (avec réception en flux si 'sur_fragment' est fourni). Si le cache de contexte a été refusé,
+    il est invalidé et l'appel est refait avec le prompt complet. Retourne (réponse, modèle à utiliser pour la suite).
+    """
     try:
-        # 2. Configuration du modèle Gemini
-        # On extrait la définition de la fonction de chaque outil, car c'est le format attendu par Gemini.
-        formatted_tools = [t['function'] for t in gemini_tools]
-        logger.debug(f"🛠️ OUTILS GEMINI FORMATÉS: {_log_history(formatted_tools)}")
-        
-        model = genai.GenerativeModel(
-            model_name="gemini-2.5-pro",
-            system_instruction=system_prompt,
-            # On utilise les outils fraîchement formatés
-            tools=formatted_tools
+        return await _appeler_gemini_async(model, contenus, sur_fragment, echeance), model
+    except Exception as e:
+        if not _erreur_cache_contexte(model, e):
+            raise
+        logger.warning(f"⚠️ ROUTEUR: Cache de contexte refusé par Gemini ({repr(e)}), nouvel essai avec le prompt complet.")
+        invalider_cache(model.cached_content)
+        model = _creer_modele(system_prompt, nom_modele=_nom_modele(model), noms_outils=_outils_du_modele(model), sans_cache=True)
+        return await _appeler_gemini_async(model, contenus, sur_fragment, echeance), model
+
+# --- Niveaux de modèle (voir agent_niveaux_modeles) ---
+
+def _dernier_message_utilisateur(historique_conversation: list) -> str:
+    return next((m["content"] for m in reversed(historique_conversation) if m.get("role") == "user"), "")
+
+def _derniere_reponse_assistant(historique_conversation: list) -> str:
+    """Réponse de l'assistant qui précède le dernier message de l'utilisateur (pour comprendre un "oui, vas-y")."""
+    vu_utilisateur = False
+    for message in reversed(historique_conversation):
+        if message.get("role") == "user":
+            vu_utilisateur = True
+        elif vu_utilisateur and message.get("role") == "assistant":
+            return message["content"]
+    return ""
+
+def _modele_du_niveau(system_prompt: str, niveau: str, noms_outils: tuple = None):
+    return _creer_modele(system_prompt, nom_modele=MODELES_PAR_NIVEAU[niveau], noms_outils=noms_outils)
+
+def _elargir_outils_si_demande(appels: list, model, system_prompt: str):
+    """Si l'IA a demandé d'autres outils, retourne le même modèle configuré avec tous les outils."""
+    if not any(function_name == OUTIL_AUTRES_OUTILS for function_name, _ in appels):
+        return model
+    enregistrer_elargissement(_outils_du_modele(model))
+    return _creer_modele(system_prompt, nom_modele=_nom_modele(model), noms_outils=TOUS_LES_OUTILS)
+
+def _verifier_reponse(response):
+    """Une réponse sans candidat (bloquée, vide) est traitée comme un échec du modèle."""
+    if not response.candidates:
+        raise ValueError(f"Réponse vide de Gemini: {getattr(response, 'prompt_feedback', None)}")
+
+async def _generer_niveau_async(niveau: str, model, system_prompt: str, contenus: list, sur_fragment=None, echeance: Echeance = None) -> tuple:
+    """
+    Appelle le modèle du niveau donné et mesure sa latence. Si le modèle rapide échoue,
+    l'appel est refait avec le modèle pro. Retourne (réponse, modèle, niveau) pour la suite du tour.
+    Une interruption (échéance, annulation) n'est pas un échec du modèle : elle est transmise telle quelle.
+    """
+    debut = time.perf_counter()
+    try:
+        response, model = await _generer_async(model, system_prompt, contenus, sur_fragment, echeance)
+        _verifier_reponse(response)
+    except RequeteInterrompue:
+        raise
+    except Exception as e:
+        if niveau != NIVEAU_RAPIDE:
+            raise
+        enregistrer_echec(niveau)
+        logger.warning(f"⚠️ ROUTEUR: Le modèle rapide a échoué ({repr(e)}), nouvel essai avec le modèle pro.")
+        niveau, model = NIVEAU_PRO, await asyncio.to_thread(_modele_du_niveau, system_prompt, NIVEAU_PRO, _outils_du_modele(model))
+        debut = time.perf_counter()
+        response, model = await _generer_async(model, system_prompt, contenus, sur_fragment, echeance)
+    enregistrer_latence(niveau, time.perf_counter() - debut)
+    return response, model, niveau
+
+def _escalader_si_necessaire(niveau: str, model, system_prompt: str, tours_outils: int) -> tuple:
+    """Une requête qui enchaîne plus de TOURS_OUTILS_MAX_RAPIDE allers-retours d'outils passe au modèle pro."""
+    if niveau == NIVEAU_RAPIDE and tours_outils >= TOURS_OUTILS_MAX_RAPIDE:
+        logger.info(f"🧠 ROUTEUR: Requête en plusieurs étapes ({tours_outils} tours d'outils), passage au modèle pro.")
+        return NIVEAU_PRO, _modele_du_niveau(system_prompt, NIVEAU_PRO, _outils_du_modele(model))
+    return niveau, model
+
+# Compilation des déclarations d'outils dès l'import.
+_compiler_outils(TOUS_LES_OUTILS)
+logger.debug("🛠️ OUTILS GEMINI FORMATÉS: %s", Charge(list(_declarations_outils.values())))
+
+def _demande_outils(response_candidate) -> bool:
+    """Indique si la réponse de Gemini est une demande d'exécution d'outils."""
+    return bool(response_candidate.content.parts and response_candidate.content.parts[0].function_call)
+
+def _texte_final(response) -> str:
+    """Extrait le texte de la réponse finale de Gemini."""
+    # On accède directement au texte, ce qui est plus sûr et évite les erreurs d'attributs
+    if response.candidates and response.candidates[0].content.parts:
+        return "".join(part.text for part in response.candidates[0].content.parts)
+    return ""
+
+def _normaliser_reponse(function_response_data) -> dict:
+    """
+    VÉRIFICATION CRUCIALE : L'API Gemini attend un dictionnaire (objet JSON) pour le champ "response".
+    Si notre fonction retourne une simple liste (ex: lister_taches), on doit l'encapsuler
+    dans un dictionnaire pour être conforme.
+    """
+    if isinstance(function_response_data, list):
+        return {"resultats": function_response_data}
+    return function_response_data
+
+def _cle_memo(function_name: str, args: dict):
+    return function_name, json.dumps(args, sort_keys=True, ensure_ascii=False, default=str)
+
+def _versions_lecture(function_name: str):
+    """Versions actuelles des magasins dont dépend une lecture (None si elle n'est pas mémorisable)."""
+    magasins = DEPENDANCES_LECTURES.get(function_name)
+    if magasins is None:
+        return None
+    return tuple(version_donnees(magasin) for magasin in magasins)
+
+def _lecture_memorisee(function_name: str, args: dict, versions):
+    """Retourne une copie du résultat mémorisé s'il est encore exact, sinon None."""
+    if versions is None:
+        return None
+    cle = _cle_memo(function_name, args)
+    with _memo_lectures_lock:
+        entree = _memo_lectures.get(cle)
+        if entree is None or entree[0] != versions:
+            _statistiques_memo["executions"] += 1
+            return None
+        _memo_lectures.move_to_end(cle)
+        _statistiques_memo["reutilisations"] += 1
+    logger.debug(f"♻️ ROUTEUR: Résultat de '{function_name}' réutilisé (données inchangées).")
+    return copy.deepcopy(entree[1])
+
+def _memoriser_lecture(function_name: str, args: dict, versions, resultat):
+    """
+    Mémorise le résultat d'une lecture avec les versions relevées AVANT son exécution :
+    si une écriture a eu lieu pendant la lecture, le résultat ne sera jamais réutilisé.
+    Les erreurs ne sont pas mémorisées.
+    """
+    if versions is None:
+        return
+    if isinstance(resultat, dict) and "erreur" in resultat:
+        return
+    if isinstance(resultat, list) and any(isinstance(element, dict) and "erreur" in element for element in resultat):
+        return
+    cle = _cle_memo(function_name, args)
+    with _memo_lectures_lock:
+        _memo_lectures[cle] = (versions, copy.deepcopy(resultat))
+        _memo_lectures.move_to_end(cle)
+        if len(_memo_lectures) > TAILLE_MEMO_LECTURES:
+            _memo_lectures.popitem(last=False)
+
+def statistiques_memo_lectures() -> dict:
+    """Nombre de lectures réutilisées et exécutées depuis le démarrage."""
+    with _memo_lectures_lock:
+        return dict(_statistiques_memo)
+
+def _appeler_outil(function_name: str, args: dict) -> dict:
+    """Exécute un outil (bloquant) et ses effets de bord, et retourne la réponse à transmettre à Gemini."""
+    versions = _versions_lecture(function_name)
+    function_response_data = _lecture_memorisee(function_name, args, versions)
+    if function_response_data is None:
+        function_response_data = available_functions[function_name](**args)
+        _memoriser_lecture(function_name, args, versions, function_response_data)
+    # La répercussion sur le calendrier (tâche datée -> événement) part dans la boîte d'envoi :
+    # le tour de l'utilisateur n'attend plus Google.
+    planifier_synchronisation(function_name, function_response_data)
+    return _normaliser_reponse(function_response_data)
+
+async def _appeler_outil_async(function_name: str, args: dict) -> dict:
+    """
+    Exécute un outil sans bloquer la boucle d'événements : les outils du calendrier utilisent le client aiohttp,
+    les autres (bloquants) tournent dans l'exécuteur dédié pour ne jamais bloquer la boucle d'événements.
+    """
+    fonction_async = fonctions_async.get(function_name)
+    if fonction_async:
+        versions = _versions_lecture(function_name)
+        function_response_data = _lecture_memorisee(function_name, args, versions)
+        if function_response_data is None:
+            function_response_data = await fonction_async(**args)
+            _memoriser_lecture(function_name, args, versions, function_response_data)
+        return _normaliser_reponse(function_response_data)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executeur_outils, functools.partial(_appeler_outil, function_name, args))
+
+def _partie_reponse(function_name: str, function_response_data: dict) -> dict:
+    """On prépare la réponse au format que Gemini attend (une part par réponse)."""
+    return {'function_response': {
+        'name': function_name,
+        'response': function_response_data
+        }
+    }
+
+def _extraire_appels(parts, compacteur: CompacteurReponses) -> list:
+    """
+    Liste les appels d'outils (nom, arguments) demandés par Gemini, en ignorant les fonctions inconnues.
+    Les alias d'identifiants utilisés par l'IA sont remplacés par les vrais identifiants.
+    """
+    appels = []
+    for part in parts:
+        function_name = part.function_call.name
+        args = compacteur.developper_arguments(dict(part.function_call.args))
+        logger.info(f"🛠️ OUTIL (GEMINI): L'IA demande l'exécution de '{function_name}' avec les arguments: {args}")
+        if function_name not in available_functions and function_name not in (OUTIL_SUITE_RESULTATS, OUTIL_AUTRES_OUTILS):
+            logger.warning(f"⚠️ ATTENTION: L'IA a tenté d'appeler une fonction inconnue: {function_name}")
+            continue
+        appels.append((function_name, args))
+    return appels
+
+def _lots_d_execution(appels: list) -> list:
+    """
+    Découpe les appels en lots exécutables l'un après l'autre, en gardant leurs positions d'origine.
+    Les lectures consécutives forment un lot exécuté en parallèle ; chaque écriture forme un lot à elle seule,
+    ce qui garde l'ordre des écritures et garantit qu'une lecture demandée après une écriture la voit.
+    """
+    lots = []
+    for index, (function_name, _) in enumerate(appels):
+        lecture = function_name in OUTILS_LECTURE_SEULE
+        if lecture and lots and lots[-1][0]:
+            lots[-1][1].append(index)
+        else:
+            lots.append((lecture, [index]))
+    return [indices for _, indices in lots]
+
+async def _appel_protege_async(function_name: str, args: dict, identifiant_requete: str = None) -> dict:
+    try:
+        cle = cle_idempotence(identifiant_requete, function_name, args)
+        resultat = resultat_enregistre(cle)
+        if resultat is None:
+            resultat = await _appeler_outil_async(function_name, arguments_avec_identifiant(function_name, args, cle))
+            await asyncio.to_thread(enregistrer_resultat, cle, function_name, resultat)
+        return resultat
+    except Exception as e:
+        logger.error(f"🔥 ERREUR: L'exécution de la fonction '{function_name}' a échoué: {repr(e)}")
+        return {'erreur': repr(e)}
+
+def _reponses_directes(appels: list, compacteur: CompacteurReponses) -> dict:
+    """
+    Répond directement, sans exécuter d'outil, aux demandes adressées au routeur lui-même
+    (suite d'une liste coupée, demande d'autres outils) : {position: réponse}.
+    """
+    directes = {}
+    for i, (function_name, args) in enumerate(appels):
+        if function_name == OUTIL_SUITE_RESULTATS:
+            directes[i] = compacteur.lire_suite(**args) if "curseur" in args else {"erreur": "Paramètre 'curseur' manquant."}
+        elif function_name == OUTIL_AUTRES_OUTILS:
+            # Le routeur donne tous les outils au modèle juste après ce tour (voir _elargir_outils_si_demande).
+            directes[i] = {"succes": "Tous les outils sont maintenant disponibles. Continue la demande avec l'outil adapté."}
+    return directes
+
+def _parties_reponses(appels: list, reponses: list, directes: dict, compacteur: CompacteurReponses) -> list:
+    """Prépare les réponses pour Gemini : compactées, sauf les réponses directes du routeur (déjà compactes)."""
+    return [
+        _partie_reponse(function_name, reponse if i in directes else compacteur.compacter(function_name, reponse))
+        for i, ((function_name, _), reponse) in enumerate(zip(appels, reponses))
+    ]
+
+def _budget_epuise(echeance: Echeance) -> bool:
+    return echeance is not None and (echeance.annulee or echeance.restant() <= 0)
+
+def _reponse_non_executee(echeance: Echeance) -> dict:
+    motif = "requête annulée" if echeance.annulee else "délai de la requête dépassé"
+    return {'erreur': f"Non exécuté : {motif}."}
+
+def _identifiant_requete(echeance: Echeance):
+    return echeance.identifiant if echeance else None
+
+def _noter_ecritures(echeance: Echeance, appels: list, reponses: list, lot: list):
+    """Garde la trace des écritures réussies, pour pouvoir les citer dans une réponse partielle."""
+    if echeance is None:
+        return
+    echeance.noter_actions([
+        appels[i] for i in lot
+        if appels[i][0] not in OUTILS_LECTURE_SEULE and isinstance(reponses[i], dict) and "erreur" not in reponses[i]
+    ])
+
+async def _executer_appels_async(appels: list, compacteur: CompacteurReponses, echeance: Echeance = None) -> list:
+    """
+    Exécute les appels d'un tour et retourne les réponses dans l'ordre d'origine ; les lectures d'un même lot
+    sont lancées ensemble. Une fois l'échéance atteinte, les lots suivants ne sont pas lancés (Gemini reçoit une erreur).
+    Les lectures sont interrompues à l'échéance ou à l'annulation ; une écriture commencée va jusqu'au bout.
+    """
+    directes = _reponses_directes(appels, compacteur)
+    reponses = [directes.get(i) for i in range(len(appels))]
+    for lot in _lots_d_execution(appels):
+        lot = [i for i in lot if i not in directes]
+        if not lot:
+            continue
+        if _budget_epuise(echeance):
+            for i in lot:
+                reponses[i] = _reponse_non_executee(echeance)
+            continue
+        lecture = appels[lot[0]][0] in OUTILS_LECTURE_SEULE
+        if len(lot) > 1:
+            logger.info(f"⚡ ROUTEUR: Exécution en parallèle de {len(lot)} lectures: {[appels[i][0] for i in lot]}")
+        execution = asyncio.gather(*(_appel_protege_async(*appels[i], _identifiant_requete(echeance)) for i in lot))
+        if echeance is None or not lecture:
+            resultats = await execution
+        else:
+            try:
+                resultats = await echeance.attendre(execution, "lectures")
+            except RequeteInterrompue:
+                logger.warning(f"⏱️ ROUTEUR: Lectures {[appels[i][0] for i in lot]} abandonnées ({'annulation' if echeance.annulee else 'délai dépassé'}).")
+                resultats = [_reponse_non_executee(echeance)] * len(lot)
+        for i, resultat in zip(lot, resultats):
+            reponses[i] = resultat
+        _noter_ecritures(echeance, appels, reponses, lot)
+    return _parties_reponses(appels, reponses, directes, compacteur)
+
+# --- Réponse partielle (échéance atteinte, trop de tours d'outils ou annulation) ---
+
+CONSIGNE_REPONSE_PARTIELLE = (
+    "(Message du système, pas de l'utilisateur) Le temps alloué à cette demande est écoulé : n'utilise plus aucun outil. "
+    "Réponds maintenant à l'utilisateur avec ce que tu sais déjà : dis clairement ce qui a été fait, "
+    "ce qui n'a pas pu l'être, et propose de continuer s'il le souhaite."
+)
+# Pour la réponse partielle, Gemini n'a plus le droit d'appeler d'outils.
+SANS_OUTILS = {'function_calling_config': {'mode': 'NONE'}}
+
+def _modele_synthese(model, system_prompt: str):
+    """
+    Modèle pour la réponse partielle : configuré sans cache de contexte, car Gemini refuse
+    un 'tool_config' sur un modèle lu depuis le cache.
+    """
+    return _creer_modele(system_prompt, nom_modele=_nom_modele(model), noms_outils=_outils_du_modele(model), sans_cache=True)
+
+def _contenus_synthese(historique_pour_gemini: list) -> list:
+    return historique_pour_gemini + [{'role': 'user', 'parts': [CONSIGNE_REPONSE_PARTIELLE]}]
+
+def _texte_interruption(interruption: RequeteInterrompue, echeance: Echeance) -> str:
+    """Réponse de secours, sans appel à Gemini : ce qui s'est passé et les actions déjà effectuées."""
+    if interruption.motif == MOTIF_ANNULATION:
+        texte = "🛑 C'est annulé : j'ai arrêté de traiter ta demande."
+    else:
+        texte = "⏱️ Désolé, ta demande me prend trop de temps et je n'ai pas pu la terminer."
+    if echeance.actions:
+        actions = "\n".join(f"🔹 <code>{html.escape(nom)}</code>" for nom, _ in echeance.actions)
+        texte += f"\n\nCes actions ont déjà été effectuées :\n{actions}"
+    if interruption.motif != MOTIF_ANNULATION:
+        texte += "\n\nTu peux me la redemander, éventuellement en plusieurs étapes."
+    return texte
+
+def _journaliser_interruption(interruption: RequeteInterrompue, echeance: Echeance):
+    logger.warning(
+        f"⏱️ ROUTEUR: {interruption} après {echeance.ecoule():.1f} s et {echeance.tours} tours d'outils "
+        f"({len(echeance.actions)} écritures effectuées), réponse partielle."
+    )
+
+async def _reponse_partielle_async(interruption: RequeteInterrompue, model, system_prompt: str, historique_pour_gemini: list, echeance: Echeance) -> str:
+    """
+    Réponse au mieux quand la requête s'arrête avant la fin : Gemini rédige une synthèse sans outils
+    avec le temps gardé en réserve. En cas d'annulation, ou si la synthèse échoue, réponse de secours locale.
+    """
+    _journaliser_interruption(interruption, echeance)
+    if interruption.motif == MOTIF_ANNULATION or echeance.restant_total() <= DELAI_MIN_APPEL_SECONDES:
+        return _texte_interruption(interruption, echeance)
+    try:
+        appel = _modele_synthese(model, system_prompt).generate_content_async(
+            _contenus_synthese(historique_pour_gemini),
+            tool_config=SANS_OUTILS,
+            request_options={"timeout": echeance.restant_total()},
         )
+        texte = _texte_final(await echeance.attendre(appel, "réponse partielle", delai=echeance.restant_total()))
+        if texte:
+            return texte
+    except Exception as e:
+        logger.error(f"🔥 ROUTEUR: Réponse partielle impossible: {repr(e)}")
+    return _texte_interruption(interruption, echeance)
+
+async def router_requete_utilisateur_async(historique_conversation: list, contexte: str = None, sur_fragment=None, echeance: Echeance = None):
+    """
+    Gère la conversation avec Google Gemini (le "cerveau" de l'IA). Les appels à Gemini passent par le client
+    asynchrone et les outils ne bloquent jamais la boucle d'événements. Pendant ce temps, le bot
+    continue de recevoir les messages, de répondre aux autres conversations et d'exécuter ses tâches planifiées.
+    'contexte' est la partie variable du contexte (voir generer_contexte_dynamique).
+    Si 'sur_fragment' (coroutine) est fourni, la réponse textuelle est transmise au fur et à mesure
+    de sa génération : sur_fragment(texte reçu jusqu'ici) est appelé à chaque nouveau morceau.
+    'echeance' limite la durée et le nombre de tours d'outils de la requête et permet de l'annuler
+    (voir agent_echeances) ; une échéance par défaut est créée si elle n'est pas fournie.
+    """
+    logger.info("🧠 ROUTEUR (GEMINI): Nouvelle requête reçue, début de l'analyse.")
+    echeance = echeance or Echeance()
+    system_prompt, historique_pour_gemini = _preparer_conversation(historique_conversation, contexte)
+
+    try:
+        message = _dernier_message_utilisateur(historique_conversation)
+        niveau = choisir_niveau(message)
+        logger.info(f"🧠 ROUTEUR: Niveau de modèle choisi : {niveau} ({MODELES_PAR_NIVEAU[niveau]}).")
+        # Seuls les groupes d'outils utiles à la demande sont envoyés (tous si elle n'est pas reconnue).
+        noms_outils = choisir_outils(TOUS_LES_OUTILS, message, _derniere_reponse_assistant(historique_conversation))
+        model = await asyncio.to_thread(_modele_du_niveau, system_prompt, niveau, noms_outils)
         
-        # 3. Boucle de conversation avec l'IA
-        logger.debug(f"💬 HISTORIQUE POUR GEMINI (avant appel): {_log_history(historique_pour_gemini)}")
-        response = model.generate_content(historique_pour_gemini)
-        logger.debug(f"🤖 RÉPONSE BRUTE DE GEMINI: {response}")
-        
-        response_candidate = response.candidates[0]
-        while response_candidate.content.parts and response_candidate.content.parts[0].function_call:
-            # L'IA a demandé d'utiliser un ou plusieurs outils
-            function_calls_from_response = response_candidate.content.parts
-            
-            # On ajoute la demande de l'IA (le message 'model' avec le function_call) à notre historique
-            historique_pour_gemini.append(response_candidate.content)
-            
-            # On prépare la liste des réponses d'outils pour Gemini
-            tool_response_parts = []
-            
-            for part in function_calls_from_response:
-                function_call = part.function_call
-                function_name = function_call.name
-                args = dict(function_call.args)
-                
-                logger.info(f"🛠️ OUTIL (GEMINI): L'IA demande l'exécution de '{function_name}' avec les arguments: {args}")
-                
-                function_to_call = available_functions.get(function_name)
-                if function_to_call:
-                    try:
-                        # On exécute la fonction
-                        function_response_data = function_to_call(**args)
-                        
-                        # --- NOUVELLE LOGIQUE DE SYNCHRONISATION TÂCHE -> CALENDRIER ---
-                        if function_name in ["ajouter_tache", "modifier_tache"]:
-                            # On vérifie si la fonction a réussi et si une date est présente
-                            if "erreur" not in function_response_data and function_response_data.get("date_echeance"):
-                                tache_info = function_response_data
-                                event_id_existant = tache_info.get("google_calendar_event_id")
-
-                                # Cas 1: La tâche a été modifiée et avait déjà un événement
-                                if function_name == "modifier_tache" and event_id_existant:
-                                    logger.info(f"SYNCHRO: Mise à jour de l'événement existant '{event_id_existant}' pour la tâche '{tache_info['description']}'.")
-                                    modifier_evenement_calendrier(
-                                        event_id=event_id_existant,
-                                        nouveau_titre=tache_info['description'],
-                                        nouvelle_date_heure_debut=tache_info['date_echeance']
-                                    )
-                                # Cas 2: La tâche est nouvelle ou n'avait pas d'événement, on en crée un
-                                elif not event_id_existant:
-                                    logger.info(f"SYNCHRO: Création d'un nouvel événement pour la tâche '{tache_info['description']}'.")
-                                    reponse_creation_event = creer_evenement_calendrier(
-                                        titre=tache_info['description'],
-                                        date_heure_debut=tache_info['date_echeance']
-                                    )
-                                    # Si la création de l'événement a réussi, on lie les deux
-                                    if "erreur" not in reponse_creation_event and reponse_creation_event.get("event_id"):
-                                        lier_tache_a_evenement(
-                                            id_tache=tache_info['id'],
-                                            id_evenement=reponse_creation_event['event_id']
-                                        )
-
-                            # Cas 3: Une date d'échéance a été retirée d'une tâche
-                            elif "erreur" not in function_response_data and not function_response_data.get("date_echeance"):
-                                tache_info = function_response_data
-                                event_id_a_supprimer = tache_info.get("google_calendar_event_id")
-                                if function_name == "modifier_tache" and event_id_a_supprimer:
-                                    logger.info(f"SYNCHRO: Suppression de l'événement associé '{event_id_a_supprimer}' car la date a été retirée de la tâche.")
-                                    supprimer_evenement_calendrier(event_id=event_id_a_supprimer)
-                                    # On dé-lie l'événement de la tâche
-                                    lier_tache_a_evenement(id_tache=tache_info['id'], id_evenement=None)
-
-                        # --- LOGIQUE DE SUPPRESSION D'ÉVÉNEMENT LIÉ ---
-                        if function_name == "supprimer_tache" and "erreur" not in function_response_data:
-                            event_id_a_supprimer = function_response_data.get("google_calendar_event_id")
-                            if event_id_a_supprimer:
-                                logger.info(f"SYNCHRO: Suppression de l'événement de calendrier lié '{event_id_a_supprimer}' suite à la suppression de la tâche.")
-                                supprimer_evenement_calendrier(event_id=event_id_a_supprimer)
-                        
-                        # VÉRIFICATION CRUCIALE : L'API Gemini attend un dictionnaire (objet JSON) pour le champ "response".
-                        # Si notre fonction retourne une simple liste (ex: lister_taches), on doit l'encapsuler
-                        # dans un dictionnaire pour être conforme.
-                        if isinstance(function_response_data, list):
-                            function_response_data = {"resultats": function_response_data}
-
-                        # On prépare la réponse au format que Gemini attend (une part par réponse)
-                        tool_response_parts.append(
-                            {'function_response': {
-                                'name': function_name,
-                                'response': function_response_data
-                                }
-                            }
-                        )
-                    except Exception as e:
-                        logger.error(f"🔥 ERREUR: L'exécution de la fonction '{function_name}' a échoué: {repr(e)}")
-                        tool_response_parts.append(
-                            {'function_response': {
-                                'name': function_name,
-                                'response': {'erreur': repr(e)}
-                                }
-                            }
-                        )
-                else:
-                    logger.warning(f"⚠️ ATTENTION: L'IA a tenté d'appeler une fonction inconnue: {function_name}")
+        logger.debug("💬 HISTORIQUE POUR GEMINI (avant appel): %s", Charge(historique_pour_gemini))
+        try:
+            response, model, niveau = await _generer_niveau_async(niveau, model, system_prompt, historique_pour_gemini, sur_fragment, echeance)
+            logger.debug("🤖 RÉPONSE BRUTE DE GEMINI: %s", Charge(response))
             
-            # On ajoute une seule entrée 'tool' à l'historique avec toutes les réponses
-            if tool_response_parts:
-                logger.debug(f"🔙 RÉPONSES OUTILS POUR GEMINI: {_log_history(tool_response_parts)}")
-                historique_pour_gemini.append({'role': 'tool', 'parts': tool_response_parts})
-
-            # On renvoie les résultats à l'IA pour qu'elle puisse formuler une réponse finale
-            logger.info("🧠 ROUTEUR (GEMINI): Envoi des résultats des outils à Google Gemini pour la synthèse finale...")
-            logger.debug(f"💬 HISTORIQUE POUR GEMINI (avant 2e appel): {_log_history(historique_pour_gemini)}")
-            response = model.generate_content(historique_pour_gemini)
-            logger.debug(f"🤖 RÉPONSE BRUTE DE GEMINI (2e appel): {response}")
             response_candidate = response.candidates[0]
+            # Alias d'identifiants et suites de listes propres à cette requête
+            compacteur = CompacteurReponses()
+            tours_outils = 0
+            while _demande_outils(response_candidate):
+                echeance.compter_tour()
+                historique_pour_gemini.append(response_candidate.content)
+                appels = _extraire_appels(response_candidate.content.parts, compacteur)
+                tool_response_parts = await _executer_appels_async(appels, compacteur, echeance)
+                model = await asyncio.to_thread(_elargir_outils_si_demande, appels, model, system_prompt)
+                
+                if tool_response_parts:
+                    logger.debug("🔙 RÉPONSES OUTILS POUR GEMINI: %s", Charge(tool_response_parts))
+                    historique_pour_gemini.append({'role': 'tool', 'parts': tool_response_parts})
+
+                logger.info("🧠 ROUTEUR (GEMINI): Envoi des résultats des outils à Google Gemini pour la synthèse finale...")
+                logger.debug("💬 HISTORIQUE POUR GEMINI (avant 2e appel): %s", Charge(historique_pour_gemini))
+                tours_outils += 1
+                niveau, model = await asyncio.to_thread(_escalader_si_necessaire, niveau, model, system_prompt, tours_outils)
+                response, model, niveau = await _generer_niveau_async(niveau, model, system_prompt, historique_pour_gemini, sur_fragment, echeance)
+                logger.debug("🤖 RÉPONSE BRUTE DE GEMINI (2e appel): %s", Charge(response))
+                response_candidate = response.candidates[0]
 
-        # 5. Réponse finale de l'IA (après les outils, ou directement)
-        # On accède directement au texte, ce qui est plus sûr et évite les erreurs d'attributs
-        final_response_text = ""
-        if response.candidates and response.candidates[0].content.parts:
-            final_response_text = "".join(part.text for part in response.candidates[0].content.parts)
+            final_response_text = _texte_final(response)
+        except RequeteInterrompue as interruption:
+            final_response_text = await _reponse_partielle_async(interruption, model, system_prompt, historique_pour_gemini, echeance)
 
         logger.info("✅ ROUTEUR (GEMINI): Réponse finale générée et prête à être envoyée.")
-        
-        # On met à jour l'historique principal pour le prochain tour
-        # (c'est une simplification, le vrai historique est dans `historique_pour_gemini` mais on doit garder la structure)
         historique_conversation.append({"role": "assistant", "content": final_response_text})
-        
         return final_response_text
 
     except Exception as e:
         logger.error(f"🔥 ERREUR DÉTAILLÉE: L'appel à l'API Google Gemini a échoué: {repr(e)}", exc_info=True)
         return f"Désolé, une erreur de communication avec l'IA est survenue: {repr(e)}"
+
+def router_requete_utilisateur(historique_conversation: list, contexte: str = None, echeance: Echeance = None):
+    """
+    Version bloquante de router_requete_utilisateur_async (scripts, console), sans réception en flux.
+    Ne pas appeler depuis une boucle d'événements en cours.
+    """
+    return asyncio.run(router_requete_utilisateur_async(historique_conversation, contexte, echeance=echeance))
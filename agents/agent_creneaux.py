@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# Moteur de recherche de créneaux libres.
+# Plutôt que de laisser l'IA lire la liste des événements et deviner les trous dans l'agenda,
+# on calcule les disponibilités localement à partir du miroir du calendrier :
+# fusion des intervalles occupés (triés), puis soustraction aux heures de travail de chaque jour.
+# Tous les calculs se font sur des horodatages epoch UTC entiers ; seules les bornes des jours
+# de travail passent par le fuseau de Paris.
+# Le miroir ne couvre que JOURS_HORIZON_MIROIR jours : au-delà de son horizon, l'agenda est inconnu
+# (et non libre), la recherche s'arrête donc à l'horizon et le résultat le signale.
+
+import datetime
+import logging
+import pytz
+
+from .agent_calendrier import lire_evenements_miroir, lister_tous_les_calendriers, horizon_miroir
+from .agent_temps import maintenant_epoch, vers_iso
+
+logger = logging.getLogger(__name__)
+
+FUSEAU_HORAIRE = pytz.timezone("Europe/Paris")
+# Les débuts de créneaux sont arrondis au quart d'heure supérieur.
+PAS_MINUTES = 15
+
+def _fusionner_intervalles(intervalles: list) -> list:
+    """Fusionne une liste d'intervalles (debut, fin) qui se chevauchent ou se touchent."""
+    fusionnes = []
+    for debut, fin in sorted(intervalles):
+        if fusionnes and debut <= fusionnes[-1][1]:
+            if fin > fusionnes[-1][1]:
+                fusionnes[-1][1] = fin
+        else:
+            fusionnes.append([debut, fin])
+    return fusionnes
+
+def _arrondir_au_pas(moment: int) -> int:
+    """
+    Arrondit un horodatage au prochain multiple de PAS_MINUTES.
+    Le décalage de Paris étant un nombre entier d'heures, arrondir l'epoch revient à arrondir l'heure locale.
+    """
+    pas = PAS_MINUTES * 60
+    return -(-moment // pas) * pas
+
+def _epoch_locale(jour: datetime.date, heures: int) -> int:
+    """
+    Horodatage de 'jour' à 'heures' heures (heure de Paris, 24 accepté pour minuit le lendemain).
+    L'heure locale est construite avant d'appliquer le fuseau : les jours de changement d'heure
+    durent 23 ou 25 heures, ajouter des heures à minuit décalerait les bornes d'une heure.
+    """
+    jour += datetime.timedelta(days=heures // 24)
+    return int(FUSEAU_HORAIRE.localize(datetime.datetime.combine(jour, datetime.time(heures % 24))).timestamp())
+
+def calculer_creneaux_libres(occupes: list, debut_plage: int, jours: int, heure_debut: int, heure_fin: int, duree: int, nombre_creneaux: int, fin_plage: int = None) -> list:
+    """
+    Calcule les 'nombre_creneaux' premières fenêtres libres d'au moins 'duree' secondes,
+    jour par jour, dans les heures de travail [heure_debut, heure_fin[, sans dépasser 'fin_plage'.
+    'occupes' est une liste d'intervalles (debut, fin) en epochs UTC, 'debut_plage' et 'fin_plage' aussi.
+    """
+    occupes = _fusionner_intervalles(occupes)
+    creneaux = []
+    index = 0  # Les intervalles étant triés, on avance un seul curseur sur toute la plage.
+    jour = datetime.datetime.fromtimestamp(debut_plage, FUSEAU_HORAIRE).date()
+
+    for _ in range(jours):
+        ouverture = _epoch_locale(jour, heure_debut)
+        fermeture = _epoch_locale(jour, heure_fin)
+        jour += datetime.timedelta(days=1)
+        if fin_plage is not None:
+            if ouverture >= fin_plage:
+                break
+            fermeture = min(fermeture, fin_plage)
+
+        curseur = _arrondir_au_pas(max(ouverture, debut_plage))
+        while index < len(occupes) and occupes[index][1] <= curseur:
+            index += 1
+
+        i = index
+        while curseur < fermeture:
+            # Le prochain intervalle occupé (ou la fermeture) borne la fenêtre libre
+            if i < len(occupes) and occupes[i][0] < fermeture:
+                limite = max(occupes[i][0], curseur)
+            else:
+                limite = fermeture
+
+            if limite - curseur >= duree:
+                creneaux.append({
+                    "debut": vers_iso(curseur, FUSEAU_HORAIRE.zone),
+                    "fin": vers_iso(limite, FUSEAU_HORAIRE.zone),
+                    "duree_libre_minutes": (limite - curseur) // 60,
+                })
+                if len(creneaux) >= nombre_creneaux:
+                    return creneaux
+
+            if limite >= fermeture:
+                break
+            curseur = _arrondir_au_pas(max(curseur, occupes[i][1]))
+            i += 1
+
+    return creneaux
+
+def trouver_creneaux_libres(duree_minutes: int, jours: int = 7, heure_debut: int = 9, heure_fin: int = 18, nombre_creneaux: int = 5, date_debut: str = None, nom_calendrier: str = None) -> list:
+    """
+    Trouve les prochains créneaux libres d'au moins 'duree_minutes' minutes, sur 'jours' jours
+    à partir de 'date_debut' (aujourd'hui par défaut), entre 'heure_debut' et 'heure_fin'.
+    Les événements "disponibles" (transparents) et les événements sur la journée entière ne bloquent pas l'agenda.
+    Si la période dépasse l'horizon du miroir, la recherche s'arrête à l'horizon et une dernière entrée
+    {"note": ...} le signale.
+    """
+    logger.info(f"📅 CRÉNEAUX: Recherche de {nombre_creneaux} créneau(x) de {duree_minutes} min sur {jours} jour(s), entre {heure_debut}h et {heure_fin}h.")
+    try:
+        duree_minutes, jours, heure_debut, heure_fin, nombre_creneaux = int(duree_minutes), int(jours), int(heure_debut), int(heure_fin), int(nombre_creneaux)
+        if duree_minutes <= 0 or jours <= 0 or nombre_creneaux <= 0:
+            return [{"erreur": "La durée, le nombre de jours et le nombre de créneaux doivent être positifs."}]
+        if not 0 <= heure_debut < heure_fin <= 24:
+            return [{"erreur": "Les heures de travail doivent vérifier 0 <= heure_debut < heure_fin <= 24."}]
+
+        debut_plage = maintenant_epoch()
+        if date_debut:
+            jour_debut = datetime.date.fromisoformat(date_debut[:10])
+            debut_plage = max(debut_plage, _epoch_locale(jour_debut, 0))
+
+        calendriers = None
+        if nom_calendrier:
+            calendriers = [c for c in lister_tous_les_calendriers() if 'erreur' not in c and nom_calendrier.lower() in c['summary'].lower()]
+            if not calendriers:
+                return [{"erreur": f"Calendrier '{nom_calendrier}' non trouvé."}]
+
+        occupes = []
+        for event in lire_evenements_miroir(calendriers):
+            if event.get('transparency', 'opaque') == 'transparent' or 'dateTime' not in event.get('start', {}):
+                continue
+            debut, fin = event.get('debut_epoch'), event.get('fin_epoch')
+            if debut is not None and fin is not None and fin > debut_plage:
+                occupes.append((debut, fin))
+
+        # Au-delà de l'horizon du miroir, aucun événement n'est connu : ce ne sont pas des journées libres.
+        horizon = horizon_miroir(calendriers)
+        jour_debut = datetime.datetime.fromtimestamp(debut_plage, FUSEAU_HORAIRE).date()
+        fin_demandee = _epoch_locale(jour_debut + datetime.timedelta(days=jours - 1), heure_fin)
+        fin_plage = horizon if horizon is not None and horizon < fin_demandee else None
+
+        creneaux = calculer_creneaux_libres(occupes, debut_plage, jours, heure_debut, heure_fin, duree_minutes * 60, nombre_creneaux, fin_plage)
+        logger.info(f"✅ CRÉNEAUX: {len(creneaux)} créneau(x) libre(s) trouvé(s).")
+        if fin_plage is not None and len(creneaux) < nombre_creneaux:
+            limite = vers_iso(fin_plage, FUSEAU_HORAIRE.zone)
+            logger.info(f"📅 CRÉNEAUX: Recherche arrêtée à l'horizon du miroir ({limite}).")
+            creneaux.append({"note": f"L'agenda n'est connu que jusqu'au {limite} : aucun créneau n'a été cherché au-delà."})
+        return creneaux
+    except Exception as e:
+        logger.error(f"🔥 CRÉNEAUX: Erreur lors de la recherche de créneaux libres: {e}", exc_info=True)
+        return [{"erreur": str(e)}]
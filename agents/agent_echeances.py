@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+# Budget de temps et annulation d'une requête au routeur.
+# Sans limite, un modèle confus peut enchaîner les appels d'outils pendant des minutes.
+# Chaque requête reçoit donc une échéance :
+#   - un délai global, transmis à chaque appel à Gemini (timeout) et aux appels d'outils,
+#   - un nombre maximal de tours d'outils,
+#   - une annulation coopérative : annuler_requete(cle) arrête la requête à la prochaine étape
+#     (et, en mode asynchrone, interrompt tout de suite l'attente en cours).
+# Une partie du délai est réservée à la fin : quand le budget de travail est épuisé, le routeur s'en sert
+# pour demander à Gemini une réponse partielle avec ce qui a déjà été fait.
+
+import os
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import contextlib
+
+logger = logging.getLogger(__name__)
+
+# Durée maximale d'une requête, réponse partielle comprise (en secondes).
+DELAI_REQUETE_SECONDES = float(os.getenv("ROUTER_DEADLINE_SECONDS", "90"))
+# Nombre maximal d'allers-retours d'outils pour une requête.
+TOURS_OUTILS_MAX = int(os.getenv("ROUTER_MAX_TOOL_ROUNDS", "8"))
+# Temps gardé en réserve pour rédiger la réponse partielle (en secondes).
+RESERVE_SYNTHESE_SECONDES = 15.0
+# En dessous de ce temps restant, on ne lance plus de nouvel appel à Gemini (en secondes).
+DELAI_MIN_APPEL_SECONDES = 2.0
+
+MOTIF_DELAI = "délai"
+MOTIF_TOURS = "tours"
+MOTIF_ANNULATION = "annulation"
+
+# Requêtes en cours, par clé (l'identifiant du chat pour le bot) : {clé: Echeance}
+_requetes_en_cours = {}
+_requetes_lock = threading.Lock()
+
+
+class RequeteInterrompue(Exception):
+    """Levée quand une requête doit s'arrêter : délai dépassé, trop de tours d'outils ou annulation."""
+
+    def __init__(self, motif: str, etape: str = ""):
+        super().__init__(f"Requête interrompue ({motif}){f' pendant : {etape}' if etape else ''}")
+        self.motif = motif
+        self.etape = etape
+
+
+class Echeance:
+    """
+    Budget d'UNE requête au routeur. Une nouvelle échéance est créée pour chaque requête ;
+    elle garde aussi la liste des actions déjà effectuées, pour la réponse partielle.
+    """
+
+    def __init__(self, delai: float = None, tours_max: int = None, identifiant: str = None):
+        self.debut = time.monotonic()
+        # Identifiant de la requête (chat et message pour le bot) : base des clés d'idempotence des outils.
+        self.identifiant = identifiant or uuid.uuid4().hex
+        self.limite = self.debut + (delai if delai is not None else DELAI_REQUETE_SECONDES)
+        self.tours_max = tours_max if tours_max is not None else TOURS_OUTILS_MAX
+        self.tours = 0
+        # Outils exécutés pendant la requête (nom, arguments), dans l'ordre.
+        self.actions = []
+        self._annulee = threading.Event()
+        # Événement asyncio (et sa boucle) créé à la première attente asynchrone.
+        self._evenement = None
+        self._boucle = None
+
+    # --- Temps restant ---
+
+    def restant(self) -> float:
+        """Temps restant pour travailler (outils et appels à Gemini), réserve de synthèse déduite."""
+        return max(0.0, self.limite - RESERVE_SYNTHESE_SECONDES - time.monotonic())
+
+    def restant_total(self) -> float:
+        """Temps restant avant la limite absolue (pour la réponse partielle)."""
+        return max(0.0, self.limite - time.monotonic())
+
+    def ecoule(self) -> float:
+        return time.monotonic() - self.debut
+
+    def options_requete(self) -> dict:
+        """Options à transmettre à Gemini (request_options) pour qu'il abandonne à l'échéance."""
+        return {"timeout": max(self.restant(), DELAI_MIN_APPEL_SECONDES)}
+
+    # --- Annulation ---
+
+    @property
+    def annulee(self) -> bool:
+        return self._annulee.is_set()
+
+    def annuler(self):
+        """Demande l'arrêt de la requête (utilisable depuis n'importe quel thread)."""
+        self._annulee.set()
+        if self._evenement is not None:
+            self._boucle.call_soon_threadsafe(self._evenement.set)
+
+    # --- Points de contrôle ---
+
+    def verifier(self, etape: str = "", delai_min: float = 0.0):
+        """Lève RequeteInterrompue si la requête est annulée ou s'il reste moins de 'delai_min' secondes."""
+        if self.annulee:
+            raise RequeteInterrompue(MOTIF_ANNULATION, etape)
+        if self.restant() <= delai_min:
+            raise RequeteInterrompue(MOTIF_DELAI, etape)
+
+    def verifier_appel_gemini(self, etape: str = "appel à Gemini"):
+        self.verifier(etape, DELAI_MIN_APPEL_SECONDES)
+
+    def compter_tour(self):
+        """Compte un nouveau tour d'outils ; lève RequeteInterrompue si le maximum est déjà atteint."""
+        if self.tours >= self.tours_max:
+            raise RequeteInterrompue(MOTIF_TOURS, f"limite de {self.tours_max} tours d'outils")
+        self.tours += 1
+
+    def noter_actions(self, appels: list):
+        self.actions.extend(appels)
+
+    async def attendre(self, attente, etape: str = "", delai: float = None):
+        """
+        Attend 'attente' (coroutine ou future) au plus jusqu'à l'échéance (ou 'delai' secondes).
+        Une annulation interrompt l'attente immédiatement. Lève RequeteInterrompue dans ces deux cas.
+        """
+        if self._evenement is None:
+            self._boucle = asyncio.get_running_loop()
+            self._evenement = asyncio.Event()
+            if self.annulee:
+                self._evenement.set()
+        tache = asyncio.ensure_future(attente)
+        attente_annulation = asyncio.ensure_future(self._evenement.wait())
+        try:
+            termines, _ = await asyncio.wait(
+                {tache, attente_annulation},
+                timeout=self.restant() if delai is None else delai,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        except asyncio.CancelledError:
+            tache.cancel()
+            raise
+        finally:
+            attente_annulation.cancel()
+        if tache in termines:
+            return tache.result()
+        tache.cancel()
+        raise RequeteInterrompue(MOTIF_ANNULATION if self.annulee else MOTIF_DELAI, etape)
+
+
+# --- Registre des requêtes en cours (pour l'annulation depuis le bot) ---
+
+@contextlib.contextmanager
+def suivre_requete(cle, echeance: Echeance):
+    """Rend la requête annulable avec annuler_requete(cle) pendant la durée du bloc."""
+    with _requetes_lock:
+        _requetes_en_cours[cle] = echeance
+    try:
+        yield echeance
+    finally:
+        with _requetes_lock:
+            if _requetes_en_cours.get(cle) is echeance:
+                del _requetes_en_cours[cle]
+
+def annuler_requete(cle) -> bool:
+    """Annule la requête en cours pour cette clé. Retourne False s'il n'y en a pas."""
+    with _requetes_lock:
+        echeance = _requetes_en_cours.get(cle)
+    if echeance is None:
+        return False
+    logger.info(f"🛑 ROUTEUR: Annulation demandée pour la requête '{cle}' (après {echeance.ecoule():.1f} s).")
+    echeance.annuler()
+    return True
@@ -0,0 +1,508 @@
+# -*- coding: utf-8 -*-
+
+# Faux serveur Google Calendar (API v3), entièrement local.
+# Il implémente les points d'accès dont se servent agent_calendrier, agent_calendrier_async et
+# agent_notifications_calendrier : liste des calendriers, événements (list avec syncToken, get,
+# insert, update, patch, move, delete, watch), calendriers (insert, patch, delete) et channels.stop.
+# On peut régler une latence artificielle et injecter des erreurs (aléatoires ou programmées)
+# pour tester les réessais, le disjoncteur et mesurer les performances sans Internet.
+#
+# L'état initial peut être chargé depuis une "fixture" JSON, éventuellement enregistrée
+# depuis le vrai compte Google avec `enregistrer_fixture()`.
+#
+# Le masque 'fields' est accepté mais ignoré : les ressources sont toujours renvoyées entières.
+#
+# Usage :
+#   python -m agents.agent_faux_calendrier servir [fixture.json] [port]
+#   python -m agents.agent_faux_calendrier enregistrer fixture.json
+#   python -m agents.agent_faux_calendrier mesurer [nb_calendriers] [nb_evenements] [latence_ms]
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+import datetime
+import threading
+from urllib.parse import urlparse, parse_qs, unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytz
+from dateutil import parser
+
+logger = logging.getLogger(__name__)
+
+PREFIXE_API = "/calendar/v3"
+# Nombre d'événements par page quand 'maxResults' n'est pas précisé (comme Google).
+TAILLE_PAGE_DEFAUT = 250
+
+# Réglages par défaut, surchargeables par variables d'environnement.
+LATENCE_MS = float(os.getenv("CALENDAR_FAKE_LATENCY_MS", "0"))
+TAUX_ERREUR = float(os.getenv("CALENDAR_FAKE_ERROR_RATE", "0"))
+
+_serveur_actif = None
+
+
+class _ErreurApi(Exception):
+    """Erreur renvoyée au client au format JSON de Google."""
+
+    def __init__(self, statut: int, message: str, raison: str = None, retry_after: int = None):
+        super().__init__(message)
+        self.statut = statut
+        self.message = message
+        self.retry_after = retry_after
+        self.raison = raison or {400: "badRequest", 403: "forbidden", 404: "notFound", 409: "duplicate", 410: "deleted"}.get(statut, "backendError")
+
+
+def _fin_evenement(event: dict, borne: str = 'end') -> datetime.datetime:
+    """Heure de fin (ou de début, avec borne='start') d'un événement, en datetime "aware" (UTC si aucun fuseau)."""
+    valeur = event.get(borne, {}).get('dateTime', event.get(borne, {}).get('date'))
+    if not valeur:
+        return None
+    heure = parser.isoparse(valeur)
+    return heure if heure.tzinfo else pytz.utc.localize(heure)
+
+
+class FauxServeurCalendrier:
+    """
+    Serveur HTTP local imitant l'API Google Calendar v3.
+    L'état est gardé en mémoire : {calendar_id: {"id", "summary", "accessRole", "primary", "evenements": {event_id: event}}}.
+    Chaque modification d'événement reçoit un numéro de version, qui sert de syncToken.
+    """
+
+    def __init__(self, fixture: dict = None, latence_ms: float = LATENCE_MS, taux_erreur: float = TAUX_ERREUR):
+        self.latence_ms = latence_ms
+        self.taux_erreur = taux_erreur
+        self.calendriers = {}
+        self.version = 0
+        # Les syncTokens antérieurs à cette version sont refusés (410), pour simuler leur expiration.
+        self.version_minimale = 0
+        self.erreurs_programmees = []
+        self.nombre_requetes = 0
+        self.lock = threading.RLock()
+        self._httpd = None
+        if fixture:
+            self.charger_fixture(fixture)
+        else:
+            self.ajouter_calendrier("primary", "Principal", primary=True)
+
+    # --- Démarrage ---
+
+    @property
+    def url(self) -> str:
+        """Adresse de base à donner aux clients (équivalent de https://www.googleapis.com/calendar/v3)."""
+        hote, port = self._httpd.server_address[:2]
+        return f"http://{hote}:{port}{PREFIXE_API}"
+
+    def demarrer(self, port: int = 0) -> "FauxServeurCalendrier":
+        """Démarre le serveur dans un thread (port 0 = port libre choisi par le système)."""
+        serveur = self
+
+        class _Gestionnaire(_GestionnaireRequetes):
+            faux_serveur = serveur
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', port), _Gestionnaire)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True, name="faux-calendrier").start()
+        logger.info(f"🧪 FAUX CALENDRIER: Serveur démarré sur {self.url}.")
+        return self
+
+    def arreter(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    # --- Données ---
+
+    def charger_fixture(self, fixture: dict):
+        """Remplace l'état par celui d'une fixture : {"calendriers": [{"id", "summary", "accessRole", "primary", "evenements": [...]}]}."""
+        with self.lock:
+            self.calendriers = {}
+            for calendrier in fixture.get("calendriers", []):
+                self.ajouter_calendrier(calendrier["id"], calendrier.get("summary", calendrier["id"]), calendrier.get("accessRole", "owner"), calendrier.get("primary", False))
+                for event in calendrier.get("evenements", []):
+                    self.ajouter_evenement(calendrier["id"], event)
+
+    def exporter_fixture(self) -> dict:
+        """Retourne l'état actuel au format fixture (les événements supprimés sont omis)."""
+        with self.lock:
+            return {"calendriers": [
+                {
+                    "id": c["id"], "summary": c["summary"], "accessRole": c["accessRole"], "primary": c["primary"],
+                    "evenements": [self._public(e) for e in c["evenements"].values() if e.get("status") != "cancelled"],
+                }
+                for c in self.calendriers.values()
+            ]}
+
+    def ajouter_calendrier(self, calendar_id: str, summary: str, access_role: str = "owner", primary: bool = False) -> dict:
+        with self.lock:
+            calendrier = {"id": calendar_id, "summary": summary, "accessRole": access_role, "primary": primary, "evenements": {}}
+            self.calendriers[calendar_id] = calendrier
+            return calendrier
+
+    def ajouter_evenement(self, calendar_id: str, event: dict) -> dict:
+        """Ajoute (ou remplace) directement un événement, sans passer par HTTP."""
+        with self.lock:
+            event = dict(event)
+            event.setdefault("id", uuid.uuid4().hex)
+            event.setdefault("status", "confirmed")
+            self._versionner(event)
+            self._calendrier(calendar_id)["evenements"][event["id"]] = event
+            return self._public(event)
+
+    def expirer_jetons_synchronisation(self):
+        """Invalide tous les syncTokens déjà distribués : la prochaine synchronisation recevra un 410."""
+        with self.lock:
+            self.version_minimale = self.version + 1
+            self.version += 1
+
+    # --- Injection d'erreurs ---
+
+    def programmer_erreurs(self, statut: int, nombre: int = 1, chemin_contient: str = None, retry_after: int = None):
+        """Les 'nombre' prochaines requêtes (dont le chemin contient 'chemin_contient') échoueront avec 'statut'."""
+        with self.lock:
+            for _ in range(nombre):
+                self.erreurs_programmees.append((statut, chemin_contient, retry_after))
+
+    def _erreur_injectee(self, chemin: str):
+        """Retourne (statut, retry_after) si la requête doit échouer, sinon None."""
+        with self.lock:
+            for i, (statut, filtre, retry_after) in enumerate(self.erreurs_programmees):
+                if filtre is None or filtre in chemin:
+                    del self.erreurs_programmees[i]
+                    return statut, retry_after
+        if self.taux_erreur and random.random() < self.taux_erreur:
+            return 503, None
+        return None
+
+    # --- Outils internes ---
+
+    def _versionner(self, event: dict):
+        self.version += 1
+        event["_version"] = self.version
+        event["updated"] = datetime.datetime.now(pytz.utc).isoformat()
+
+    @staticmethod
+    def _public(event: dict) -> dict:
+        return {k: v for k, v in event.items() if not k.startswith('_')}
+
+    def _calendrier(self, calendar_id: str) -> dict:
+        if calendar_id == "primary":
+            calendar_id = next((c["id"] for c in self.calendriers.values() if c["primary"]), calendar_id)
+        calendrier = self.calendriers.get(calendar_id)
+        if not calendrier:
+            raise _ErreurApi(404, "Not Found")
+        return calendrier
+
+    def _calendrier_modifiable(self, calendar_id: str) -> dict:
+        calendrier = self._calendrier(calendar_id)
+        if calendrier["accessRole"] not in ("writer", "owner"):
+            raise _ErreurApi(403, "You need to have writer access to this calendar.", "requiredAccessLevel")
+        return calendrier
+
+    def _evenement(self, calendrier: dict, event_id: str) -> dict:
+        event = calendrier["evenements"].get(event_id)
+        if not event:
+            raise _ErreurApi(404, "Not Found")
+        if event.get("status") == "cancelled":
+            raise _ErreurApi(410, "Resource has been deleted")
+        return event
+
+    # --- Points d'accès ---
+
+    def traiter(self, methode: str, segments: list, params: dict, corps: dict):
+        """Aiguille une requête vers le bon point d'accès. Retourne (statut, réponse JSON ou None)."""
+        with self.lock:
+            self.nombre_requetes += 1
+            if segments == ["users", "me", "calendarList"] and methode == "GET":
+                return 200, {"kind": "calendar#calendarList", "items": [
+                    {"id": c["id"], "summary": c["summary"], "accessRole": c["accessRole"], "primary": c["primary"]}
+                    for c in self.calendriers.values()
+                ]}
+            if segments == ["channels", "stop"] and methode == "POST":
+                return 204, None
+            if segments[:1] != ["calendars"]:
+                raise _ErreurApi(404, "Not Found")
+
+            if len(segments) == 1 and methode == "POST":
+                calendrier = self.ajouter_calendrier(f"{uuid.uuid4().hex}@group.calendar.google.com", corps.get("summary", ""))
+                return 200, {"id": calendrier["id"], "summary": calendrier["summary"]}
+            if len(segments) == 2:
+                calendrier = self._calendrier(segments[1])
+                if methode == "PATCH":
+                    self._calendrier_modifiable(segments[1])
+                    calendrier["summary"] = corps.get("summary", calendrier["summary"])
+                    return 200, {"id": calendrier["id"], "summary": calendrier["summary"]}
+                if methode == "DELETE":
+                    if calendrier["primary"]:
+                        raise _ErreurApi(400, "Cannot delete primary calendar.")
+                    self._calendrier_modifiable(segments[1])
+                    del self.calendriers[calendrier["id"]]
+                    return 204, None
+                raise _ErreurApi(405, "Method not allowed")
+
+            calendar_id, reste = segments[1], segments[3:]
+            if segments[2] != "events":
+                raise _ErreurApi(404, "Not Found")
+            if not reste:
+                if methode == "GET":
+                    return 200, self._lister_evenements(calendar_id, params)
+                if methode == "POST":
+                    return 200, self._inserer_evenement(calendar_id, corps)
+            elif reste == ["watch"] and methode == "POST":
+                self._calendrier(calendar_id)
+                return 200, {"kind": "api#channel", "id": corps.get("id"), "resourceId": uuid.uuid4().hex,
+                             "expiration": str(int((time.time() + int(corps.get("params", {}).get("ttl", 604800))) * 1000))}
+            elif len(reste) == 2 and reste[1] == "move" and methode == "POST":
+                return 200, self._deplacer_evenement(calendar_id, reste[0], params.get("destination"))
+            elif len(reste) == 1:
+                return self._evenement_unique(methode, calendar_id, reste[0], corps)
+            raise _ErreurApi(404, "Not Found")
+
+    def _lister_evenements(self, calendar_id: str, params: dict) -> dict:
+        calendrier = self._calendrier(calendar_id)
+        evenements = sorted(calendrier["evenements"].values(), key=lambda e: e["_version"])
+        sync_token = params.get("syncToken")
+        if sync_token:
+            if not sync_token.isdigit() or int(sync_token) < self.version_minimale:
+                raise _ErreurApi(410, "Sync token is no longer valid, a full sync is required.", "fullSyncRequired")
+            evenements = [e for e in evenements if e["_version"] > int(sync_token)]
+        else:
+            evenements = [e for e in evenements if e.get("status") != "cancelled"]
+            if params.get("timeMin"):
+                time_min = parser.isoparse(params["timeMin"])
+                evenements = [e for e in evenements if (_fin_evenement(e) or time_min) >= time_min]
+            if params.get("timeMax"):
+                time_max = parser.isoparse(params["timeMax"])
+                evenements = [e for e in evenements if (_fin_evenement(e, 'start') or time_max) < time_max]
+
+        debut = int(params.get("pageToken") or 0)
+        taille = int(params.get("maxResults") or TAILLE_PAGE_DEFAUT)
+        page = evenements[debut:debut + taille]
+        reponse = {"kind": "calendar#events", "items": [self._public(e) for e in page]}
+        if debut + taille < len(evenements):
+            reponse["nextPageToken"] = str(debut + taille)
+        else:
+            reponse["nextSyncToken"] = str(self.version)
+        return reponse
+
+    def _inserer_evenement(self, calendar_id: str, corps: dict) -> dict:
+        calendrier = self._calendrier_modifiable(calendar_id)
+        event_id = corps.get("id")
+        if event_id and event_id in calendrier["evenements"]:
+            raise _ErreurApi(409, "The requested identifier already exists.")
+        return self.ajouter_evenement(calendrier["id"], corps)
+
+    def _deplacer_evenement(self, calendar_id: str, event_id: str, destination: str) -> dict:
+        source = self._calendrier_modifiable(calendar_id)
+        cible = self._calendrier_modifiable(destination)
+        event = self._evenement(source, event_id)
+        # L'ancien calendrier voit une suppression, le nouveau un ajout (comme chez Google)
+        nouvel_event = dict(event)
+        event.clear()
+        event.update({"id": event_id, "status": "cancelled", "start": nouvel_event.get("start"), "end": nouvel_event.get("end")})
+        self._versionner(event)
+        return self.ajouter_evenement(cible["id"], nouvel_event)
+
+    def _evenement_unique(self, methode: str, calendar_id: str, event_id: str, corps: dict):
+        if methode == "GET":
+            return 200, self._public(self._evenement(self._calendrier(calendar_id), event_id))
+        calendrier = self._calendrier_modifiable(calendar_id)
+        event = self._evenement(calendrier, event_id)
+        if methode == "PUT":
+            event.clear()
+            event.update(corps, id=event_id, status=corps.get("status", "confirmed"))
+        elif methode == "PATCH":
+            event.update(corps, id=event_id)
+        elif methode == "DELETE":
+            event["status"] = "cancelled"
+        else:
+            raise _ErreurApi(405, "Method not allowed")
+        self._versionner(event)
+        return (204, None) if methode == "DELETE" else (200, self._public(event))
+
+
+class _GestionnaireRequetes(BaseHTTPRequestHandler):
+    """Traduit les requêtes HTTP en appels à FauxServeurCalendrier.traiter()."""
+
+    faux_serveur = None
+    protocol_version = "HTTP/1.1"
+
+    def _traiter(self):
+        serveur = self.faux_serveur
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        longueur = int(self.headers.get('Content-Length') or 0)
+        brut = self.rfile.read(longueur) if longueur else b''
+
+        if serveur.latence_ms:
+            # Latence variable (± 25 %) pour que les appels parallèles ne se terminent pas tous en même temps
+            time.sleep(serveur.latence_ms * random.uniform(0.75, 1.25) / 1000)
+
+        try:
+            erreur = serveur._erreur_injectee(url.path)
+            if erreur:
+                statut, retry_after = erreur
+                raison = "rateLimitExceeded" if statut in (403, 429) else "backendError"
+                raise _ErreurApi(statut, "Erreur injectée par le faux serveur.", raison, retry_after)
+            if not url.path.startswith(PREFIXE_API + "/"):
+                raise _ErreurApi(404, "Not Found")
+            segments = [unquote(s) for s in url.path[len(PREFIXE_API) + 1:].split('/') if s]
+            corps = json.loads(brut) if brut else {}
+            statut, reponse = serveur.traiter(self.command, segments, params, corps)
+            self._repondre(statut, reponse)
+        except _ErreurApi as e:
+            entetes = {"Retry-After": str(e.retry_after)} if e.retry_after else {}
+            self._repondre(e.statut, {"error": {"code": e.statut, "message": e.message, "errors": [{"reason": e.raison, "message": e.message}]}}, entetes)
+        except Exception as e:
+            logger.error(f"🔥 FAUX CALENDRIER: Erreur interne sur {self.command} {self.path}: {e}", exc_info=True)
+            self._repondre(500, {"error": {"code": 500, "message": str(e)}})
+
+    def _repondre(self, statut: int, reponse: dict, entetes: dict = None):
+        contenu = json.dumps(reponse).encode('utf-8') if reponse is not None else b''
+        self.send_response(statut)
+        for nom, valeur in (entetes or {}).items():
+            self.send_header(nom, valeur)
+        if contenu:
+            self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(contenu)))
+        self.end_headers()
+        self.wfile.write(contenu)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _traiter
+
+    def log_message(self, format, *args):
+        logger.debug("🧪 FAUX CALENDRIER (HTTP): " + format, *args)
+
+
+# --- Fonctions utilitaires ---
+
+def charger_fixture(chemin: str) -> dict:
+    with open(chemin, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def demarrer_faux_serveur(fixture=None, port: int = 0, **reglages) -> FauxServeurCalendrier:
+    """
+    Démarre (une seule fois) le faux serveur du processus. 'fixture' est un chemin de fichier
+    ou un dictionnaire déjà chargé. Les autres réglages (latence_ms, taux_erreur) sont transmis au serveur.
+    """
+    global _serveur_actif
+    if _serveur_actif is None:
+        if isinstance(fixture, str):
+            fixture = charger_fixture(fixture)
+        _serveur_actif = FauxServeurCalendrier(fixture, **reglages).demarrer(port)
+    return _serveur_actif
+
+def enregistrer_fixture(chemin: str) -> dict:
+    """
+    Enregistre une fixture à partir du vrai compte Google (calendriers et événements récents),
+    pour rejouer ensuite des scénarios réalistes hors ligne.
+    """
+    from . import agent_calendrier
+    from .agent_quota_calendrier import executer
+
+    service = agent_calendrier._construire_service()
+    time_min = datetime.datetime.now(pytz.utc) - datetime.timedelta(days=agent_calendrier.JOURS_HISTORIQUE_MIROIR)
+    fixture = {"calendriers": []}
+    for calendar in executer(service.calendarList().list(), "calendarList.list").get('items', []):
+        evenements = []
+        page_token = None
+        while True:
+            resultat = executer(service.events().list(calendarId=calendar['id'], singleEvents=True, timeMin=time_min.isoformat(), pageToken=page_token,
+                                                      fields="items(id,status,summary,start,end,transparency),nextPageToken"), "events.list")
+            evenements.extend(resultat.get('items', []))
+            page_token = resultat.get('nextPageToken')
+            if not page_token:
+                break
+        fixture["calendriers"].append({
+            "id": calendar['id'], "summary": calendar.get('summary', ''), "accessRole": calendar.get('accessRole', 'reader'),
+            "primary": calendar.get('primary', False), "evenements": evenements,
+        })
+    with open(chemin, 'w', encoding='utf-8') as f:
+        json.dump(fixture, f, indent=4, ensure_ascii=False)
+    logger.info(f"🧪 FAUX CALENDRIER: Fixture enregistrée dans '{chemin}' ({len(fixture['calendriers'])} calendrier(s)).")
+    return fixture
+
+def generer_fixture(nombre_calendriers: int = 5, evenements_par_calendrier: int = 200) -> dict:
+    """Génère une fixture synthétique (événements d'une heure répartis sur les 30 prochains jours)."""
+    maintenant = datetime.datetime.now(pytz.utc).replace(minute=0, second=0, microsecond=0)
+    calendriers = []
+    for i in range(nombre_calendriers):
+        evenements = []
+        for j in range(evenements_par_calendrier):
+            debut = maintenant + datetime.timedelta(hours=random.randint(-48, 30 * 24))
+            evenements.append({
+                "id": f"evt{i}x{j}", "summary": f"Événement {j} du calendrier {i}",
+                "start": {"dateTime": debut.isoformat()}, "end": {"dateTime": (debut + datetime.timedelta(hours=1)).isoformat()},
+            })
+        calendriers.append({"id": "primary" if i == 0 else f"cal{i}@group.calendar.google.com", "summary": f"Calendrier {i}",
+                            "accessRole": "owner", "primary": i == 0, "evenements": evenements})
+    return {"calendriers": calendriers}
+
+def mesurer(nombre_calendriers: int = 5, evenements_par_calendrier: int = 200, latence_ms: float = 50) -> dict:
+    """
+    Mesure, contre le faux serveur, la durée des chemins de lecture du calendrier :
+    synchronisation complète puis incrémentale, avec le client bloquant et le client asynchrone.
+    Le miroir est gardé en mémoire uniquement (rien n'est écrit dans memoire/), et le limiteur de
+    débit est neutralisé pour mesurer le code lui-même et non le quota.
+    """
+    from . import agent_calendrier, agent_calendrier_async, agent_quota_calendrier
+
+    serveur = FauxServeurCalendrier(generer_fixture(nombre_calendriers, evenements_par_calendrier), latence_ms=latence_ms).demarrer()
+    url_precedente = agent_calendrier.URL_API_CALENDRIER
+    sauvegarde_precedente = agent_calendrier._sauvegarder_miroir
+    agent_calendrier.utiliser_url_api(serveur.url)
+    agent_calendrier._sauvegarder_miroir = lambda: None
+    agent_calendrier_async._sauvegarder_miroir = lambda: None
+    seau_precedent = agent_quota_calendrier._seau
+    agent_quota_calendrier._seau = agent_quota_calendrier.SeauAJetons(debit=1e6, capacite=10**6)
+    resultats = {}
+    try:
+        for nom, lister in (
+            ("bloquant", lambda: agent_calendrier.lister_prochains_evenements(10)),
+            ("asynchrone", lambda: asyncio.run(_lister_async(agent_calendrier_async))),
+        ):
+            agent_calendrier._miroir = {}
+            for etape in ("complete", "incrementale"):
+                requetes_avant = serveur.nombre_requetes
+                debut = time.perf_counter()
+                lister()
+                resultats[f"{nom}_{etape}"] = {"secondes": round(time.perf_counter() - debut, 3), "requetes": serveur.nombre_requetes - requetes_avant}
+    finally:
+        agent_calendrier.utiliser_url_api(url_precedente)
+        agent_calendrier._sauvegarder_miroir = sauvegarde_precedente
+        agent_calendrier_async._sauvegarder_miroir = sauvegarde_precedente
+        agent_calendrier._miroir = None
+        agent_quota_calendrier._seau = seau_precedent
+        serveur.arreter()
+    return resultats
+
+async def _lister_async(module):
+    try:
+        return await module.lister_prochains_evenements_async(10)
+    finally:
+        await module.fermer_session()
+
+
+# Ce bloc s'exécute uniquement si on lance ce fichier directement.
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    commande = sys.argv[1] if len(sys.argv) > 1 else "servir"
+    if commande == "servir":
+        serveur = demarrer_faux_serveur(sys.argv[2] if len(sys.argv) > 2 else None, int(sys.argv[3]) if len(sys.argv) > 3 else 8090)
+        print(f"Faux serveur prêt : CALENDAR_API_URL={serveur.url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            serveur.arreter()
+    elif commande == "enregistrer" and len(sys.argv) > 2:
+        enregistrer_fixture(sys.argv[2])
+    elif commande == "mesurer":
+        print(json.dumps(mesurer(*(int(a) for a in sys.argv[2:5])), indent=2))
+    else:
+        print("Usage : python -m agents.agent_faux_calendrier [servir [fixture.json] [port] | enregistrer fixture.json | mesurer [calendriers] [evenements] [latence_ms]]")
+        sys.exit(1)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+# Choix des outils envoyés à Gemini pour chaque requête.
+# Les ~30 déclarations d'outils coûtent des tokens d'entrée à chaque appel et allongent le choix de l'outil.
+# Les outils sont rangés par groupes (tâches, sous-tâches, projets, événements, gestion des calendriers, mémoire) ;
+# des mots-clés du message (et de la dernière réponse de l'assistant, pour les "oui, vas-y") désignent
+# les groupes utiles, et seuls ceux-là sont envoyés, avec un petit socle commun.
+#   - Si aucun groupe n'est reconnu, on envoie tout : mieux vaut un appel plus cher qu'un outil manquant.
+#   - Le sous-ensemble contient toujours l'outil 'demander_autres_outils' : si l'IA en a besoin,
+#     le routeur lui redonne tous les outils pour la suite de la requête. Ces élargissements sont comptés.
+
+import os
+import re
+import logging
+import threading
+import unicodedata
+
+from .agent_reponses_outils import OUTIL_SUITE_RESULTATS
+
+logger = logging.getLogger(__name__)
+
+# Mettre TOOL_ROUTING=0 pour toujours envoyer tous les outils.
+CHOIX_OUTILS_ACTIF = os.getenv("TOOL_ROUTING", "1") != "0"
+
+OUTIL_AUTRES_OUTILS = "demander_autres_outils"
+DECLARATION_AUTRES_OUTILS = {
+    "name": OUTIL_AUTRES_OUTILS,
+    "description": "À appeler si l'outil dont tu as besoin n'est pas dans ta liste (tâches, sous-tâches, projets, "
+                   "calendrier, mémoire...). Tous les outils te seront alors donnés pour la suite de la demande.",
+}
+
+# Toujours envoyés : lectures les plus courantes et outils techniques du routeur.
+SOCLE = ("lister_taches", "lister_projets", OUTIL_SUITE_RESULTATS, OUTIL_AUTRES_OUTILS)
+
+GROUPES_OUTILS = {
+    "taches": (
+        "ajouter_tache", "modifier_tache", "changer_statut_tache", "supprimer_tache", "reorganiser_taches",
+        "lier_tache_a_evenement",
+    ),
+    "sous_taches": (
+        "ajouter_sous_tache", "lister_sous_taches", "modifier_sous_tache", "changer_statut_sous_tache", "supprimer_sous_tache",
+    ),
+    "projets": ("ajouter_projet", "modifier_projet", "supprimer_projet", "lister_tous_les_calendriers"),
+    "evenements": (
+        "lister_prochains_evenements", "creer_evenement_calendrier", "modifier_evenement_calendrier",
+        "supprimer_evenement_calendrier", "trouver_creneaux_libres", "lister_tous_les_calendriers",
+    ),
+    "calendriers": ("lister_tous_les_calendriers", "creer_calendrier", "renommer_calendrier", "supprimer_calendrier"),
+    "apprentissages": ("enregistrer_apprentissage", "consulter_apprentissage", "lister_apprentissages", "supprimer_apprentissage"),
+}
+
+# Mots-clés de chaque groupe (comparés sans accents, en minuscules).
+MOTS_CLES_GROUPES = {
+    "taches": re.compile(
+        r"tache|to ?do|a faire|termin|fini|priorit|urgent|importan|echeance|deadline|rappel|"
+        r"\bmarque|\bcoche|reorganis|en cours|liste"
+    ),
+    "sous_taches": re.compile(r"sous[- ]tache|etape|decoup|decompos|checklist|subdivis"),
+    "projets": re.compile(r"projet|objectif"),
+    "evenements": re.compile(
+        r"rdv|rendez|reunion|evenement|agenda|calendrier|creneau|dispo|planifi|programm|\bcale|bloque|"
+        r"aujourd'hui|demain|ce soir|matin|apres-midi|semaine|lundi|mardi|mercredi|jeudi|vendredi|samedi|dimanche|"
+        r"\b\d{1,2} ?h\b|\b\d{1,2}h\d{2}\b|heure|deplace|decale|annule|seance"
+    ),
+    "calendriers": re.compile(r"calendriers|(?:cree|ajoute|renomm|supprim|efface)\w* (?:un |le |mon |ce )?(?:nouveau )?calendrier"),
+    "apprentissages": re.compile(
+        r"souvien|retien|rappelle-toi|memori|memoire|oublie|note que|preference|prefere|habitude|\bappris|sais sur moi"
+    ),
+}
+# Groupes qui vont ensemble (une sous-tâche a toujours une tâche parente, une échéance crée un événement...).
+GROUPES_ASSOCIES = {
+    "sous_taches": ("taches",),
+}
+
+# Totaux depuis le démarrage.
+_statistiques = {"requetes": 0, "sous_ensembles": 0, "complets": 0, "elargissements": 0, "par_groupe": {}}
+_statistiques_lock = threading.Lock()
+
+
+def _normaliser(texte: str) -> str:
+    sans_accents = unicodedata.normalize("NFD", (texte or "").lower())
+    return "".join(c for c in sans_accents if unicodedata.category(c) != "Mn")
+
+def groupes_pour(message: str, derniere_reponse: str = None) -> set:
+    """Groupes d'outils désignés par le message (et par la dernière réponse de l'assistant)."""
+    textes = [_normaliser(message), _normaliser(derniere_reponse)]
+    groupes = {groupe for groupe, motif in MOTS_CLES_GROUPES.items() if any(motif.search(texte) for texte in textes if texte)}
+    for groupe in list(groupes):
+        groupes.update(GROUPES_ASSOCIES.get(groupe, ()))
+    return groupes
+
+def choisir_outils(tous_les_outils: tuple, message: str, derniere_reponse: str = None) -> tuple:
+    """
+    Retourne les noms des outils à envoyer à Gemini, dans l'ordre de 'tous_les_outils'
+    (l'ordre compte : chaque jeu d'outils a son propre cache de modèle et de contexte).
+    Retourne 'tous_les_outils' si aucun groupe n'est reconnu ou si le choix est désactivé.
+    """
+    groupes = groupes_pour(message, derniere_reponse) if CHOIX_OUTILS_ACTIF else set()
+    with _statistiques_lock:
+        _statistiques["requetes"] += 1
+        if not groupes:
+            _statistiques["complets"] += 1
+        else:
+            _statistiques["sous_ensembles"] += 1
+            for groupe in groupes:
+                _statistiques["par_groupe"][groupe] = _statistiques["par_groupe"].get(groupe, 0) + 1
+    if not groupes:
+        return tous_les_outils
+    retenus = set(SOCLE).union(*(GROUPES_OUTILS[groupe] for groupe in groupes))
+    noms_outils = tuple(nom for nom in tous_les_outils if nom in retenus) + (OUTIL_AUTRES_OUTILS,)
+    logger.info(f"🧰 ROUTEUR: Outils envoyés : groupes {sorted(groupes)} ({len(noms_outils)}/{len(tous_les_outils)} outils).")
+    return noms_outils
+
+def enregistrer_elargissement(noms_outils: tuple):
+    """Compte une requête pour laquelle le sous-ensemble d'outils n'a pas suffi."""
+    with _statistiques_lock:
+        _statistiques["elargissements"] += 1
+        taux = _statistiques["elargissements"] / max(_statistiques["sous_ensembles"], 1)
+    logger.warning(f"🧰 ROUTEUR: L'IA a demandé d'autres outils ({len(noms_outils)} envoyés), passage à la liste complète (taux d'élargissement: {taux:.0%}).")
+
+def statistiques_groupes_outils() -> dict:
+    """Requêtes avec un sous-ensemble ou tous les outils, groupes choisis et nombre d'élargissements (sous-ensemble insuffisant)."""
+    with _statistiques_lock:
+        stats = {cle: (dict(valeur) if isinstance(valeur, dict) else valeur) for cle, valeur in _statistiques.items()}
+    stats["taux_elargissement"] = round(stats["elargissements"] / stats["sous_ensembles"], 3) if stats["sous_ensembles"] else None
+    return stats
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+# Compaction des historiques de conversation.
+# Au lieu de couper brutalement le début d'une longue conversation, les anciens échanges sont résumés
+# dans un message de rôle "resume" placé juste après le prompt système ; les échanges récents restent mot pour mot.
+#   - Chaque chat dispose d'un budget de tokens (estimés) pour son historique.
+#   - Quand il est dépassé, la compaction est lancée en tâche de fond APRÈS l'envoi de la réponse :
+#     elle ne ralentit jamais le message en cours. Les messages arrivés pendant le résumé sont conservés.
+#   - Si le résumé échoue, on retombe sur l'ancienne coupe par nombre de messages.
+# Le routeur joint le résumé au premier message de l'utilisateur qui le suit (voir _preparer_conversation).
+
+import os
+import asyncio
+import logging
+
+import google.generativeai as genai
+
+from .agent_reponses_outils import estimer_tokens
+
+logger = logging.getLogger(__name__)
+
+# Budget de l'historique d'un chat (tokens estimés, hors prompt système).
+BUDGET_TOKENS_HISTORIQUE = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+# Part du budget réservée aux derniers échanges, gardés mot pour mot.
+PART_BUDGET_RECENTS = 0.5
+# Nombre minimal de tours récents (message de l'utilisateur + réponse) toujours gardés mot pour mot.
+TOURS_RECENTS_MIN = 2
+# Filet de sécurité si le résumé est impossible : nombre maximal de messages conservés.
+MESSAGES_MAX = 50
+# Modèle rapide et économique pour les résumés.
+MODELE_RESUME = os.getenv("HISTORY_SUMMARY_MODEL", "gemini-2.5-flash")
+TOKENS_MAX_RESUME = 800
+
+ROLE_RESUME = "resume"
+
+CONSIGNES_RESUME = """Tu résumes le début d'une conversation entre un utilisateur et son assistant d'organisation personnelle.
+Le résumé remplacera ces messages dans la mémoire de l'assistant : garde tout ce qui peut encore servir
+(décisions prises, préférences exprimées, tâches, projets, événements et dates évoqués, questions restées en suspens).
+Écris en français, de façon factuelle et concise, sous forme de liste. N'invente rien."""
+
+# Chats dont l'historique est en cours de compaction.
+_compactions_en_cours = set()
+# Références vers les tâches de fond (sinon elles pourraient être détruites avant la fin).
+_taches = set()
+# Mesures par chat : {chat_id: {"compactions": int, "tokens_resumes": int, "tokens_resume": int, "tokens_economises": int}}
+_statistiques = {}
+
+
+def _tokens_message(message: dict) -> int:
+    return estimer_tokens(message.get("content", ""))
+
+def tokens_historique(historique: list) -> int:
+    """Taille estimée de l'historique envoyé à chaque appel (hors prompt système)."""
+    return sum(_tokens_message(m) for m in historique if m.get("role") != "system")
+
+def historique_a_compacter(historique: list) -> bool:
+    """Indique si l'historique dépasse son budget de tokens."""
+    return tokens_historique(historique) > BUDGET_TOKENS_HISTORIQUE
+
+def _debut_partie_recente(historique: list) -> int:
+    """
+    Position du premier message gardé mot pour mot : les derniers échanges qui tiennent dans leur part
+    du budget (au moins TOURS_RECENTS_MIN tours), en commençant toujours sur un message de l'utilisateur.
+    """
+    budget = BUDGET_TOKENS_HISTORIQUE * PART_BUDGET_RECENTS
+    debut = len(historique)
+    tours, total = 0, 0
+    for i in range(len(historique) - 1, 0, -1):
+        message = historique[i]
+        if message.get("role") in ("system", ROLE_RESUME):
+            break
+        total += _tokens_message(message)
+        if message.get("role") == "user":
+            tours += 1
+            if tours > TOURS_RECENTS_MIN and total > budget:
+                break
+            debut = i
+    return debut
+
+def _transcrire(messages: list) -> str:
+    lignes = []
+    for message in messages:
+        if message.get("role") == ROLE_RESUME:
+            lignes.append(f"[Résumé précédent]\n{message['content']}")
+        else:
+            auteur = "Utilisateur" if message.get("role") == "user" else "Assistant"
+            lignes.append(f"{auteur} : {message.get('content', '')}")
+    return "\n\n".join(lignes)
+
+async def _resumer(messages: list) -> str:
+    """Demande le résumé des messages (et de l'éventuel résumé précédent) au modèle rapide."""
+    model = genai.GenerativeModel(model_name=MODELE_RESUME, system_instruction=CONSIGNES_RESUME)
+    response = await model.generate_content_async(
+        _transcrire(messages),
+        generation_config={"max_output_tokens": TOKENS_MAX_RESUME, "temperature": 0.2},
+    )
+    return response.text.strip()
+
+def _tronquer(historique: list):
+    """Ancienne méthode, en secours : ne garde que les MESSAGES_MAX derniers messages, en commençant sur un message de l'utilisateur."""
+    if len(historique) <= MESSAGES_MAX:
+        return
+    logger.info("🧠 MÉMOIRE: L'historique dépasse %d messages, nettoyage en cours...", MESSAGES_MAX)
+    entete = [m for m in historique[:2] if m.get("role") in ("system", ROLE_RESUME)]
+    messages_recents = historique[-MESSAGES_MAX:]
+    premier_index_sain = next((i for i, m in enumerate(messages_recents) if m.get("role") == "user"), 0)
+    historique[:] = entete + messages_recents[premier_index_sain:]
+
+async def compacter_historique(chat_id, historique: list):
+    """
+    Résume les anciens échanges de 'historique' (modifié sur place). Les messages ajoutés
+    pendant l'appel au modèle sont conservés : seuls les messages résumés sont remplacés.
+    """
+    debut = 1 if historique and historique[0].get("role") == "system" else 0
+    fin = _debut_partie_recente(historique)
+    a_resumer = historique[debut:fin]
+    if not any(m.get("role") != ROLE_RESUME for m in a_resumer):
+        _tronquer(historique)
+        return
+
+    tokens_avant = tokens_historique(historique)
+    try:
+        resume = await _resumer(a_resumer)
+    except Exception as e:
+        logger.error(f"🔥 MÉMOIRE: Résumé de l'historique du chat {chat_id} impossible, coupe simple à la place: {repr(e)}")
+        _tronquer(historique)
+        return
+
+    # Pendant le résumé, de nouveaux messages ont pu être ajoutés à la fin (jamais au début) :
+    # on vérifie que les messages résumés sont toujours là avant de les remplacer.
+    if historique[debut:fin] != a_resumer:
+        logger.warning(f"⚠️ MÉMOIRE: L'historique du chat {chat_id} a changé pendant le résumé, compaction abandonnée.")
+        return
+
+    ancien = a_resumer[0] if a_resumer[0].get("role") == ROLE_RESUME else None
+    message_resume = {"role": ROLE_RESUME, "content": resume}
+    historique[debut:fin] = [message_resume]
+
+    stats = _statistiques.setdefault(chat_id, {"compactions": 0, "tokens_resumes": 0, "tokens_resume": 0, "tokens_economises": 0})
+    stats["compactions"] += 1
+    # Tokens d'origine représentés par le résumé (y compris ceux des résumés précédents).
+    stats["tokens_resumes"] += sum(_tokens_message(m) for m in a_resumer if m is not ancien)
+    stats["tokens_resume"] = _tokens_message(message_resume)
+    logger.info(
+        f"🧠 MÉMOIRE: Historique du chat {chat_id} compacté : {len(a_resumer)} messages résumés, "
+        f"~{tokens_avant} → ~{tokens_historique(historique)} tokens."
+    )
+
+def lancer_compaction(chat_id, historique: list):
+    """Lance la compaction en tâche de fond si l'historique dépasse son budget (une seule à la fois par chat)."""
+    if chat_id in _compactions_en_cours or not historique_a_compacter(historique):
+        return
+
+    async def compacter():
+        try:
+            await compacter_historique(chat_id, historique)
+        finally:
+            _compactions_en_cours.discard(chat_id)
+
+    _compactions_en_cours.add(chat_id)
+    tache = asyncio.create_task(compacter())
+    _taches.add(tache)
+    tache.add_done_callback(_taches.discard)
+
+def noter_requete(chat_id):
+    """Compte, pour une requête du chat, les tokens épargnés grâce au résumé (par rapport à l'historique complet)."""
+    stats = _statistiques.get(chat_id)
+    if stats:
+        stats["tokens_economises"] += max(0, stats["tokens_resumes"] - stats["tokens_resume"])
+
+def statistiques_historiques() -> dict:
+    """Mesures par chat : nombre de compactions et tokens épargnés sur l'ensemble des requêtes."""
+    return {chat_id: dict(stats) for chat_id, stats in _statistiques.items()}
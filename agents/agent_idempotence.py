@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+# Idempotence des actions de l'IA.
+# Quand Gemini répète un appel d'outil (nouvel essai après une erreur, passage à un autre niveau de modèle,
+# appel en double dans la même réponse), ajouter_tache ou creer_evenement_calendrier créaient un doublon,
+# qu'il fallait ensuite retrouver et supprimer (appels à Google et tours de modèle en plus).
+# Maintenant, chaque écriture concernée reçoit une clé déterministe calculée à partir de la requête
+# (chat et message Telegram), de l'outil et de ses arguments :
+#   - le premier résultat réussi est enregistré sous cette clé (memoire/idempotence.json, expiration
+#     après DUREE_IDEMPOTENCE_SECONDES) ; un appel répété le reçoit aussitôt, sans rien refaire,
+#   - pour les événements, la clé donne aussi l'identifiant de l'événement envoyé à Google : même si
+#     la table a été perdue, Google refuse de créer l'événement une seconde fois.
+# La même demande dans un autre message reste une nouvelle action (la clé change).
+
+import os
+import copy
+import json
+import time
+import hashlib
+import logging
+import threading
+
+from .agent_memoire import lire_donnees_json, ecrire_donnees_json
+from .agent_calendrier import identifiant_evenement
+
+logger = logging.getLogger(__name__)
+
+NOM_FICHIER_IDEMPOTENCE = 'idempotence.json'
+# Durée de conservation des résultats (24 heures par défaut).
+DUREE_IDEMPOTENCE_SECONDES = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24")) * 3600
+# Nombre maximal de résultats conservés (les plus anciens sont retirés en premier).
+TAILLE_MAX_TABLE = 500
+
+# Créations, dont la répétition ferait un doublon. Les modifications ne sont pas concernées : dans une même
+# requête, A -> B -> A est légitime, et renvoyer le résultat du premier appel laisserait la valeur B.
+OUTILS_IDEMPOTENTS = ("ajouter_tache", "ajouter_sous_tache", "creer_evenement_calendrier")
+# Outils qui acceptent un identifiant choisi par le bot pour l'objet créé.
+OUTILS_IDENTIFIANT_CLIENT = {"creer_evenement_calendrier": ("event_id", identifiant_evenement)}
+
+# {clé: {"outil": str, "resultat": dict, "expire_le": epoch}}, chargée au premier usage.
+_table = None
+_lock = threading.Lock()
+_statistiques = {"executions": 0, "repetitions": 0}
+
+
+def cle_idempotence(identifiant_requete: str, function_name: str, args: dict):
+    """Clé d'un appel d'outil dans une requête, ou None si l'outil n'est pas concerné."""
+    if not identifiant_requete or function_name not in OUTILS_IDEMPOTENTS:
+        return None
+    contenu = json.dumps([identifiant_requete, function_name, args], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(contenu.encode('utf-8')).hexdigest()
+
+def arguments_avec_identifiant(function_name: str, args: dict, cle) -> dict:
+    """Ajoute aux arguments l'identifiant (déterminé par la clé) de l'objet à créer, si l'outil l'accepte."""
+    if cle is None or function_name not in OUTILS_IDENTIFIANT_CLIENT:
+        return args
+    parametre, fabrique = OUTILS_IDENTIFIANT_CLIENT[function_name]
+    return {**args, parametre: fabrique(cle)}
+
+def _charger():
+    """Table en mémoire (appelé sous le verrou), sans les entrées expirées."""
+    global _table
+    if _table is None:
+        donnees = lire_donnees_json(NOM_FICHIER_IDEMPOTENCE)
+        _table = donnees if isinstance(donnees, dict) else {}
+    maintenant = time.time()
+    for cle in [cle for cle, entree in _table.items() if entree["expire_le"] <= maintenant]:
+        del _table[cle]
+    return _table
+
+def resultat_enregistre(cle):
+    """Retourne une copie du résultat déjà obtenu pour cette clé, ou None."""
+    if cle is None:
+        return None
+    with _lock:
+        entree = _charger().get(cle)
+        if entree is None:
+            _statistiques["executions"] += 1
+            return None
+        _statistiques["repetitions"] += 1
+    logger.info(f"♻️ ROUTEUR: Appel répété de '{entree['outil']}' dans la même requête, résultat d'origine renvoyé.")
+    return copy.deepcopy(entree["resultat"])
+
+def enregistrer_resultat(cle, function_name: str, resultat):
+    """Enregistre le résultat d'une écriture réussie (les erreurs ne sont pas enregistrées : l'appel pourra être refait)."""
+    if cle is None or not isinstance(resultat, dict) or "erreur" in resultat:
+        return
+    with _lock:
+        table = _charger()
+        table[cle] = {"outil": function_name, "resultat": copy.deepcopy(resultat), "expire_le": time.time() + DUREE_IDEMPOTENCE_SECONDES}
+        while len(table) > TAILLE_MAX_TABLE:
+            del table[min(table, key=lambda c: table[c]["expire_le"])]
+        ecrire_donnees_json(NOM_FICHIER_IDEMPOTENCE, table)
+
+def statistiques_idempotence() -> dict:
+    """Écritures exécutées et appels répétés auxquels le résultat d'origine a été renvoyé."""
+    with _lock:
+        return dict(_statistiques)
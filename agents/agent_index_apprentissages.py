@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+# Sélection des leçons apprises à joindre au contexte de l'IA.
+# Avant, toutes les paires clé-valeur d'apprentissages.json étaient recopiées dans chaque contexte :
+# plus l'assistant apprenait, plus chaque message coûtait cher. Maintenant :
+#   - les informations épinglées (voir agent_apprentissage) sont toujours incluses,
+#   - parmi les autres, seules les APPRENTISSAGES_MAX plus pertinentes pour le message en cours
+#     et les derniers échanges de la conversation sont retenues.
+# La pertinence est calculée par un index lexical (BM25 sur les mots des clés et des valeurs, sans accents),
+# reconstruit quand les apprentissages changent.
+
+import os
+import re
+import math
+import logging
+import threading
+import unicodedata
+from collections import Counter
+
+from .agent_reponses_outils import estimer_tokens
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximal d'informations non épinglées jointes au contexte.
+APPRENTISSAGES_MAX = int(os.getenv("LEARNINGS_TOP_K", "8"))
+# Nombre de messages précédents de la conversation pris en compte, et leur poids par rapport au message en cours.
+MESSAGES_CONVERSATION = 4
+POIDS_CONVERSATION = 0.5
+
+MOTS_VIDES = frozenset("""
+    les des une pour par avec sans dans sur sous vers chez que qui quoi quand comment est sont etre avoir fait
+    faire mon mes ton tes son ses notre nos votre vos leur leurs ce cet cette ces ceci cela elle ils elles nous
+    vous moi toi lui pas plus moins tres tout tous toute toutes aussi mais donc car alors comme peux peut veux
+    bien encore deja ici oui non merci stp svp
+""".split())
+
+# Index en service : (versions des données indexées, index) ; mesures de taille du contexte.
+_index = None
+_index_lock = threading.Lock()
+_statistiques = {"selections": 0, "tokens_avant": 0, "tokens_apres": 0}
+
+
+def _normaliser(texte: str) -> str:
+    sans_accents = unicodedata.normalize("NFD", str(texte).lower())
+    return "".join(c for c in sans_accents if unicodedata.category(c) != "Mn")
+
+def mots(texte: str) -> list:
+    """Mots significatifs d'un texte, sans accents ni mots vides, réduits à leur racine approximative."""
+    return [mot[:7] for mot in re.findall(r"[a-z0-9]+", _normaliser(texte)) if len(mot) > 2 and mot not in MOTS_VIDES]
+
+
+class IndexLexical:
+    """
+    Index BM25 des leçons apprises, construit à partir du dictionnaire {clé: valeur} complet :
+    mots de la clé (les '_' séparent les mots) et de la valeur de chaque information.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, apprentissages: dict):
+        self.apprentissages = apprentissages
+        self._documents = {cle: Counter(mots(cle.replace("_", " ")) + mots(valeur)) for cle, valeur in apprentissages.items()}
+        self._longueur_moyenne = (sum(sum(d.values()) for d in self._documents.values()) / len(self._documents)) if self._documents else 0
+        frequences = Counter(mot for document in self._documents.values() for mot in document)
+        total = len(self._documents)
+        self._idf = {mot: math.log(1 + (total - n + 0.5) / (n + 0.5)) for mot, n in frequences.items()}
+
+    def _score(self, document: Counter, termes: dict) -> float:
+        longueur = sum(document.values())
+        score = 0.0
+        for mot, poids in termes.items():
+            occurrences = document.get(mot)
+            if not occurrences:
+                continue
+            normalisation = self.K1 * (1 - self.B + self.B * longueur / (self._longueur_moyenne or 1))
+            score += poids * self._idf[mot] * occurrences * (self.K1 + 1) / (occurrences + normalisation)
+        return score
+
+    def rechercher(self, requete: dict, nombre: int) -> list:
+        """'requete' : {texte: poids}. Retourne au plus 'nombre' couples (clé, score > 0), du plus pertinent au moins pertinent."""
+        termes = Counter()
+        for texte, poids in requete.items():
+            for mot in mots(texte):
+                termes[mot] += poids
+        scores = [(cle, self._score(document, termes)) for cle, document in self._documents.items()]
+        scores = [(cle, score) for cle, score in scores if score > 0]
+        scores.sort(key=lambda element: element[1], reverse=True)
+        return scores[:nombre]
+
+
+def _obtenir_index(apprentissages: dict) -> IndexLexical:
+    """Index des apprentissages donnés, reconstruit seulement s'ils ont changé."""
+    global _index
+    with _index_lock:
+        if _index is None or _index[0] != apprentissages:
+            _index = (dict(apprentissages), IndexLexical(apprentissages))
+            logger.debug(f"🔎 APPRENTISSAGE: Index reconstruit ({len(apprentissages)} informations).")
+        return _index[1]
+
+def requete_conversation(message: str, conversation: list = None) -> dict:
+    """Requête pondérée : le message en cours, puis les derniers échanges de la conversation (poids moindre)."""
+    requete = {message: 1.0} if message else {}
+    precedents = [m for m in (conversation or []) if m.get("role") in ("user", "assistant") and m.get("content") != message]
+    for precedent in precedents[-MESSAGES_CONVERSATION:]:
+        requete[precedent["content"]] = requete.get(precedent["content"], 0) + POIDS_CONVERSATION
+    return requete
+
+def _taille(apprentissages: dict) -> int:
+    return estimer_tokens("\n".join(f"- {cle}: {valeur}" for cle, valeur in apprentissages.items())) if apprentissages else 0
+
+def selectionner_apprentissages(apprentissages: dict, epingles: list, message: str = None, conversation: list = None) -> dict:
+    """
+    Retourne les apprentissages à joindre au contexte : les épinglés, puis les plus pertinents pour
+    le message et la conversation, dans cet ordre. Sans message, tout est retourné (ancien comportement).
+    """
+    if not apprentissages or message is None or len(apprentissages) <= APPRENTISSAGES_MAX:
+        selection = dict(apprentissages or {})
+    else:
+        selection = {cle: apprentissages[cle] for cle in epingles if cle in apprentissages}
+        for cle, _ in _obtenir_index(apprentissages).rechercher(requete_conversation(message, conversation), APPRENTISSAGES_MAX):
+            selection.setdefault(cle, apprentissages[cle])
+
+    avant, apres = _taille(apprentissages), _taille(selection)
+    with _index_lock:
+        _statistiques["selections"] += 1
+        _statistiques["tokens_avant"] += avant
+        _statistiques["tokens_apres"] += apres
+    if len(selection) < len(apprentissages or {}):
+        logger.info(f"🔎 APPRENTISSAGE: {len(selection)}/{len(apprentissages)} informations retenues pour le contexte (~{avant} → ~{apres} tokens).")
+    return selection
+
+def statistiques_selection() -> dict:
+    """Nombre de sélections et taille cumulée (tokens estimés) de la partie "apprentissages" du contexte, avant et après sélection."""
+    with _index_lock:
+        return dict(_statistiques)
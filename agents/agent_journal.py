@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+# Configuration des logs du bot.
+# Avant, le logger principal était réglé sur DEBUG, avec un fichier et la console écrits directement par
+# le thread qui journalise : chaque message attendait l'écriture sur disque, et l'historique complet
+# envoyé à Gemini (outils, réponses brutes) était converti en JSON indenté à chaque appel, même si
+# personne ne lisait les logs DEBUG. Maintenant :
+#   - les threads du bot déposent les enregistrements dans une file (QueueHandler) ; un thread dédié
+#     (QueueListener) les met en forme et les écrit dans le fichier et la console,
+#   - le niveau est réglable globalement (LOG_LEVEL) et par sous-système (LOG_LEVELS) : un message
+#     sous le niveau de son logger n'est même pas créé,
+#   - les données volumineuses sont passées en Charge(...) : converties en texte seulement si le niveau
+#     du message est actif (au moment de l'appel, l'objet peut changer ensuite), tronquées à TAILLE_MAX_CHARGE
+#     caractères ; le thread des logs ne fait plus que la mise en page et l'écriture,
+#   - LOG_FORMAT=json écrit une ligne JSON par message (avec les champs passés dans 'extra').
+
+import os
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+
+# Niveau par défaut de tous les loggers.
+NIVEAU_JOURNAL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Niveaux par sous-système, ex: "agents.agent_conseiller=DEBUG,telegram=WARNING".
+NIVEAUX_SOUS_SYSTEMES = os.getenv("LOG_LEVELS", "")
+# Sous-systèmes bavards calmés par défaut (la bibliothèque HTTP de Telegram journalise chaque requête).
+NIVEAUX_PAR_DEFAUT = {"httpx": "WARNING", "httpcore": "WARNING"}
+FORMAT_JOURNAL = os.getenv("LOG_FORMAT", "texte")
+# Taille maximale d'une donnée volumineuse dans les logs (en caractères).
+TAILLE_MAX_CHARGE = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "4000"))
+
+FICHIER_JOURNAL = 'bot.log'
+TAILLE_FICHIER_JOURNAL = 5 * 1024 * 1024
+ARCHIVES_JOURNAL = 3
+
+# Attributs présents sur tout enregistrement : les autres viennent de 'extra' (format JSON).
+_ATTRIBUTS_STANDARD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_ecouteur = None
+
+
+class Charge:
+    """
+    Donnée volumineuse à journaliser (historique, déclarations d'outils, réponse brute...).
+    Conversion en texte seulement si le message est émis, limitée à 'limite' caractères.
+    Ne coûte presque rien si le niveau est désactivé : l'objet n'est ni copié ni converti.
+    """
+
+    __slots__ = ("objet", "limite")
+
+    def __init__(self, objet, limite: int = None):
+        self.objet = objet
+        self.limite = limite or TAILLE_MAX_CHARGE
+
+    def _texte(self) -> str:
+        if isinstance(self.objet, (list, dict)):
+            try:
+                return json.dumps(self.objet, indent=2, ensure_ascii=False)
+            except TypeError:
+                # Objets non sérialisables (réponses de Gemini...) : on ne fait jamais planter le log.
+                return f"{len(self.objet)} éléments (certains objets ne sont pas sérialisables en JSON)."
+        return str(self.objet)
+
+    def __str__(self) -> str:
+        try:
+            texte = self._texte()
+        except Exception as e:
+            return f"<donnée illisible : {e!r}>"
+        if len(texte) > self.limite:
+            return f"{texte[:self.limite]}… ({len(texte) - self.limite} caractères de plus)"
+        return texte
+
+
+class _QueueHandlerTexte(logging.handlers.QueueHandler):
+    """
+    Met le message en texte dans le thread qui journalise (seulement pour les niveaux actifs), puis le dépose
+    dans la file : le texte correspond à l'état des données au moment de l'appel, et un message mal formé
+    est signalé ici (handleError, comme Handler.emit) au lieu d'atteindre le thread des logs.
+    La mise en page (date, niveau...) et l'écriture restent au thread des logs ; rien n'est sérialisé.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        for attribut, valeur in list(vars(record).items()):
+            if isinstance(valeur, Charge):
+                setattr(record, attribut, str(valeur))
+        return record
+
+
+class _EcouteurJournal(logging.handlers.QueueListener):
+    """
+    Thread des logs. QueueListener s'arrête définitivement à la première exception :
+    une erreur d'écriture est signalée (handleError) et le thread continue.
+    """
+
+    def handle(self, record):
+        for handler in self.handlers:
+            if record.levelno < handler.level:
+                continue
+            try:
+                handler.handle(record)
+            except Exception:
+                handler.handleError(record)
+
+
+class FormateurJson(logging.Formatter):
+    """Une ligne JSON par message : horodatage, niveau, logger, message et champs passés dans 'extra'."""
+
+    def format(self, record) -> str:
+        ligne = {
+            "horodatage": self.formatTime(record),
+            "niveau": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for attribut, valeur in vars(record).items():
+            if attribut not in _ATTRIBUTS_STANDARD:
+                ligne[attribut] = valeur
+        if record.exc_info:
+            ligne["exception"] = self.formatException(record.exc_info)
+        return json.dumps(ligne, ensure_ascii=False, default=str)
+
+
+def _niveaux_sous_systemes() -> dict:
+    niveaux = dict(NIVEAUX_PAR_DEFAUT)
+    for reglage in NIVEAUX_SOUS_SYSTEMES.split(","):
+        if "=" in reglage:
+            nom, niveau = reglage.split("=", 1)
+            niveaux[nom.strip()] = niveau.strip().upper()
+    return niveaux
+
+def configurer_journal():
+    """
+    Branche le logger principal sur la file des logs et démarre le thread d'écriture (fichier tournant
+    'bot.log' de 5 Mo, 3 archives, et console). Peut être rappelée : l'ancienne configuration est remplacée.
+    """
+    global _ecouteur
+    arreter_journal()
+
+    if FORMAT_JOURNAL == "json":
+        formatter = FormateurJson()
+    else:
+        # Format: DATE_HEURE - NOM_DU_FICHIER - NIVEAU_DE_CRITICITE - MESSAGE
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    file_handler = logging.handlers.RotatingFileHandler(
+        FICHIER_JOURNAL, maxBytes=TAILLE_FICHIER_JOURNAL, backupCount=ARCHIVES_JOURNAL, encoding='utf-8'
+    )
+    console_handler = logging.StreamHandler()
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+
+    file_attente = queue.SimpleQueue()
+    log_central = logging.getLogger()
+    # On retire les anciens handlers pour éviter les logs en double.
+    log_central.handlers.clear()
+    log_central.addHandler(_QueueHandlerTexte(file_attente))
+    log_central.setLevel(NIVEAU_JOURNAL)
+    for nom, niveau in _niveaux_sous_systemes().items():
+        logging.getLogger(nom).setLevel(niveau)
+
+    _ecouteur = _EcouteurJournal(file_attente, file_handler, console_handler, respect_handler_level=True)
+    _ecouteur.start()
+
+def arreter_journal():
+    """Écrit les messages encore en file puis arrête le thread des logs (appelée aussi à la sortie du programme)."""
+    global _ecouteur
+    if _ecouteur is not None:
+        _ecouteur.stop()
+        for handler in _ecouteur.handlers:
+            handler.close()
+        _ecouteur = None
+
+atexit.register(arreter_journal)
@@ -2,10 +2,50 @@
 
 import json
 import os
+import tempfile
+import functools
+import threading
 
 # Chemin vers le dossier où sont stockées les données.
 MEMOIRE_PATH = 'memoire'
 
+# Numéro de version de chaque magasin de données (un fichier JSON, ou un autre nom pour les données
+# qui ne sont pas stockées ici, comme la liste des calendriers). Il augmente à chaque modification :
+# un résultat calculé à partir d'une version donnée reste exact tant que ce numéro n'a pas changé.
+_versions = {}
+_versions_lock = threading.Lock()
+
+def version_donnees(nom_magasin) -> int:
+    """Retourne le numéro de version actuel d'un magasin de données."""
+    return _versions.get(nom_magasin, 0)
+
+def incrementer_version(nom_magasin):
+    """Signale une modification d'un magasin de données (invalide les résultats mémorisés qui en dépendent)."""
+    with _versions_lock:
+        _versions[nom_magasin] = _versions.get(nom_magasin, 0) + 1
+
+# Un verrou par fichier : les outils s'exécutent en parallèle (plusieurs conversations, superviseur,
+# boîte d'envoi), et chaque modification est une suite lecture -> modification -> écriture qui ne doit
+# pas être entrelacée avec une autre, sinon la dernière écriture efface les précédentes.
+# Verrous réentrants : une fonction qui tient le verrou peut en appeler une autre qui le prend aussi.
+_verrous_fichiers = {}
+_verrous_fichiers_lock = threading.Lock()
+
+def verrou_fichier(nom_fichier) -> threading.RLock:
+    """Verrou à tenir pendant toute lecture-modification-écriture d'un fichier du dossier memoire."""
+    with _verrous_fichiers_lock:
+        return _verrous_fichiers.setdefault(nom_fichier, threading.RLock())
+
+def sous_verrou(nom_fichier):
+    """Décorateur : exécute la fonction en tenant le verrou du fichier (voir verrou_fichier)."""
+    def decorateur(fonction):
+        @functools.wraps(fonction)
+        def envelopper(*args, **kwargs):
+            with verrou_fichier(nom_fichier):
+                return fonction(*args, **kwargs)
+        return envelopper
+    return decorateur
+
 def lire_donnees_json(nom_fichier):
     """
     Lit un fichier JSON depuis le dossier memoire et retourne son contenu.
@@ -27,16 +67,26 @@ def ecrire_donnees_json(nom_fichier, donnees):
     chemin_fichier = os.path.join(MEMOIRE_PATH, nom_fichier)
     # S'assure que le dossier memoire existe.
     os.makedirs(MEMOIRE_PATH, exist_ok=True)
-    with open(chemin_fichier, 'w', encoding='utf-8') as f:
-        # 'indent=4' pour que le fichier soit lisible par un humain.
-        # 'ensure_ascii=False' pour bien gérer les caractères spéciaux (accents, etc.).
-        json.dump(donnees, f, indent=4, ensure_ascii=False)
+    # On écrit dans un fichier temporaire puis on le met à la place de l'ancien (os.replace est atomique) :
+    # un lecteur voit l'ancien contenu ou le nouveau, jamais un fichier à moitié écrit.
+    descripteur, chemin_temporaire = tempfile.mkstemp(dir=MEMOIRE_PATH, prefix=f".{nom_fichier}.", suffix=".tmp")
+    try:
+        with os.fdopen(descripteur, 'w', encoding='utf-8') as f:
+            # 'indent=4' pour que le fichier soit lisible par un humain.
+            # 'ensure_ascii=False' pour bien gérer les caractères spéciaux (accents, etc.).
+            json.dump(donnees, f, indent=4, ensure_ascii=False)
+        os.replace(chemin_temporaire, chemin_fichier)
+    except BaseException:
+        os.remove(chemin_temporaire)
+        raise
+    incrementer_version(nom_fichier)
 
 def lire_evenements_suivis():
     """Lit la liste des ID d'événements déjà suivis."""
     # On réutilise la fonction générique pour lire un fichier JSON.
     return lire_donnees_json('evenements_suivis.json')
 
+@sous_verrou('evenements_suivis.json')
 def ajouter_evenement_suivi(event_id):
     """Ajoute un ID d'événement à la liste des événements suivis pour ne plus le notifier."""
     # On s'assure qu'on ne travaille pas avec une liste vide si le fichier n'existe pas.
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# Choix du niveau de modèle pour chaque requête.
+# Les demandes simples (salutations, "liste mes tâches", "marque X comme terminée") n'ont pas besoin
+# du modèle le plus puissant : un classifieur local, sans appel réseau, les envoie au modèle rapide.
+# La planification, les conseils et les demandes en plusieurs étapes restent sur le modèle "pro".
+# Le routeur repasse au modèle pro si le modèle rapide échoue ou si la requête s'avère plus longue que prévu.
+
+import os
+import re
+import logging
+import threading
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+NIVEAU_RAPIDE = "rapide"
+NIVEAU_PRO = "pro"
+MODELES_PAR_NIVEAU = {
+    NIVEAU_RAPIDE: os.getenv("GEMINI_FAST_MODEL", "gemini-2.5-flash"),
+    NIVEAU_PRO: os.getenv("GEMINI_PRO_MODEL", "gemini-2.5-pro"),
+}
+# Mettre MODEL_TIERING=0 pour toujours utiliser le modèle pro.
+CHOIX_NIVEAU_ACTIF = os.getenv("MODEL_TIERING", "1") != "0"
+# Au-delà de ce nombre d'allers-retours d'outils, la requête est jugée "en plusieurs étapes" : on passe au modèle pro.
+TOURS_OUTILS_MAX_RAPIDE = 2
+# Un message plus long que ceci est traité par le modèle pro.
+LONGUEUR_MAX_RAPIDE = 160
+
+# Indices de planification, de conseil ou de raisonnement (comparés sans accents, en minuscules).
+_INDICES_PRO = re.compile(
+    r"planifi|organis|priori|strateg|conseil|propos|suggere|analys|bilan|rapport|creneau|disponib|"
+    r"semaine|\bmois\b|objectif|pourquoi|comment|decoupe|decompos|reorganis|aide[- ]moi|que dois|quoi faire|"
+    r"par quoi|\bensuite\b|\bpuis\b|apres ca|et aussi"
+)
+# Demandes simples : salutations, lectures, changements de statut, confirmations.
+_INDICES_RAPIDE = re.compile(
+    r"^(salut|bonjour|bonsoir|hello|coucou|merci|ok|oui|non|d'accord|parfait|super|top)\b|"
+    r"\b(liste|lister|affiche|montre|quelles? sont|mes taches|mes projets|mes calendriers|"
+    r"marque|termine|fini|fait|supprime|efface|renomme|ajoute)\b"
+)
+
+# Latences mesurées par niveau : {niveau: {"appels": int, "secondes": float, "max": float, "echecs": int}}
+_statistiques = {niveau: {"appels": 0, "secondes": 0.0, "max": 0.0, "echecs": 0} for niveau in MODELES_PAR_NIVEAU}
+_statistiques_lock = threading.Lock()
+
+
+def _normaliser(texte: str) -> str:
+    sans_accents = unicodedata.normalize("NFD", texte.lower())
+    return "".join(c for c in sans_accents if unicodedata.category(c) != "Mn").strip()
+
+def choisir_niveau(message: str) -> str:
+    """Classifieur local : retourne NIVEAU_RAPIDE pour une demande simple, NIVEAU_PRO sinon."""
+    if not CHOIX_NIVEAU_ACTIF or not message:
+        return NIVEAU_PRO
+    texte = _normaliser(message)
+    if len(texte) > LONGUEUR_MAX_RAPIDE or _INDICES_PRO.search(texte):
+        return NIVEAU_PRO
+    # Plusieurs demandes dans un même message : on laisse le modèle pro enchaîner les étapes.
+    if texte.count("?") > 1 or len(re.findall(r"[.!?;]\s+\S", texte)) > 1:
+        return NIVEAU_PRO
+    if _INDICES_RAPIDE.search(texte) or len(texte) <= 40:
+        return NIVEAU_RAPIDE
+    return NIVEAU_PRO
+
+def enregistrer_latence(niveau: str, secondes: float):
+    with _statistiques_lock:
+        stats = _statistiques[niveau]
+        stats["appels"] += 1
+        stats["secondes"] += secondes
+        stats["max"] = max(stats["max"], secondes)
+
+def enregistrer_echec(niveau: str):
+    with _statistiques_lock:
+        _statistiques[niveau]["echecs"] += 1
+
+def statistiques_niveaux() -> dict:
+    """Nombre d'appels, latence moyenne et maximale (en secondes) et nombre d'échecs, par niveau de modèle."""
+    with _statistiques_lock:
+        return {
+            niveau: {
+                "appels": stats["appels"],
+                "latence_moyenne": round(stats["secondes"] / stats["appels"], 3) if stats["appels"] else None,
+                "latence_max": round(stats["max"], 3),
+                "echecs": stats["echecs"],
+            }
+            for niveau, stats in _statistiques.items()
+        }
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+# Réception des notifications push de Google Calendar (canaux "watch").
+# Au lieu d'interroger tous les calendriers à intervalle fixe, Google nous prévient
+# (via un webhook HTTP) dès qu'un calendrier change. On synchronise alors uniquement
+# ce calendrier, et on ne réveille le superviseur que si le changement le concerne.
+#
+# Ce module est optionnel : il n'est activé que si CALENDAR_WEBHOOK_URL et CALENDAR_WEBHOOK_TOKEN sont définies.
+
+import os
+import sys
+import uuid
+import time
+import logging
+import threading
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from googleapiclient.errors import HttpError
+
+from . import agent_calendrier
+from .agent_calendrier import _construire_service, _champs, lister_tous_les_calendriers
+from .agent_quota_calendrier import executer
+from .agent_temps import maintenant_epoch
+
+logger = logging.getLogger(__name__)
+
+# Adresse publique (HTTPS) à laquelle Google envoie les notifications.
+WEBHOOK_URL = os.getenv("CALENDAR_WEBHOOK_URL")
+# Port local sur lequel le récepteur écoute (Railway fournit PORT).
+WEBHOOK_PORT = int(os.getenv("CALENDAR_WEBHOOK_PORT", os.getenv("PORT", "8080")))
+# Jeton secret renvoyé par Google dans chaque notification, pour vérifier leur provenance.
+# Obligatoire en mode push : un jeton tiré au hasard à chaque démarrage rendrait orphelins
+# les canaux encore ouverts (leurs notifications seraient refusées jusqu'à leur expiration).
+WEBHOOK_TOKEN = os.getenv("CALENDAR_WEBHOOK_TOKEN")
+
+# Durée de vie demandée pour un canal (Google plafonne à environ 7 jours pour les événements).
+DUREE_CANAL_SECONDES = 7 * 24 * 3600
+# On renouvelle un canal quand il lui reste moins que cette marge.
+MARGE_RENOUVELLEMENT_SECONDES = 12 * 3600
+# Un changement est "pertinent" pour le superviseur s'il touche un événement
+# qui se termine dans cette fenêtre autour de maintenant.
+FENETRE_PERTINENCE_SECONDES = 24 * 3600
+
+# Structure : {channel_id: {"calendar_id", "resource_id", "expiration" (timestamp), "token"}}
+_canaux = {}
+_canaux_lock = threading.Lock()
+
+# Calendriers à resynchroniser : les rafales de notifications sont regroupées.
+_calendriers_a_synchroniser = set()
+_condition_travail = threading.Condition()
+
+_callback_reveil = None
+_serveur = None
+
+
+def est_active() -> bool:
+    """Indique si les notifications push sont configurées."""
+    return bool(WEBHOOK_URL and WEBHOOK_TOKEN)
+
+def definir_callback_reveil(callback):
+    """
+    Enregistre la fonction appelée quand un changement pertinent a été détecté.
+    Elle reçoit (calendar_id, changements) et est appelée depuis un thread de travail.
+    """
+    global _callback_reveil
+    _callback_reveil = callback
+
+def canaux_actifs() -> list:
+    """Retourne une copie des canaux ouverts (utile pour le débogage et les tests)."""
+    with _canaux_lock:
+        return [dict(canal, channel_id=channel_id) for channel_id, canal in _canaux.items()]
+
+# --- Gestion des canaux ---
+
+def _ouvrir_canal(service, calendar_id: str) -> dict:
+    """Demande à Google d'ouvrir un canal de notification pour un calendrier."""
+    channel_id = str(uuid.uuid4())
+    body = {
+        'id': channel_id,
+        'type': 'web_hook',
+        'address': WEBHOOK_URL,
+        'token': WEBHOOK_TOKEN,
+        'params': {'ttl': str(DUREE_CANAL_SECONDES)},
+    }
+    reponse = executer(service.events().watch(calendarId=calendar_id, body=body, **_champs("events.watch")), "events.watch")
+    canal = {
+        "calendar_id": calendar_id,
+        "resource_id": reponse.get('resourceId'),
+        # Google renvoie l'expiration en millisecondes depuis l'epoch
+        "expiration": int(reponse.get('expiration', 0)) / 1000 or time.time() + DUREE_CANAL_SECONDES,
+        "token": WEBHOOK_TOKEN,
+    }
+    with _canaux_lock:
+        _canaux[channel_id] = canal
+    logger.info(f"🔔 NOTIFICATIONS: Canal '{channel_id}' ouvert pour le calendrier '{calendar_id}'.")
+    return canal
+
+def _fermer_canal(service, channel_id: str):
+    """Ferme un canal auprès de Google. Un canal déjà expiré est simplement oublié."""
+    with _canaux_lock:
+        canal = _canaux.pop(channel_id, None)
+    if not canal:
+        return
+    try:
+        executer(service.channels().stop(body={'id': channel_id, 'resourceId': canal['resource_id']}), "channels.stop")
+        logger.info(f"🔔 NOTIFICATIONS: Canal '{channel_id}' fermé.")
+    except HttpError as e:
+        if e.resp.status != 404:
+            logger.warning(f"⚠️ NOTIFICATIONS: Impossible de fermer le canal '{channel_id}'. Erreur: {e}")
+
+def renouveler_canaux():
+    """
+    Ouvre un canal pour chaque calendrier qui n'en a pas, renouvelle ceux qui arrivent à
+    expiration et ferme ceux des calendriers disparus. Un calendrier dont le canal a expiré
+    sans être renouvelé est resynchronisé, car des notifications ont pu être manquées.
+    """
+    if not est_active():
+        return
+    try:
+        service = _construire_service()
+        calendriers = [c for c in lister_tous_les_calendriers() if 'erreur' not in c]
+        maintenant = time.time()
+
+        with _canaux_lock:
+            canaux_par_calendrier = {}
+            for channel_id, canal in _canaux.items():
+                canaux_par_calendrier.setdefault(canal['calendar_id'], []).append((channel_id, canal))
+
+        ids_calendriers = {c['id'] for c in calendriers}
+        for calendar_id, canaux in canaux_par_calendrier.items():
+            if calendar_id not in ids_calendriers:
+                for channel_id, _ in canaux:
+                    _fermer_canal(service, channel_id)
+
+        for calendar in calendriers:
+            canaux = canaux_par_calendrier.get(calendar['id'], [])
+            expiration = max((canal['expiration'] for _, canal in canaux), default=0)
+            if expiration - maintenant > MARGE_RENOUVELLEMENT_SECONDES:
+                continue
+            try:
+                _ouvrir_canal(service, calendar['id'])
+            except HttpError as e:
+                # Certains calendriers (ex: jours fériés) ne supportent pas les notifications
+                logger.warning(f"⚠️ NOTIFICATIONS: Impossible d'ouvrir un canal pour '{calendar['summary']}'. Erreur: {e}")
+                continue
+            for channel_id, _ in canaux:
+                _fermer_canal(service, channel_id)
+            if canaux and expiration < maintenant:
+                logger.info(f"🔔 NOTIFICATIONS: Le canal de '{calendar['summary']}' avait expiré, resynchronisation.")
+                _signaler_changement(calendar['id'])
+    except Exception as e:
+        logger.error(f"🔥 NOTIFICATIONS: Erreur lors du renouvellement des canaux: {e}", exc_info=True)
+
+def fermer_tous_les_canaux():
+    """Ferme tous les canaux ouverts (à l'arrêt du bot)."""
+    with _canaux_lock:
+        channel_ids = list(_canaux)
+    if not channel_ids:
+        return
+    try:
+        service = _construire_service()
+        for channel_id in channel_ids:
+            _fermer_canal(service, channel_id)
+    except Exception as e:
+        logger.error(f"🔥 NOTIFICATIONS: Erreur lors de la fermeture des canaux: {e}")
+
+# --- Traitement des notifications ---
+
+def _signaler_changement(calendar_id: str):
+    """Ajoute un calendrier à la file de synchronisation et réveille le thread de travail."""
+    with _condition_travail:
+        _calendriers_a_synchroniser.add(calendar_id)
+        _condition_travail.notify()
+
+def _est_pertinent(changements: list) -> bool:
+    """Un changement est pertinent s'il touche un événement qui se termine autour de maintenant."""
+    maintenant = maintenant_epoch()
+    for event in changements:
+        fin = event.get('fin_epoch')
+        if fin is not None and abs(fin - maintenant) <= FENETRE_PERTINENCE_SECONDES:
+            return True
+    return False
+
+def _traiter_notification(calendar_id: str):
+    """Synchronise le calendrier notifié et réveille le superviseur si c'est pertinent."""
+    changements = agent_calendrier.synchroniser_calendrier(calendar_id)
+    logger.info(f"🔔 NOTIFICATIONS: {len(changements)} changement(s) reçu(s) pour '{calendar_id}'.")
+    if changements and _est_pertinent(changements) and _callback_reveil:
+        _callback_reveil(calendar_id, changements)
+
+def _boucle_travail():
+    """Thread de travail : traite les calendriers signalés, un par un."""
+    while True:
+        with _condition_travail:
+            while not _calendriers_a_synchroniser:
+                _condition_travail.wait()
+            calendar_id = _calendriers_a_synchroniser.pop()
+        try:
+            _traiter_notification(calendar_id)
+        except Exception as e:
+            logger.error(f"🔥 NOTIFICATIONS: Erreur lors du traitement de la notification pour '{calendar_id}': {e}", exc_info=True)
+
+class _RecepteurNotifications(BaseHTTPRequestHandler):
+    """Point d'entrée HTTP appelé par Google à chaque changement sur un calendrier surveillé."""
+
+    def do_POST(self):
+        channel_id = self.headers.get('X-Goog-Channel-ID')
+        token = self.headers.get('X-Goog-Channel-Token')
+        etat = self.headers.get('X-Goog-Resource-State')
+
+        # On répond tout de suite : Google attend une réponse rapide, le travail se fait en arrière-plan.
+        self.send_response(200)
+        self.end_headers()
+
+        with _canaux_lock:
+            canal = _canaux.get(channel_id)
+        if not canal or token != canal['token']:
+            logger.warning(f"⚠️ NOTIFICATIONS: Notification ignorée (canal inconnu ou jeton invalide): {channel_id}")
+            return
+        if canal['expiration'] < time.time():
+            logger.info(f"🔔 NOTIFICATIONS: Notification reçue sur un canal expiré ({channel_id}), ignorée.")
+            return
+        if etat == 'sync':
+            # Message de confirmation envoyé par Google à l'ouverture du canal
+            logger.debug(f"🔔 NOTIFICATIONS: Canal '{channel_id}' confirmé par Google.")
+            return
+        _signaler_changement(canal['calendar_id'])
+
+    def log_message(self, format, *args):
+        # On redirige les logs du serveur HTTP vers notre logger
+        logger.debug("🔔 NOTIFICATIONS (HTTP): " + format, *args)
+
+def demarrer_recepteur(port: int = None) -> ThreadingHTTPServer:
+    """Démarre le serveur HTTP de réception et le thread de travail (une seule fois)."""
+    global _serveur
+    if _serveur:
+        return _serveur
+    _serveur = ThreadingHTTPServer(('0.0.0.0', WEBHOOK_PORT if port is None else port), _RecepteurNotifications)
+    threading.Thread(target=_serveur.serve_forever, daemon=True, name="recepteur-notifications").start()
+    threading.Thread(target=_boucle_travail, daemon=True, name="travail-notifications").start()
+    logger.info(f"🔔 NOTIFICATIONS: Récepteur démarré sur le port {_serveur.server_address[1]}.")
+    return _serveur
+
+# --- Simulateur local ---
+
+def simuler_notification(adresse: str, channel_id: str, token: str, etat: str = 'exists', numero: int = 1) -> int:
+    """
+    Envoie une fausse notification au récepteur, avec les mêmes en-têtes que Google.
+    Permet de tester le circuit complet sans exposer le bot sur Internet.
+    """
+    requete = urllib.request.Request(adresse, data=b'', method='POST', headers={
+        'X-Goog-Channel-ID': channel_id,
+        'X-Goog-Channel-Token': token,
+        'X-Goog-Resource-State': etat,
+        'X-Goog-Message-Number': str(numero),
+    })
+    with urllib.request.urlopen(requete, timeout=5) as reponse:
+        return reponse.status
+
+
+# Ce bloc s'exécute uniquement si on lance ce fichier directement (pour tester).
+# Usage : python -m agents.agent_notifications_calendrier <adresse> <channel_id> <token> [etat]
+if __name__ == '__main__':
+    if len(sys.argv) < 4:
+        print("Usage : python -m agents.agent_notifications_calendrier <adresse> <channel_id> <token> [etat]")
+        sys.exit(1)
+    statut = simuler_notification(sys.argv[1], sys.argv[2], sys.argv[3], *sys.argv[4:5])
+    print(f"Notification envoyée, réponse HTTP {statut}.")
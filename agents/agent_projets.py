@@ -4,7 +4,7 @@ import uuid
 import logging
 
 # On importe les fonctions de notre agent mémoire pour centraliser l'accès aux fichiers.
-from .agent_memoire import lire_donnees_json, ecrire_donnees_json
+from .agent_memoire import lire_donnees_json, ecrire_donnees_json, sous_verrou
 
 # La configuration du logging est déjà faite dans main.py, on récupère juste le logger.
 logger = logging.getLogger(__name__)
@@ -43,35 +43,36 @@ def _sauvegarder_projets(projets: list):
 
 def lister_projets() -> list:
     """
-    Retourne la liste complète de tous les projets et s'assure de leur cohérence.
+    Retourne la liste complète de tous les projets.
+    Lecture seule (peut s'exécuter en parallèle) : les anciennes données sont migrées au démarrage par migrer_projets().
+    """
+    logger.debug("💾 PROJETS: Lecture de tous les projets demandée.")
+    return _charger_projets()
+
+@sous_verrou(NOM_FICHIER_PROJETS)
+def migrer_projets():
+    """
+    Contrôle qualité des projets, à lancer au démarrage :
     - Ajoute le champ 'calendrier_id' s'il manque mais que le nom est présent (migration).
     """
-    logger.debug("💾 PROJETS: Lecture et validation de tous les projets demandée.")
     projets = _charger_projets()
     
     modifications_effectuees = False
     for projet in projets:
-        # Le contrôle pour 'suivi_proactif_active' est supprimé.
-            
-        # Contrôle de qualité 2 (MIGRATION) : si le nom du calendrier existe mais pas l'ID, on le cherche.
+        # Contrôle de qualité (MIGRATION) : si le nom du calendrier existe mais pas l'ID, on le cherche.
         if projet.get('calendrier_associe') and 'calendrier_id' not in projet:
             logger.info(f"⚙️ PROJETS (MIGRATION): Recherche de l'ID pour le calendrier '{projet['calendrier_associe']}' du projet '{projet['nom']}'.")
             calendar_id = _get_calendar_id_from_name(projet['calendrier_associe'])
-            if calendar_id:
-                projet['calendrier_id'] = calendar_id
-                modifications_effectuees = True
-            else:
-                # Si on ne trouve pas, on met l'ID à None pour éviter de chercher à chaque fois.
-                projet['calendrier_id'] = None
-                modifications_effectuees = True
+            # Si on ne trouve pas, on met l'ID à None pour éviter de chercher à chaque fois.
+            projet['calendrier_id'] = calendar_id or None
+            modifications_effectuees = True
 
     # Si on a dû réparer ou migrer des projets, on sauvegarde le fichier pour l'avenir.
     if modifications_effectuees:
         logger.info("⚙️ PROJETS: Le contrôleur qualité a corrigé/migré des données dans les projets.")
         _sauvegarder_projets(projets)
-        
-    return projets
 
+@sous_verrou(NOM_FICHIER_PROJETS)
 def ajouter_projet(nom: str, description: str = None, emoji: str = None, calendrier_associe: str = None) -> dict:
     """Ajoute un nouveau projet."""
     logger.info("💾 PROJETS: Tentative d'ajout du projet '%s'.", nom)
@@ -97,6 +98,7 @@ def ajouter_projet(nom: str, description: str = None, emoji: str = None, calendr
     logger.info("✅ PROJETS: Projet '%s' ajouté avec succès.", nom)
     return nouveau_projet
 
+@sous_verrou(NOM_FICHIER_PROJETS)
 def modifier_projet(id_projet: str, nouveau_nom: str = None, nouvelle_description: str = None, nouveau_calendrier: str = None, nouvel_emoji: str = None) -> dict:
     """
     Modifie un projet existant. Au moins un des champs optionnels doit être fourni.
@@ -150,6 +152,7 @@ def modifier_projet(id_projet: str, nouveau_nom: str = None, nouvelle_descriptio
         return {"info": "Aucune modification n'a été appliquée."}
 
 
+@sous_verrou(NOM_FICHIER_PROJETS)
 def supprimer_projet(id_projet: str) -> dict:
     """Supprime un projet de la liste en utilisant son ID."""
     logger.info("💾 PROJETS: Tentative de suppression du projet ID '%s'.", id_projet)
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+# Protection des appels à l'API Google Calendar.
+# Tous les appels passent par `executer()` (ou `executer_async()` pour le client asynchrone), qui applique :
+#   - un limiteur de débit partagé (seau à jetons) pour lisser les rafales d'appels parallèles,
+#   - des réessais avec attente exponentielle et aléatoire ("jitter") sur les erreurs temporaires (429, 5xx),
+#     sauf pour les écritures non idempotentes (idempotent=False, ex: création sans identifiant choisi par le bot) :
+#     après un 5xx ou une coupure, Google a pu les exécuter, elles ne sont réessayées que sur un refus de quota,
+#   - un disjoncteur : après plusieurs échecs d'affilée, on arrête d'appeler Google quelques secondes,
+#   - des compteurs par type d'appel pour suivre la consommation du quota.
+
+import os
+import time
+import asyncio
+import random
+import logging
+import threading
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+
+# Débit moyen autorisé (requêtes par seconde) et taille maximale d'une rafale.
+DEBIT_REQUETES_PAR_SECONDE = float(os.getenv("CALENDAR_RATE_LIMIT", "5"))
+CAPACITE_RAFALE = int(os.getenv("CALENDAR_RATE_BURST", "10"))
+
+# Réessais : nombre total de tentatives, délai de base et délai maximal (en secondes).
+TENTATIVES_MAX = 4
+DELAI_BASE_SECONDES = 0.5
+DELAI_MAX_SECONDES = 8.0
+STATUTS_REESSAYABLES = {429, 500, 502, 503, 504}
+# Google renvoie parfois un 403 (et non un 429) quand le quota est dépassé.
+RAISONS_QUOTA = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+# Disjoncteur : nombre d'échecs consécutifs avant ouverture, et durée d'ouverture.
+SEUIL_DISJONCTEUR = 5
+DUREE_OUVERTURE_SECONDES = 30.0
+
+
+class CalendrierIndisponible(Exception):
+    """Levée quand le disjoncteur est ouvert : Google Calendar est considéré comme indisponible."""
+
+
+class SeauAJetons:
+    """Limiteur de débit : un jeton par requête, le seau se remplit au rythme du débit autorisé."""
+
+    def __init__(self, debit: float, capacite: int):
+        self.debit = debit
+        self.capacite = capacite
+        self.jetons = float(capacite)
+        self.dernier_remplissage = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserver(self) -> float:
+        """Réserve un jeton et retourne le temps à attendre avant de l'utiliser (0 si disponible)."""
+        with self.lock:
+            maintenant = time.monotonic()
+            self.jetons = min(self.capacite, self.jetons + (maintenant - self.dernier_remplissage) * self.debit)
+            self.dernier_remplissage = maintenant
+            self.jetons -= 1
+            if self.jetons >= 0:
+                return 0.0
+            # Le jeton est "emprunté" : on attend le temps qu'il se régénère.
+            return -self.jetons / self.debit
+
+    def acquerir(self):
+        """Bloque jusqu'à ce qu'un jeton soit disponible."""
+        attente = self.reserver()
+        if attente > 0:
+            time.sleep(attente)
+
+
+class Disjoncteur:
+    """
+    Disjoncteur à trois états : fermé (tout passe), ouvert (tout est refusé),
+    semi-ouvert (une requête de test est autorisée après la durée d'ouverture).
+    """
+
+    def __init__(self, seuil: int, duree_ouverture: float):
+        self.seuil = seuil
+        self.duree_ouverture = duree_ouverture
+        self.echecs_consecutifs = 0
+        self.ouvert_depuis = None
+        self.test_en_cours = False
+        self.lock = threading.Lock()
+
+    def autoriser(self):
+        """Lève CalendrierIndisponible si le disjoncteur refuse la requête."""
+        with self.lock:
+            if self.ouvert_depuis is None:
+                return
+            restant = self.duree_ouverture - (time.monotonic() - self.ouvert_depuis)
+            if restant > 0 or self.test_en_cours:
+                raise CalendrierIndisponible(f"Google Calendar est temporairement indisponible, nouvel essai possible dans {max(restant, 1):.0f}s.")
+            # Semi-ouvert : on laisse passer une seule requête de test
+            self.test_en_cours = True
+
+    def succes(self):
+        with self.lock:
+            if self.ouvert_depuis is not None:
+                logger.info("✅ QUOTA CALENDRIER: Google Calendar répond à nouveau, disjoncteur refermé.")
+            self.echecs_consecutifs = 0
+            self.ouvert_depuis = None
+            self.test_en_cours = False
+
+    def liberer(self):
+        """
+        La requête n'a rien appris sur l'état de Google (erreur locale, réponse illisible...) :
+        ni succès ni échec, mais si c'était la requête de test, une autre pourra être tentée.
+        """
+        with self.lock:
+            self.test_en_cours = False
+
+    def echec(self):
+        with self.lock:
+            self.echecs_consecutifs += 1
+            if self.test_en_cours or self.echecs_consecutifs >= self.seuil:
+                if self.ouvert_depuis is None or self.test_en_cours:
+                    logger.warning(f"⚠️ QUOTA CALENDRIER: {self.echecs_consecutifs} échecs consécutifs, disjoncteur ouvert pour {self.duree_ouverture:.0f}s.")
+                self.ouvert_depuis = time.monotonic()
+                self.test_en_cours = False
+
+
+_seau = SeauAJetons(DEBIT_REQUETES_PAR_SECONDE, CAPACITE_RAFALE)
+_disjoncteur = Disjoncteur(SEUIL_DISJONCTEUR, DUREE_OUVERTURE_SECONDES)
+
+# Compteurs par type d'appel : {appel: {"appels", "succes", "reessais", "echecs", "quota_depasse"}}
+_compteurs = {}
+_compteurs_lock = threading.Lock()
+
+
+def _compter(appel: str, champ: str):
+    with _compteurs_lock:
+        compteurs = _compteurs.setdefault(appel, {"appels": 0, "succes": 0, "reessais": 0, "echecs": 0, "quota_depasse": 0})
+        compteurs[champ] += 1
+
+def statistiques_quota() -> dict:
+    """Retourne une copie des compteurs d'appels par type d'appel."""
+    with _compteurs_lock:
+        return {appel: dict(compteurs) for appel, compteurs in _compteurs.items()}
+
+def _est_reessayable(erreur: Exception) -> bool:
+    """Indique si une erreur est temporaire et mérite un nouvel essai."""
+    if isinstance(erreur, HttpError):
+        if erreur.resp.status in STATUTS_REESSAYABLES:
+            return True
+        return erreur.resp.status == 403 and any(raison in str(erreur) for raison in RAISONS_QUOTA)
+    # Erreurs de transport : coupure, délai dépassé, DNS (httplib2.ServerNotFoundError), TLS (ssl.SSLError est un OSError)...
+    return isinstance(erreur, (OSError, httplib2.HttpLib2Error))
+
+def _refus_quota(erreur: Exception) -> bool:
+    """Indique si Google a refusé la requête sans l'exécuter (débit ou quota dépassé)."""
+    if not isinstance(erreur, HttpError):
+        return False
+    return erreur.resp.status == 429 or (erreur.resp.status == 403 and any(raison in str(erreur) for raison in RAISONS_QUOTA))
+
+def _delai_attente(erreur: Exception, tentative: int) -> float:
+    """Délai avant le prochain essai : 'Retry-After' s'il est fourni, sinon attente exponentielle aléatoire."""
+    if isinstance(erreur, HttpError):
+        retry_after = erreur.resp.get('retry-after')
+        if retry_after and str(retry_after).isdigit():
+            return min(float(retry_after), DELAI_MAX_SECONDES)
+    return random.uniform(0, min(DELAI_MAX_SECONDES, DELAI_BASE_SECONDES * (2 ** tentative)))
+
+def _gerer_echec(erreur: Exception, appel: str, tentative: int, idempotent: bool = True) -> float:
+    """
+    Enregistre l'échec d'une tentative et retourne le délai avant la suivante.
+    Relance l'erreur si elle est définitive, si c'était la dernière tentative, ou si la requête
+    n'est pas idempotente et a pu être exécutée par Google.
+    """
+    if not _est_reessayable(erreur):
+        if isinstance(erreur, HttpError):
+            # Le serveur a bien répondu (ex: 404) : ce n'est pas une panne.
+            _disjoncteur.succes()
+        else:
+            _disjoncteur.liberer()
+        raise erreur
+    _disjoncteur.echec()
+    if isinstance(erreur, HttpError) and erreur.resp.status in (403, 429):
+        _compter(appel, "quota_depasse")
+    if not idempotent and not _refus_quota(erreur):
+        _compter(appel, "echecs")
+        logger.error(f"🔥 QUOTA CALENDRIER: '{appel}' a échoué ({erreur}), pas de nouvel essai : la requête a pu être exécutée.")
+        raise erreur
+    if tentative == TENTATIVES_MAX - 1:
+        _compter(appel, "echecs")
+        logger.error(f"🔥 QUOTA CALENDRIER: '{appel}' a échoué après {TENTATIVES_MAX} tentatives: {erreur}")
+        raise erreur
+    delai = _delai_attente(erreur, tentative)
+    _compter(appel, "reessais")
+    logger.warning(f"⚠️ QUOTA CALENDRIER: Erreur temporaire sur '{appel}' ({erreur}), nouvel essai dans {delai:.1f}s.")
+    return delai
+
+def executer(requete, appel: str, idempotent: bool = True):
+    """
+    Exécute une requête googleapiclient en respectant le limiteur de débit et le disjoncteur,
+    avec réessais sur les erreurs temporaires. 'appel' identifie le type d'appel (ex: "events.list").
+    Les erreurs définitives (404, 403 de permissions...) sont relancées telles quelles.
+    'idempotent=False' : la requête n'est réessayée que si Google l'a refusée pour quota (voir _gerer_echec).
+    """
+    for tentative in range(TENTATIVES_MAX):
+        _disjoncteur.autoriser()
+        _seau.acquerir()
+        _compter(appel, "appels")
+        try:
+            resultat = requete.execute()
+        except Exception as e:
+            time.sleep(_gerer_echec(e, appel, tentative, idempotent))
+            continue
+        _disjoncteur.succes()
+        _compter(appel, "succes")
+        return resultat
+
+async def executer_async(fabrique_requete, appel: str, idempotent: bool = True):
+    """
+    Version asynchrone de `executer()` : mêmes limiteur, disjoncteur et compteurs,
+    mais les attentes ne bloquent pas la boucle d'événements.
+    'fabrique_requete' est une fonction sans argument qui retourne une coroutine
+    (une nouvelle coroutine est créée à chaque tentative).
+    """
+    for tentative in range(TENTATIVES_MAX):
+        _disjoncteur.autoriser()
+        attente = _seau.reserver()
+        if attente > 0:
+            await asyncio.sleep(attente)
+        _compter(appel, "appels")
+        try:
+            resultat = await fabrique_requete()
+        except Exception as e:
+            await asyncio.sleep(_gerer_echec(e, appel, tentative, idempotent))
+            continue
+        _disjoncteur.succes()
+        _compter(appel, "succes")
+        return resultat
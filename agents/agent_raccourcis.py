@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+# Raccourcis locaux pour les demandes les plus courantes.
+# Une bonne partie des messages suit toujours la même formule ("liste mes tâches", "marque X comme terminée",
+# "mes prochains rendez-vous"), mais chacun coûtait au moins deux allers-retours avec Gemini.
+# Ici, des règles reconnaissent ces formules, appellent directement les fonctions des agents et mettent
+# la réponse en forme avec des modèles de texte, dans le style de l'assistant : quelques millisecondes.
+# Tout ce qui est ambigu (plusieurs tâches possibles, date précisée, demande composée...) retourne None
+# et part chez Gemini, comme avant.
+
+import os
+import re
+import html
+import time
+import asyncio
+import logging
+import threading
+
+from .agent_taches import lister_taches, changer_statut_tache
+from .agent_calendrier_async import lister_prochains_evenements_async
+from .agent_temps import vers_epoch, depuis_epoch
+
+logger = logging.getLogger(__name__)
+
+# Mettre FAST_PATH=0 pour tout envoyer à Gemini.
+RACCOURCIS_ACTIFS = os.getenv("FAST_PATH", "1") != "0"
+NOMBRE_PROCHAINS_EVENEMENTS = 5
+STATUTS_CLOS = ('terminée', 'annulée')
+CONCLUSION = "\n\nY a-t-il autre chose pour t'aider ?"
+JOURS = ["lun.", "mar.", "mer.", "jeu.", "ven.", "sam.", "dim."]
+
+_GUILLEMETS_OUVRANTS = "[«\"'“]?\\s*"
+_GUILLEMETS_FERMANTS = "\\s*[»\"'”]?"
+
+REGLES = [
+    ("lister_taches", re.compile(
+        r"^(?:(?:peux-tu |tu peux )?(?:me )?(?:liste|lister|affiche|afficher|montre|montrer|donne|donner)(?:-moi)? )?"
+        r"(?:la liste de |toutes )?(?:mes|les) t[aâ]ches(?: en cours| actuelles| à faire)?$"
+        r"|^quelles sont mes t[aâ]ches(?: en cours| actuelles| à faire)?$"
+    )),
+    ("terminer_tache", re.compile(
+        r"^(?:marque|marquer|mets|passe)(?: la t[aâ]che)? " + _GUILLEMETS_OUVRANTS + r"(?P<tache>.+?)" + _GUILLEMETS_FERMANTS +
+        r" (?:comme|en|à|a) (?:termin[ée]e?|faite?|finie?)$"
+        r"|^la t[aâ]che " + _GUILLEMETS_OUVRANTS + r"(?P<tache2>.+?)" + _GUILLEMETS_FERMANTS + r" est (?:termin[ée]e|faite|finie)$"
+    )),
+    ("prochains_evenements", re.compile(
+        r"^(?:quels sont |montre-moi |affiche )?(?:mes |les )?prochains (?:rendez-vous|rdv|[ée]v[ée]nements)$"
+        r"|^qu'est-ce que j'ai de pr[ée]vu$"
+    )),
+]
+
+# {"messages": int, "raccourcis": int, "renvois": int, "par_intention": {intention: int}}
+_statistiques = {"messages": 0, "raccourcis": 0, "renvois": 0, "par_intention": {}}
+_statistiques_lock = threading.Lock()
+
+
+def _normaliser(message: str) -> str:
+    """Minuscules, espaces simplifiés, sans ponctuation finale ni formule de politesse."""
+    texte = re.sub(r"\s+", " ", message.strip().lower()).replace("’", "'")
+    texte = re.sub(r"[\s?!.]+$", "", texte)
+    texte = re.sub(r",? ?(?:s'il te pla[iî]t|s'il vous pla[iî]t|stp|svp)$", "", texte)
+    return texte.strip()
+
+def reconnaitre(message: str):
+    """Retourne (intention, paramètres) si le message correspond à une règle, sinon (None, None)."""
+    texte = _normaliser(message)
+    for intention, regle in REGLES:
+        correspondance = regle.match(texte)
+        if correspondance:
+            parametres = {cle.rstrip("0123456789"): valeur for cle, valeur in correspondance.groupdict().items() if valeur}
+            return intention, parametres
+    return None, None
+
+# --- Mise en forme (HTML Telegram, même style que les réponses de l'IA) ---
+
+def _libelle_priorite(priorite: str) -> str:
+    return priorite.split(" (")[0]
+
+def _ligne_tache(tache: dict) -> str:
+    ligne = f"{tache.get('emoji_projet') or '🔹'} {html.escape(tache['description'])}"
+    resume = tache.get('resume_sous_taches')
+    if resume:
+        ligne += f" ({resume['terminees']}/{resume['total']} sous-tâches terminées)"
+    return ligne
+
+def _repondre_lister_taches(parametres: dict) -> str:
+    taches = [t for t in lister_taches() if t.get('statut') not in STATUTS_CLOS]
+    if not taches:
+        return "<b>Aucune tâche en cours</b> 🎉 Tu es à jour ! Veux-tu en ajouter une ?"
+    blocs, priorite_courante = [], None
+    for tache in taches:
+        priorite = _libelle_priorite(tache.get('priorite', ''))
+        if priorite != priorite_courante:
+            blocs.append(f"\n<b>{html.escape(priorite)}</b>")
+            priorite_courante = priorite
+        blocs.append(_ligne_tache(tache))
+    return "<b>Voici la liste de tes tâches actuelles 🎯 :</b>\n" + "\n".join(blocs) + CONCLUSION
+
+def _repondre_terminer_tache(parametres: dict):
+    recherche = parametres['tache'].lower()
+    ouvertes = [t for t in lister_taches() if t.get('statut') not in STATUTS_CLOS]
+    exactes = [t for t in ouvertes if t['description'].lower() == recherche]
+    candidates = exactes or [t for t in ouvertes if recherche in t['description'].lower()]
+    if len(candidates) != 1:
+        # Aucune tâche ou plusieurs possibles : Gemini saura demander une précision.
+        return None
+    tache = changer_statut_tache(candidates[0]['description'], 'terminée')
+    if 'erreur' in tache:
+        return None
+    emoji = f"{tache['emoji_projet']} " if tache.get('emoji_projet') else ""
+    return f"✅ C'est noté : {emoji}<b>{html.escape(tache['description'])}</b> est terminée. Bravo ! 🎉" + CONCLUSION
+
+def _formater_debut(debut: str) -> str:
+    epoch, nom_fuseau = vers_epoch(debut)
+    heure = depuis_epoch(epoch, nom_fuseau)
+    jour = f"{JOURS[heure.weekday()]} {heure.strftime('%d/%m')}"
+    return jour if len(debut) <= 10 else f"{jour} à {heure.strftime('%H:%M')}"
+
+async def _repondre_prochains_evenements(parametres: dict):
+    evenements = await lister_prochains_evenements_async(NOMBRE_PROCHAINS_EVENEMENTS)
+    if any('erreur' in e for e in evenements):
+        return None
+    if not evenements:
+        return "<b>Rien de prévu pour le moment</b> 📅 Ton agenda est libre !" + CONCLUSION
+    lignes = [
+        f"🔹 <b>{_formater_debut(e['start'])}</b> — {html.escape(e['summary'])} <i>({html.escape(e['calendar'])})</i>"
+        for e in evenements
+    ]
+    return "<b>Tes prochains rendez-vous 📅 :</b>\n\n" + "\n".join(lignes) + CONCLUSION
+
+REPONSES = {
+    "lister_taches": _repondre_lister_taches,
+    "terminer_tache": _repondre_terminer_tache,
+    "prochains_evenements": _repondre_prochains_evenements,
+}
+
+# --- Point d'entrée ---
+
+async def repondre_raccourci(message: str):
+    """
+    Répond directement au message s'il correspond à une demande courante et sans ambiguïté.
+    Retourne le texte HTML de la réponse, ou None pour laisser Gemini traiter le message.
+    """
+    if not RACCOURCIS_ACTIFS:
+        return None
+    debut = time.perf_counter()
+    intention, parametres = reconnaitre(message)
+    reponse = None
+    if intention:
+        fonction = REPONSES[intention]
+        try:
+            if asyncio.iscoroutinefunction(fonction):
+                reponse = await fonction(parametres)
+            else:
+                # Les agents de tâches lisent des fichiers : hors de la boucle d'événements.
+                reponse = await asyncio.to_thread(fonction, parametres)
+        except Exception as e:
+            logger.error(f"🔥 RACCOURCI: Échec de '{intention}', transmission à Gemini: {repr(e)}")
+
+    with _statistiques_lock:
+        _statistiques["messages"] += 1
+        if reponse:
+            _statistiques["raccourcis"] += 1
+            _statistiques["par_intention"][intention] = _statistiques["par_intention"].get(intention, 0) + 1
+        elif intention:
+            _statistiques["renvois"] += 1
+        taux = _statistiques["raccourcis"] / _statistiques["messages"]
+    if reponse:
+        logger.info(f"⚡ RACCOURCI: '{intention}' traité localement en {(time.perf_counter() - debut) * 1000:.0f} ms (taux de raccourcis: {taux:.0%}).")
+    elif intention:
+        logger.info(f"↪️ RACCOURCI: '{intention}' reconnu mais ambigu, transmission à Gemini.")
+    return reponse
+
+def statistiques_raccourcis() -> dict:
+    """Messages reçus, messages traités localement (par intention), renvois à Gemini et taux de raccourcis."""
+    with _statistiques_lock:
+        stats = {cle: (dict(valeur) if isinstance(valeur, dict) else valeur) for cle, valeur in _statistiques.items()}
+    stats["taux"] = round(stats["raccourcis"] / stats["messages"], 3) if stats["messages"] else None
+    return stats
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+# Mise en forme compacte des réponses d'outils envoyées à Gemini.
+# Les outils renvoient leurs objets bruts (tâches complètes avec UUID, horodatages epoch, champs nuls,
+# infos de projet recopiées...). Ces réponses restent dans l'historique pendant tout le tour et sont
+# renvoyées à chaque appel : on les allège avant de les transmettre.
+#   - les champs vides (None, "") et les champs internes (epoch, fuseaux, drapeaux techniques) sont retirés,
+#   - les identifiants longs sont remplacés par des alias courts ("@1", "@2"...), valables pour la requête
+#     en cours ; quand l'IA réutilise un alias en argument d'un outil, il est remplacé par le vrai identifiant,
+#   - les listes trop longues sont coupées ; la suite est gardée de côté et l'IA peut la demander avec
+#     l'outil 'lire_suite_resultats' et le curseur fourni.
+# Les effets de bord du routeur (synchronisation tâche-calendrier) travaillent toujours sur les réponses brutes.
+
+import os
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Nom de l'outil qui permet à l'IA de lire la suite d'une liste coupée.
+OUTIL_SUITE_RESULTATS = "lire_suite_resultats"
+# Nombre maximal d'éléments d'une liste transmis en une fois.
+ELEMENTS_MAX_PAR_LISTE = int(os.getenv("ROUTER_TOOL_LIST_LIMIT", "20"))
+# Champs sans intérêt pour l'IA (le format ISO, lui, est conservé).
+CHAMPS_INTERNES = frozenset({"suivi_envoye", "projet_id"})
+SUFFIXES_INTERNES = ("_epoch", "_tz")
+# Champs contenant un identifiant à remplacer par un alias.
+CHAMPS_IDENTIFIANTS = frozenset({"id", "event_id", "id_evenement", "google_calendar_event_id"})
+# En dessous de cette longueur, un identifiant est déjà assez court.
+LONGUEUR_MIN_ALIAS = 12
+
+# Totaux depuis le démarrage, par outil : {outil: {"appels": int, "tokens_avant": int, "tokens_apres": int}}
+_statistiques = {}
+_statistiques_lock = threading.Lock()
+
+
+def estimer_tokens(donnees) -> int:
+    """Estimation du nombre de tokens d'une réponse (environ 4 caractères par token, sans appel réseau)."""
+    return len(json.dumps(donnees, ensure_ascii=False, default=str)) // 4 + 1
+
+def _champ_interne(cle: str) -> bool:
+    return cle in CHAMPS_INTERNES or cle.endswith(SUFFIXES_INTERNES)
+
+def _champ_identifiant(cle: str) -> bool:
+    return cle in CHAMPS_IDENTIFIANTS or cle.endswith("_id")
+
+def statistiques_compaction() -> dict:
+    """Tokens estimés avant/après compaction, par outil, depuis le démarrage."""
+    with _statistiques_lock:
+        return {outil: dict(valeurs) for outil, valeurs in _statistiques.items()}
+
+
+class CompacteurReponses:
+    """
+    État de la compaction pour UNE requête au routeur : table des alias d'identifiants
+    et suites des listes coupées. Un nouvel objet est créé pour chaque requête.
+    """
+
+    def __init__(self):
+        self._alias_vers_id = {}
+        self._id_vers_alias = {}
+        self._suites = {}
+
+    def _alias(self, identifiant: str) -> str:
+        if identifiant not in self._id_vers_alias:
+            alias = f"@{len(self._id_vers_alias) + 1}"
+            self._id_vers_alias[identifiant] = alias
+            self._alias_vers_id[alias] = identifiant
+        return self._id_vers_alias[identifiant]
+
+    def _alleger(self, valeur):
+        """Retire les champs vides ou internes et remplace les identifiants longs, récursivement."""
+        if isinstance(valeur, dict):
+            resultat = {}
+            for cle, element in valeur.items():
+                if element is None or element == "" or _champ_interne(cle):
+                    continue
+                if _champ_identifiant(cle) and isinstance(element, str) and len(element) >= LONGUEUR_MIN_ALIAS:
+                    resultat[cle] = self._alias(element)
+                else:
+                    resultat[cle] = self._alleger(element)
+            return resultat
+        if isinstance(valeur, list):
+            return [self._alleger(element) for element in valeur]
+        return valeur
+
+    def _page(self, elements: list) -> dict:
+        """Retourne les premiers éléments d'une liste et met la suite de côté, avec son curseur."""
+        if len(elements) <= ELEMENTS_MAX_PAR_LISTE:
+            return {"resultats": elements}
+        curseur = f"suite-{len(self._suites) + 1}"
+        self._suites[curseur] = elements[ELEMENTS_MAX_PAR_LISTE:]
+        return {
+            "resultats": elements[:ELEMENTS_MAX_PAR_LISTE],
+            "suite_disponible": {
+                "elements_restants": len(elements) - ELEMENTS_MAX_PAR_LISTE,
+                "curseur": curseur,
+                "outil": OUTIL_SUITE_RESULTATS,
+            },
+        }
+
+    def compacter(self, nom_outil: str, reponse: dict) -> dict:
+        """Version compacte d'une réponse d'outil (déjà normalisée en dictionnaire), à envoyer à Gemini."""
+        compacte = self._alleger(reponse)
+        if isinstance(compacte.get("resultats"), list):
+            compacte.update(self._page(compacte["resultats"]))
+
+        avant, apres = estimer_tokens(reponse), estimer_tokens(compacte)
+        with _statistiques_lock:
+            totaux = _statistiques.setdefault(nom_outil, {"appels": 0, "tokens_avant": 0, "tokens_apres": 0})
+            totaux["appels"] += 1
+            totaux["tokens_avant"] += avant
+            totaux["tokens_apres"] += apres
+        logger.info(f"📦 ROUTEUR: Réponse de '{nom_outil}' compactée : ~{avant} → ~{apres} tokens.")
+        return compacte
+
+    def lire_suite(self, curseur: str) -> dict:
+        """Réponse de l'outil 'lire_suite_resultats' : la page suivante d'une liste coupée."""
+        elements = self._suites.pop(curseur, None)
+        if elements is None:
+            return {"erreur": f"Curseur '{curseur}' inconnu ou déjà utilisé. Relance l'outil de listage d'origine."}
+        return self._page(elements)
+
+    def developper_arguments(self, valeur):
+        """Remplace, dans les arguments demandés par l'IA, les alias par les vrais identifiants."""
+        if isinstance(valeur, str):
+            return self._alias_vers_id.get(valeur, valeur)
+        if isinstance(valeur, dict):
+            return {cle: self.developper_arguments(element) for cle, element in valeur.items()}
+        if isinstance(valeur, list):
+            return [self.developper_arguments(element) for element in valeur]
+        return valeur
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+# Instantané de la situation de l'utilisateur, joint au contexte de chaque message.
+# Avant, chaque message (et chaque suivi du superviseur) relisait les tâches, les projets et les leçons apprises,
+# et interrogeait Google pour les prochains événements, avant même d'appeler Gemini.
+# L'instantané est découpé en parties ; chacune est recalculée seulement quand ses données ont changé :
+#   - tâches, projets, leçons apprises : d'après les numéros de version de agent_memoire (chaque écriture les augmente),
+#   - prochains événements : lus dans le miroir du calendrier, tenu à jour par le superviseur et les notifications push.
+#     Google n'est interrogé que si le bot a lui-même modifié un événement depuis (le miroir ne le sait pas encore)
+#     ou pour le premier calcul. La partie expire aussi quand le premier des événements retenus se termine.
+# Le reste du temps, construire le contexte est une simple lecture en mémoire.
+# Chaque partie a son propre verrou : un appel lent à Google ne bloque que la partie "evenements", et pendant
+# son recalcul les autres lecteurs reçoivent la dernière valeur connue au lieu d'attendre. Après un échec,
+# la partie n'est pas recalculée avant DELAI_NOUVEL_ESSAI_SECONDES.
+
+import time
+import copy
+import logging
+import threading
+
+from .agent_taches import lister_taches, NOM_FICHIER_TACHES
+from .agent_projets import lister_projets, NOM_FICHIER_PROJETS
+from .agent_apprentissage import lister_apprentissages, lister_epingles, NOM_FICHIER_APPRENTISSAGES, NOM_FICHIER_EPINGLES
+from .agent_calendrier import (
+    lister_prochains_evenements, prochains_evenements_miroir,
+    NOM_FICHIER_MIROIR, MAGASIN_CALENDRIERS, MAGASIN_EVENEMENTS
+)
+from .agent_memoire import version_donnees
+from .agent_temps import vers_epoch, maintenant_epoch
+
+logger = logging.getLogger(__name__)
+
+NOMBRE_PROCHAINS_EVENEMENTS = 5
+# Après un échec de recalcul, délai avant de réessayer (en secondes) ; la dernière valeur connue est servie entre-temps.
+DELAI_NOUVEL_ESSAI_SECONDES = 60
+
+# Magasins de données dont dépend chaque partie de l'instantané.
+DEPENDANCES_PARTIES = {
+    "taches": (NOM_FICHIER_TACHES, NOM_FICHIER_PROJETS),
+    "projets": (NOM_FICHIER_PROJETS,),
+    "apprentissages": (NOM_FICHIER_APPRENTISSAGES,),
+    "epingles": (NOM_FICHIER_EPINGLES,),
+    "evenements": (NOM_FICHIER_MIROIR, MAGASIN_CALENDRIERS, MAGASIN_EVENEMENTS),
+}
+
+# Valeur servie pour une partie qui n'a encore jamais pu être calculée.
+VALEURS_VIDES = {"taches": [], "projets": [], "apprentissages": {}, "epingles": [], "evenements": []}
+
+# {partie: {"versions": tuple, "valeur": ..., "expiration": epoch ou None}}
+_parties = {}
+# {partie: epoch avant lequel on ne réessaie pas de la recalculer (après un échec)}
+_nouvel_essai = {}
+# Un seul recalcul à la fois par partie : les conversations simultanées profitent du résultat au lieu de le refaire.
+_verrous_parties = {partie: threading.Lock() for partie in DEPENDANCES_PARTIES}
+# Protège _parties, _nouvel_essai et _statistiques (jamais tenu pendant un calcul).
+_lock = threading.Lock()
+_statistiques = {"lectures": 0, "recalculs": {partie: 0 for partie in DEPENDANCES_PARTIES}}
+
+
+def _versions(partie: str) -> tuple:
+    return tuple(version_donnees(magasin) for magasin in DEPENDANCES_PARTIES[partie])
+
+def _fin_plus_proche(evenements: list):
+    """Heure (epoch) à laquelle le premier des événements retenus se termine : la sélection change à ce moment-là."""
+    fins = []
+    for evenement in evenements:
+        try:
+            fin, _ = vers_epoch(evenement.get('end'))
+        except (ValueError, TypeError, OverflowError):
+            continue
+        if fin is not None:
+            fins.append(fin)
+    return min(fins) if fins else None
+
+def _calculer_evenements(entree, versions: tuple):
+    """
+    Prochains événements. Si le bot a modifié un événement depuis le dernier calcul (ou au premier calcul),
+    on synchronise avec Google ; sinon, le miroir suffit.
+    """
+    index_evenements = DEPENDANCES_PARTIES["evenements"].index(MAGASIN_EVENEMENTS)
+    if entree is None or entree["versions"][index_evenements] != versions[index_evenements]:
+        evenements = lister_prochains_evenements(NOMBRE_PROCHAINS_EVENEMENTS)
+    else:
+        evenements = prochains_evenements_miroir(NOMBRE_PROCHAINS_EVENEMENTS)
+    if any('erreur' in e for e in evenements):
+        raise RuntimeError(evenements[0]['erreur'])
+    return evenements, _fin_plus_proche(evenements)
+
+def _calculer(partie: str, entree, versions: tuple):
+    """Recalcule une partie ; retourne (valeur, date d'expiration ou None)."""
+    if partie == "taches":
+        return lister_taches(), None
+    if partie == "projets":
+        return lister_projets(), None
+    if partie == "apprentissages":
+        return lister_apprentissages(), None
+    if partie == "epingles":
+        return lister_epingles(), None
+    return _calculer_evenements(entree, versions)
+
+def _valeur_connue(entree, partie: str):
+    return entree["valeur"] if entree else copy.deepcopy(VALEURS_VIDES[partie])
+
+def _a_jour(entree, versions: tuple) -> bool:
+    return bool(entree) and entree["versions"] == versions and (entree["expiration"] is None or entree["expiration"] > maintenant_epoch())
+
+def _partie(partie: str):
+    """
+    Valeur à jour d'une partie. Si elle est déjà en cours de recalcul, ou si le dernier recalcul a échoué
+    il y a peu, la dernière valeur connue est servie sans attendre (seul le tout premier calcul est attendu).
+    """
+    # Versions relevées AVANT le calcul : une écriture pendant le calcul provoquera un nouveau calcul.
+    versions = _versions(partie)
+    with _lock:
+        entree = _parties.get(partie)
+        if _a_jour(entree, versions) or (entree and _nouvel_essai.get(partie, 0) > time.time()):
+            return _valeur_connue(entree, partie)
+
+    verrou = _verrous_parties[partie]
+    if not verrou.acquire(blocking=entree is None):
+        return _valeur_connue(entree, partie)
+    try:
+        # Un autre thread a pu la recalculer (ou échouer) pendant l'attente.
+        versions = _versions(partie)
+        with _lock:
+            entree = _parties.get(partie)
+            if _a_jour(entree, versions) or _nouvel_essai.get(partie, 0) > time.time():
+                return _valeur_connue(entree, partie)
+        debut = time.perf_counter()
+        try:
+            valeur, expiration = _calculer(partie, entree, versions)
+        except Exception as e:
+            # On garde la dernière valeur connue plutôt que de faire échouer le message.
+            logger.warning(
+                f"⚠️ SITUATION: Mise à jour de '{partie}' impossible, dernière valeur conservée "
+                f"(nouvel essai dans {DELAI_NOUVEL_ESSAI_SECONDES} s): {repr(e)}"
+            )
+            with _lock:
+                _nouvel_essai[partie] = time.time() + DELAI_NOUVEL_ESSAI_SECONDES
+            return _valeur_connue(entree, partie)
+        with _lock:
+            _parties[partie] = {"versions": versions, "valeur": valeur, "expiration": expiration}
+            _nouvel_essai.pop(partie, None)
+            _statistiques["recalculs"][partie] += 1
+        logger.debug(f"🔄 SITUATION: Partie '{partie}' recalculée en {(time.perf_counter() - debut) * 1000:.0f} ms.")
+        return valeur
+    finally:
+        verrou.release()
+
+def instantane_situation() -> dict:
+    """
+    Situation actuelle : {"taches": list, "projets": list, "evenements": list, "apprentissages": dict, "epingles": list}.
+    Seules les parties dont les données ont changé sont recalculées. Retourne une copie.
+    """
+    with _lock:
+        _statistiques["lectures"] += 1
+    situation = {partie: _partie(partie) for partie in DEPENDANCES_PARTIES}
+    # Les valeurs sont partagées avec le cache : on rend une copie.
+    return copy.deepcopy(situation)
+
+def rafraichir_situation():
+    """Met l'instantané à jour tout de suite (après une synchronisation), pour que le prochain message n'attende pas."""
+    for partie in DEPENDANCES_PARTIES:
+        _partie(partie)
+
+def statistiques_situation() -> dict:
+    """Nombre de lectures de l'instantané et nombre de recalculs de chaque partie."""
+    with _lock:
+        return {"lectures": _statistiques["lectures"], "recalculs": dict(_statistiques["recalculs"])}
@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 
 # On importe les fonctions de notre agent mémoire pour ne pas interagir directement avec les fichiers.
-from .agent_memoire import lire_donnees_json, ecrire_donnees_json
+from .agent_memoire import lire_donnees_json, ecrire_donnees_json, sous_verrou
 from .agent_projets import lister_projets
 import uuid # Pour générer des identifiants uniques pour chaque tâche
-from datetime import datetime
 import logging
+from .agent_temps import horodater, horodater_maintenant
 
 NOM_FICHIER_TACHES = 'taches.json'
+# Les dates sont stockées en ISO (pour l'affichage) + '_epoch' (entier UTC, pour les calculs) + '_tz' (fuseau d'origine).
+CHAMPS_DATES_TACHE = ('date_echeance', 'date_creation', 'date_modification')
+CHAMPS_DATES_SOUS_TACHE = ('date_creation', 'date_modification')
+ERREUR_DATE_INVALIDE = "Date '{date}' invalide. Format attendu : ISO 8601 (YYYY-MM-DDTHH:MM:SS)."
 logger = logging.getLogger(__name__)
 
 def _calculer_priorite(important: bool, urgent: bool) -> str:
@@ -21,6 +25,7 @@ def _calculer_priorite(important: bool, urgent: bool) -> str:
     else:
         return "P4 : Ni Urgent, ni Important (À abandonner/reporter)"
 
+@sous_verrou(NOM_FICHIER_TACHES)
 def ajouter_tache(description: str, nom_projet: str = None, important: bool = False, urgent: bool = False, date_echeance: str = None) -> dict:
     """
     Ajoute une nouvelle tâche. Calcule dynamiquement sa position ('ordre')
@@ -52,9 +57,6 @@ def ajouter_tache(description: str, nom_projet: str = None, important: bool = Fa
         'description': description,
         'statut': 'à faire',
         'projet_id': projet_id,
-        'date_creation': datetime.now().isoformat(),
-        'date_modification': datetime.now().isoformat(),
-        'date_echeance': date_echeance,
         'important': important,
         'urgent': urgent,
         'priorite': priorite,
@@ -62,21 +64,23 @@ def ajouter_tache(description: str, nom_projet: str = None, important: bool = Fa
         'suivi_envoye': False,
         'google_calendar_event_id': None
     }
+    horodater_maintenant(nouvelle_tache, 'date_creation')
+    horodater_maintenant(nouvelle_tache, 'date_modification')
+    try:
+        horodater(nouvelle_tache, 'date_echeance', date_echeance)
+    except ValueError:
+        logger.error("🔥 TÂCHES: Date d'échéance invalide pour la tâche '%s': %s", description, date_echeance)
+        return {"erreur": ERREUR_DATE_INVALIDE.format(date=date_echeance)}
     taches.append(nouvelle_tache)
     ecrire_donnees_json(NOM_FICHIER_TACHES, taches)
     logger.info("✅ TÂCHES: Tâche '%s' ajoutée avec succès avec l'ordre %f.", description, nouvel_ordre)
     return nouvelle_tache
 
-def lister_taches() -> list:
+def _controler_taches(taches: list, projets: list) -> bool:
     """
-    Récupère la liste de toutes les tâches, les enrichit, les répare si nécessaire,
-    et les trie par ordre de priorité Eisenhower PUIS par ordre personnalisé.
-    Cette fonction agit comme un "contrôleur qualité" pour les données.
+    "Contrôleur qualité" des tâches : répare et migre les données en mémoire
+    (priorité, ordre, horodatages epoch, nom et émoji du projet). Retourne True si quelque chose a changé.
     """
-    logger.debug("💾 TÂCHES: Lecture et vérification de toutes les tâches demandées.")
-    taches = lire_donnees_json(NOM_FICHIER_TACHES)
-    projets = lister_projets()
-    
     # On crée un dictionnaire pour trouver rapidement les infos d'un projet par son ID
     projets_map = {p['id']: {'nom': p['nom'], 'emoji': p.get('emoji')} for p in projets}
     
@@ -100,6 +104,19 @@ def lister_taches() -> list:
             tache['ordre'] = float(tache.get('ordre', 9999))
             modifications_effectuees = True
 
+    # Migration des dates : les anciennes tâches n'ont que la date ISO, sans horodatage epoch.
+    for tache in taches:
+        objets = [(tache, CHAMPS_DATES_TACHE)] + [(st, CHAMPS_DATES_SOUS_TACHE) for st in tache.get('sous_taches', [])]
+        for objet, champs in objets:
+            for champ in champs:
+                if objet.get(champ) and f"{champ}_epoch" not in objet:
+                    try:
+                        horodater(objet, champ, objet[champ])
+                    except ValueError:
+                        logger.warning("⚠️ TÂCHES: Date '%s' illisible dans le champ '%s' de '%s', ignorée.", objet[champ], champ, objet.get('description'))
+                        objet[f"{champ}_epoch"] = None
+                    modifications_effectuees = True
+
     # La logique de re-numérotation agressive est supprimée.
     # On se contente de trier.
 
@@ -122,10 +139,27 @@ def lister_taches() -> list:
                     tache['nom_projet'] = 'Projet inconnu ou supprimé'
                     modifications_effectuees = True
 
-    if modifications_effectuees:
+    return modifications_effectuees
+
+@sous_verrou(NOM_FICHIER_TACHES)
+def migrer_taches():
+    """Applique le contrôleur qualité au fichier des tâches et l'enregistre (à lancer au démarrage)."""
+    taches = lire_donnees_json(NOM_FICHIER_TACHES)
+    if _controler_taches(taches, lister_projets()):
         logger.info("⚙️ TÂCHES: Le contrôleur qualité a corrigé/migré des données dans les tâches.")
         ecrire_donnees_json(NOM_FICHIER_TACHES, taches)
 
+def lister_taches() -> list:
+    """
+    Récupère la liste de toutes les tâches, les enrichit, les répare si nécessaire,
+    et les trie par ordre de priorité Eisenhower PUIS par ordre personnalisé.
+    Lecture seule : les réparations sont faites en mémoire (elles sont enregistrées au démarrage
+    par migrer_taches(), ou par la prochaine écriture), lister_taches peut donc s'exécuter en parallèle.
+    """
+    logger.debug("💾 TÂCHES: Lecture et vérification de toutes les tâches demandées.")
+    taches = lire_donnees_json(NOM_FICHIER_TACHES)
+    _controler_taches(taches, lister_projets())
+
     # On trie les tâches par priorité (P1, P2, P3, P4) PUIS par leur ordre personnalisé.
     taches.sort(key=lambda x: (x.get('priorite', 'P9'), x.get('ordre', 999.0)))
     
@@ -168,6 +202,7 @@ def _trouver_tache(description_tache: str, taches: list) -> dict:
             return tache
     return None
 
+@sous_verrou(NOM_FICHIER_TACHES)
 def reorganiser_taches(priorite_cible: str, descriptions_ordonnees: list) -> dict:
     """
     Réorganise l'ordre des tâches pour une priorité donnée en utilisant une méthode de "moyenne".
@@ -226,6 +261,7 @@ def reorganiser_taches(priorite_cible: str, descriptions_ordonnees: list) -> dic
     return {"succes": f"L'ordre des tâches {priorite_cible_norm} a été mis à jour."}
 
 
+@sous_verrou(NOM_FICHIER_TACHES)
 def modifier_tache(description_actuelle: str, nouvelle_description: str = None, nom_projet: str = None, nouvelle_importance: bool = None, nouvelle_urgence: bool = None, nouvelle_date_echeance: str = None, suivi_envoye: bool = None) -> dict:
     """
     Modifie une tâche. La tâche est identifiée par sa description actuelle.
@@ -254,7 +290,10 @@ def modifier_tache(description_actuelle: str, nouvelle_description: str = None,
         modifications_faites = True
 
     if nouvelle_date_echeance is not None:
-        tache_a_modifier['date_echeance'] = nouvelle_date_echeance
+        try:
+            horodater(tache_a_modifier, 'date_echeance', nouvelle_date_echeance)
+        except ValueError:
+            return {"erreur": ERREUR_DATE_INVALIDE.format(date=nouvelle_date_echeance)}
         tache_a_modifier['suivi_envoye'] = False # On ré-arme le suivi !
         modifications_faites = True
 
@@ -278,13 +317,14 @@ def modifier_tache(description_actuelle: str, nouvelle_description: str = None,
         tache_a_modifier['priorite'] = _calculer_priorite(importance, urgence)
 
     if modifications_faites:
-        tache_a_modifier['date_modification'] = datetime.now().isoformat()
+        horodater_maintenant(tache_a_modifier, 'date_modification')
         ecrire_donnees_json(NOM_FICHIER_TACHES, taches)
         logger.info("✅ TÂCHES: Tâche '%s' modifiée avec succès.", description_actuelle)
         return tache_a_modifier
     else:
         return {"info": "Aucune modification demandée."}
 
+@sous_verrou(NOM_FICHIER_TACHES)
 def changer_statut_tache(description_tache: str, nouveau_statut: str) -> dict:
     """
     Change le statut d'une tâche ('à faire', 'en cours', 'terminée').
@@ -301,10 +341,11 @@ def changer_statut_tache(description_tache: str, nouveau_statut: str) -> dict:
         return {"erreur": f"Tâche '{description_tache}' non trouvée."}
 
     tache_a_modifier['statut'] = nouveau_statut
-    tache_a_modifier['date_modification'] = datetime.now().isoformat()
+    horodater_maintenant(tache_a_modifier, 'date_modification')
     ecrire_donnees_json(NOM_FICHIER_TACHES, taches)
     return tache_a_modifier
 
+@sous_verrou(NOM_FICHIER_TACHES)
 def supprimer_tache(description_tache: str) -> dict:
     """
     Supprime une tâche en se basant sur sa description.
@@ -324,12 +365,13 @@ def supprimer_tache(description_tache: str) -> dict:
     ecrire_donnees_json(NOM_FICHIER_TACHES, taches)
     logger.info("✅ TÂCHES: Tâche '%s' supprimée avec succès.", description_tache)
     
-    response = {"succes": f"La tâche '{description_tache}' a été supprimée."}
+    response = {"succes": f"La tâche '{description_tache}' a été supprimée.", "id": tache_a_supprimer['id']}
     if event_id:
         response["google_calendar_event_id"] = event_id
         
     return response
 
+@sous_verrou(NOM_FICHIER_TACHES)
 def lier_tache_a_evenement(id_tache: str, id_evenement: str) -> dict:
     """Associe un ID d'événement Google Calendar à une tâche."""
     logger.info("💾 TÂCHES: Liaison de la tâche ID '%s' à l'événement ID '%s'.", id_tache, id_evenement)
@@ -341,13 +383,14 @@ def lier_tache_a_evenement(id_tache: str, id_evenement: str) -> dict:
         return {"erreur": f"Tâche avec l'ID '{id_tache}' non trouvée."}
 
     tache_a_lier['google_calendar_event_id'] = id_evenement
-    tache_a_lier['date_modification'] = datetime.now().isoformat()
+    horodater_maintenant(tache_a_lier, 'date_modification')
     ecrire_donnees_json(NOM_FICHIER_TACHES, taches)
     logger.info("✅ TÂCHES: Liaison effectuée avec succès.")
     return {"succes": "Liaison de la tâche à l'événement de calendrier réussie."}
 
 # === FONCTIONS POUR LES SOUS-TÂCHES ===
 
+@sous_verrou(NOM_FICHIER_TACHES)
 def ajouter_sous_tache(description_tache_parent: str, description_sous_tache: str, important: bool = False, urgent: bool = False) -> dict:
     """
     Ajoute une sous-tâche à une tâche existante.
@@ -375,15 +418,15 @@ def ajouter_sous_tache(description_tache_parent: str, description_sous_tache: st
         'id': f'sous_{uuid.uuid4()}',
         'description': description_sous_tache,
         'statut': 'à faire',
-        'date_creation': datetime.now().isoformat(),
-        'date_modification': datetime.now().isoformat(),
         'important': important,
         'urgent': urgent,
         'priorite': _calculer_priorite(important, urgent)
     }
+    horodater_maintenant(nouvelle_sous_tache, 'date_creation')
+    horodater_maintenant(nouvelle_sous_tache, 'date_modification')
 
     tache_parent['sous_taches'].append(nouvelle_sous_tache)
-    tache_parent['date_modification'] = datetime.now().isoformat()
+    horodater_maintenant(tache_parent, 'date_modification')
     
     ecrire_donnees_json(NOM_FICHIER_TACHES, taches)
     logger.info("✅ SOUS-TÂCHES: Sous-tâche '%s' ajoutée avec succès.", description_sous_tache)
@@ -435,6 +478,7 @@ def _trouver_sous_tache(description_tache_parent: str, id_ou_description_sous_ta
     
     return tache_parent, None
 
+@sous_verrou(NOM_FICHIER_TACHES)
 def modifier_sous_tache(description_tache_parent: str, description_sous_tache_actuelle: str, nouvelle_description: str = None, nouvelle_importance: bool = None, nouvelle_urgence: bool = None) -> dict:
     """
     Modifie une sous-tâche existante.
@@ -472,14 +516,15 @@ def modifier_sous_tache(description_tache_parent: str, description_sous_tache_ac
         sous_tache['priorite'] = _calculer_priorite(importance, urgence)
 
     if modifications_faites:
-        sous_tache['date_modification'] = datetime.now().isoformat()
-        tache_parent['date_modification'] = datetime.now().isoformat()
+        horodater_maintenant(sous_tache, 'date_modification')
+        horodater_maintenant(tache_parent, 'date_modification')
         ecrire_donnees_json(NOM_FICHIER_TACHES, taches)
         logger.info("✅ SOUS-TÂCHES: Sous-tâche '%s' modifiée avec succès.", description_sous_tache_actuelle)
         return {"succes": f"Sous-tâche modifiée avec succès.", "details": sous_tache}
     else:
         return {"info": "Aucune modification demandée."}
 
+@sous_verrou(NOM_FICHIER_TACHES)
 def changer_statut_sous_tache(description_tache_parent: str, description_sous_tache: str, nouveau_statut: str) -> dict:
     """
     Change le statut d'une sous-tâche ('à faire', 'en cours', 'terminée').
@@ -499,13 +544,14 @@ def changer_statut_sous_tache(description_tache_parent: str, description_sous_ta
         return {"erreur": f"Sous-tâche '{description_sous_tache}' non trouvée."}
 
     sous_tache['statut'] = nouveau_statut
-    sous_tache['date_modification'] = datetime.now().isoformat()
-    tache_parent['date_modification'] = datetime.now().isoformat()
+    horodater_maintenant(sous_tache, 'date_modification')
+    horodater_maintenant(tache_parent, 'date_modification')
     
     ecrire_donnees_json(NOM_FICHIER_TACHES, taches)
     logger.info("✅ SOUS-TÂCHES: Statut de la sous-tâche '%s' changé vers '%s'.", description_sous_tache, nouveau_statut)
     return {"succes": f"Statut de la sous-tâche '{description_sous_tache}' changé vers '{nouveau_statut}'.", "details": sous_tache}
 
+@sous_verrou(NOM_FICHIER_TACHES)
 def supprimer_sous_tache(description_tache_parent: str, description_sous_tache: str) -> dict:
     """
     Supprime une sous-tâche d'une tâche parent.
@@ -521,7 +567,7 @@ def supprimer_sous_tache(description_tache_parent: str, description_sous_tache:
         return {"erreur": f"Sous-tâche '{description_sous_tache}' non trouvée."}
 
     tache_parent['sous_taches'].remove(sous_tache)
-    tache_parent['date_modification'] = datetime.now().isoformat()
+    horodater_maintenant(tache_parent, 'date_modification')
     
     ecrire_donnees_json(NOM_FICHIER_TACHES, taches)
     logger.info("✅ SOUS-TÂCHES: Sous-tâche '%s' supprimée avec succès.", description_sous_tache)
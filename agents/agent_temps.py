@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+# Couche de normalisation des dates.
+# Les dates arrivent sous des formes variées (ISO avec ou sans fuseau, dates seules des événements
+# sur la journée entière...). On les analyse UNE SEULE FOIS, à l'écriture, pour stocker :
+#   - un horodatage epoch UTC entier (en secondes), sur lequel se font comparaisons, tris et filtres,
+#   - le fuseau d'origine, pour pouvoir réafficher la date telle qu'elle a été donnée.
+# Le format ISO n'est reconstruit qu'à l'affichage (réponses envoyées à Gemini).
+
+import re
+import time
+import datetime
+import logging
+
+import pytz
+from dateutil import parser
+
+logger = logging.getLogger(__name__)
+
+# Fuseau appliqué aux dates données sans fuseau (l'utilisateur est à Paris).
+FUSEAU_DEFAUT = pytz.timezone("Europe/Paris")
+
+_DECALAGE = re.compile(r'^([+-])(\d{2}):(\d{2})$')
+
+
+def maintenant_epoch() -> int:
+    """Heure actuelle en secondes epoch UTC."""
+    return int(time.time())
+
+def _nom_fuseau(heure: datetime.datetime) -> str:
+    """Nom du fuseau d'une heure "aware" : nom IANA si connu, 'UTC', sinon décalage '+02:00'."""
+    zone = getattr(heure.tzinfo, 'zone', None)
+    if zone:
+        return zone
+    decalage = heure.utcoffset()
+    if not decalage:
+        return 'UTC'
+    minutes = int(decalage.total_seconds() // 60)
+    signe = '+' if minutes >= 0 else '-'
+    return f"{signe}{abs(minutes) // 60:02d}:{abs(minutes) % 60:02d}"
+
+def fuseau(nom: str = None):
+    """Retrouve un fuseau à partir du nom stocké (nom IANA, 'UTC' ou décalage '+02:00')."""
+    if not nom:
+        return FUSEAU_DEFAUT
+    if nom == 'UTC':
+        return pytz.utc
+    decalage = _DECALAGE.match(nom)
+    if decalage:
+        signe, heures, minutes = decalage.groups()
+        return pytz.FixedOffset((1 if signe == '+' else -1) * (int(heures) * 60 + int(minutes)))
+    try:
+        return pytz.timezone(nom)
+    except pytz.UnknownTimeZoneError:
+        logger.warning(f"⚠️ TEMPS: Fuseau '{nom}' inconnu, utilisation de {FUSEAU_DEFAUT.zone}.")
+        return FUSEAU_DEFAUT
+
+def vers_epoch(valeur: str, fuseau_defaut=None) -> tuple:
+    """
+    Analyse une date ISO et retourne (epoch UTC, nom du fuseau d'origine), ou (None, None) si vide.
+    Une date sans fuseau est interprétée dans 'fuseau_defaut' (Paris par défaut).
+    Lève ValueError si la date est invalide.
+    """
+    if not valeur:
+        return None, None
+    heure = parser.isoparse(valeur)
+    if heure.tzinfo is None or heure.tzinfo.utcoffset(heure) is None:
+        zone = fuseau_defaut or FUSEAU_DEFAUT
+        heure = zone.localize(heure.replace(tzinfo=None))
+    return int(heure.timestamp()), _nom_fuseau(heure)
+
+def depuis_epoch(epoch: int, nom_fuseau: str = None) -> datetime.datetime:
+    """Reconstruit une heure "aware" dans son fuseau d'origine."""
+    return datetime.datetime.fromtimestamp(epoch, fuseau(nom_fuseau))
+
+def vers_iso(epoch: int, nom_fuseau: str = None) -> str:
+    """Formate un horodatage en ISO 8601 dans son fuseau d'origine (pour l'affichage uniquement)."""
+    if epoch is None:
+        return None
+    return depuis_epoch(epoch, nom_fuseau).isoformat()
+
+def horodater(objet: dict, champ: str, valeur: str):
+    """
+    Enregistre une date dans un objet stocké : 'champ' (ISO, pour l'affichage),
+    'champ_epoch' (entier, pour les calculs) et 'champ_tz' (fuseau d'origine).
+    Une valeur vide efface la date. Lève ValueError si la date est invalide.
+    """
+    epoch, nom_fuseau = vers_epoch(valeur)
+    objet[champ] = vers_iso(epoch, nom_fuseau)
+    objet[f"{champ}_epoch"] = epoch
+    objet[f"{champ}_tz"] = nom_fuseau
+
+def horodater_maintenant(objet: dict, champ: str):
+    """Enregistre l'heure actuelle (heure de Paris) dans 'champ', au même format que horodater()."""
+    epoch = maintenant_epoch()
+    objet[champ] = vers_iso(epoch, FUSEAU_DEFAUT.zone)
+    objet[f"{champ}_epoch"] = epoch
+    objet[f"{champ}_tz"] = FUSEAU_DEFAUT.zone
+
+def borne_evenement_epoch(borne: dict) -> int:
+    """
+    Convertit le 'start' ou le 'end' d'un événement Google en epoch UTC.
+    Une date seule (événement sur la journée entière) correspond à minuit dans le fuseau de l'événement.
+    """
+    valeur = borne.get('dateTime', borne.get('date'))
+    if not valeur:
+        return None
+    epoch, _ = vers_epoch(valeur, fuseau(borne.get('timeZone')))
+    return epoch
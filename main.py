@@ -24,11 +24,11 @@ if google_token_json:
 # --- Fin de la section de déploiement ---
 
 import logging
-import logging.handlers # Nécessaire pour la rotation des logs
 from dotenv import load_dotenv
 import datetime
-from dateutil import parser # Pour parser les dates ISO plus facilement
 import asyncio
+import contextlib
+import weakref
 # from apscheduler.schedulers.asyncio import AsyncIOScheduler # On le supprime
 import pytz # Pour gérer les fuseaux horaires
 
@@ -41,23 +41,188 @@ from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 
 # Importation de notre nouveau routeur intelligent et des fonctions des agents
-from agents.agent_conseiller import router_requete_utilisateur, generer_contexte_complet
-from agents.agent_taches import lister_taches, modifier_tache
+from agents.agent_journal import configurer_journal
+from agents.agent_conseiller import router_requete_utilisateur_async, generer_contexte_dynamique
+from agents.agent_prompt import PROMPT_CONVERSATION, PROMPT_REGLES
+from agents.agent_cache_gemini import vider_caches as vider_caches_gemini
+from agents.agent_historique import lancer_compaction, noter_requete
+from agents.agent_raccourcis import repondre_raccourci
+from agents.agent_situation import rafraichir_situation
+from agents.agent_echeances import Echeance, suivre_requete, annuler_requete
+from agents.agent_boite_envoi import demarrer_boite_envoi, arreter_boite_envoi
+from agents.agent_taches import lister_taches, modifier_tache, migrer_taches
 # On importe les nouvelles fonctions dont le superviseur a besoin
-from agents.agent_calendrier import lister_evenements_passes
+from agents.agent_calendrier import prochaine_fin_evenement
+from agents.agent_calendrier_async import lister_evenements_passes_async, fermer_session as fermer_session_calendrier
+from agents import agent_notifications_calendrier as notifications_calendrier
+from agents.agent_quota_calendrier import statistiques_quota
+from agents.agent_temps import maintenant_epoch, depuis_epoch
 from agents.agent_memoire import lire_evenements_suivis, ajouter_evenement_suivi
-from agents.agent_projets import lister_projets
+from agents.agent_projets import lister_projets, migrer_projets
 
 # Variable globale pour stocker le dernier chat_id actif (simplification pour le moment)
 dernier_chat_id_actif = None
 
+# Intervalle du superviseur : toutes les 2 minutes en mode "polling". Si les notifications
+# push du calendrier sont actives, il n'est plus qu'un filet de sécurité.
+INTERVALLE_SUPERVISEUR = 120
+INTERVALLE_SUPERVISEUR_PUSH = 30 * 60
+# Marge après une fin d'événement ou une échéance de tâche avant de réveiller le superviseur (en secondes).
+MARGE_REVEIL_SECONDES = 30
+
+# Une seule exécution du superviseur à la fois : un réveil pendant une exécution est reporté à sa fin.
+_superviseur_en_cours = False
+_superviseur_a_relancer = False
+
+# Nombre de mises à jour Telegram traitées en même temps (donc de conversations qui avancent en parallèle).
+CONVERSATIONS_SIMULTANEES_MAX = int(os.getenv("BOT_CONCURRENT_UPDATES", "16"))
+# Telegram efface l'indicateur "écrit..." au bout d'environ 5 secondes : on le renvoie régulièrement.
+INTERVALLE_INDICATEUR_SAISIE = 4
+# Réponses en flux : le message Telegram est modifié au fur et à mesure que l'IA écrit.
+# Mettre BOT_STREAMING=0 pour revenir à l'envoi de la réponse complète en une seule fois.
+REPONSES_EN_FLUX = os.getenv("BOT_STREAMING", "1") != "0"
+# Telegram limite les modifications d'un même message : au plus une modification par intervalle (en secondes).
+INTERVALLE_EDITION_FLUX = float(os.getenv("BOT_STREAMING_EDIT_INTERVAL", "1.0"))
+# Au-delà de cette longueur, Telegram refuse le message : on arrête l'aperçu et on attend la réponse complète.
+LONGUEUR_MAX_MESSAGE = 4096
+
+# Un verrou par chat, pour traiter les messages d'une même conversation l'un après l'autre.
+# Références faibles : le verrou d'un chat disparaît dès que plus aucun message de ce chat n'est en cours ou en attente.
+_verrous_conversations = weakref.WeakValueDictionary()
+
+
+def _verrou_conversation(chat_id: int) -> asyncio.Lock:
+    verrou = _verrous_conversations.get(chat_id)
+    if verrou is None:
+        verrou = _verrous_conversations[chat_id] = asyncio.Lock()
+    return verrou
+
+
+@contextlib.asynccontextmanager
+async def indicateur_saisie(bot, chat_id: int):
+    """Affiche "écrit..." dans le chat tant que le bloc s'exécute."""
+    async def rafraichir():
+        while True:
+            try:
+                await bot.send_chat_action(chat_id=chat_id, action='typing')
+            except Exception as e:
+                logger.debug(f"Indicateur de saisie non envoyé pour le chat {chat_id}: {e}")
+            await asyncio.sleep(INTERVALLE_INDICATEUR_SAISIE)
+
+    tache = asyncio.create_task(rafraichir())
+    try:
+        yield
+    finally:
+        tache.cancel()
+
+
+_BALISE_HTML = re.compile(r'<(/?)([a-zA-Z][a-zA-Z0-9-]*)[^<>]*>')
+
+
+def equilibrer_html(texte: str) -> str:
+    """
+    Rend affichable un morceau de réponse HTML en cours d'écriture : retire la balise ou l'entité
+    coupée en plein milieu, puis ferme les balises restées ouvertes (Telegram refuse le HTML déséquilibré).
+    """
+    texte = re.sub(r'<[^<>]*$', '', texte)
+    texte = re.sub(r'&[#a-zA-Z0-9]*$', '', texte)
+    ouvertes = []
+    for fermeture, nom in _BALISE_HTML.findall(texte):
+        nom = nom.lower()
+        if not fermeture:
+            ouvertes.append(nom)
+        elif nom in ouvertes:
+            # On ferme la dernière balise ouverte portant ce nom.
+            del ouvertes[len(ouvertes) - 1 - ouvertes[::-1].index(nom)]
+    return texte + "".join(f"</{nom}>" for nom in reversed(ouvertes))
+
+
+class ReponseEnFlux:
+    """
+    Message Telegram qui affiche la réponse de l'IA pendant sa génération.
+    Le premier morceau de texte est envoyé dès qu'il arrive, puis le message est modifié
+    au plus une fois par INTERVALLE_EDITION_FLUX. terminer() affiche la réponse complète.
+    """
+
+    def __init__(self, message_utilisateur):
+        self._message_utilisateur = message_utilisateur
+        self._message = None
+        self._texte_affiche = ""
+        self._derniere_edition = 0.0
+
+    async def recevoir(self, texte: str):
+        """Reçoit le texte généré jusqu'ici (appelé par le routeur à chaque nouveau morceau)."""
+        if len(texte) > LONGUEUR_MAX_MESSAGE:
+            return
+        if self._message and self._attente_avant_edition() > 0:
+            return
+        await self._afficher(equilibrer_html(texte))
+
+    async def terminer(self, texte_final: str):
+        """Affiche la réponse finale, telle qu'elle est enregistrée dans l'historique."""
+        if self._message is None:
+            await self._message_utilisateur.reply_html(texte_final)
+            return
+        if texte_final == self._texte_affiche:
+            return
+        # La dernière modification doit elle aussi respecter la limite de Telegram.
+        await asyncio.sleep(self._attente_avant_edition())
+        try:
+            await self._message.edit_text(texte_final, parse_mode='HTML')
+        except Exception as e:
+            logger.warning(f"⚠️ FLUX: Modification finale impossible ({e}), envoi d'un nouveau message.")
+            with contextlib.suppress(Exception):
+                await self._message.delete()
+            await self._message_utilisateur.reply_html(texte_final)
+
+    def _attente_avant_edition(self) -> float:
+        ecoule = asyncio.get_running_loop().time() - self._derniere_edition
+        return max(0.0, INTERVALLE_EDITION_FLUX - ecoule)
+
+    async def _afficher(self, texte: str):
+        if not texte.strip() or texte == self._texte_affiche:
+            return
+        try:
+            if self._message is None:
+                self._message = await self._message_utilisateur.reply_html(texte)
+            else:
+                await self._message.edit_text(texte, parse_mode='HTML')
+            self._texte_affiche = texte
+        except Exception as e:
+            # Un aperçu refusé n'est pas grave : le suivant (ou la réponse finale) le remplacera.
+            logger.debug(f"Aperçu de la réponse non affiché: {e}")
+        self._derniere_edition = asyncio.get_running_loop().time()
+
 
 # --- Nouvelle fonction de Suivi Intelligent (Le "Superviseur") ---
 async def suivi_intelligent(context: ContextTypes.DEFAULT_TYPE):
     """
     Cette fonction est le "Superviseur". Elle vérifie les tâches et événements
-    et déclenche des messages proactifs via l'IA.
+    et déclenche des messages proactifs via l'IA (voir _verifier_suivis).
+    Les réveils (exécution régulière, notification push, fin d'événement, échéance) peuvent se croiser :
+    si une exécution est déjà en cours, le réveil est noté et une seule nouvelle vérification a lieu
+    à la fin de celle-ci, pour ne jamais envoyer deux fois le même suivi.
     """
+    global _superviseur_en_cours, _superviseur_a_relancer
+    if _superviseur_en_cours:
+        _superviseur_a_relancer = True
+        logger.debug("⏰ SUPERVISEUR: Déjà en cours, nouvelle vérification prévue à la fin.")
+        return
+    _superviseur_en_cours = True
+    try:
+        while True:
+            _superviseur_a_relancer = False
+            await _verifier_suivis(context)
+            if not _superviseur_a_relancer:
+                break
+    finally:
+        _superviseur_en_cours = False
+
+    if notifications_calendrier.est_active():
+        await planifier_prochain_reveil(context.job_queue)
+
+async def _verifier_suivis(context: ContextTypes.DEFAULT_TYPE):
+    """Une vérification du superviseur : tâches en retard, puis événements terminés."""
     global dernier_chat_id_actif
     if not dernier_chat_id_actif:
         # On ne log que si on est en mode DEBUG pour ne pas polluer les logs
@@ -67,24 +232,29 @@ async def suivi_intelligent(context: ContextTypes.DEFAULT_TYPE):
     logger.info(f"⏰ SUPERVISEUR: Vérification des suivis proactifs pour le chat ID {dernier_chat_id_actif}...")
 
     try:
+        # Les trois lectures sont indépendantes : on les lance en même temps. Le calendrier passe
+        # par le client asynchrone (tous les calendriers sont synchronisés en parallèle),
+        # les fichiers JSON sont lus dans des threads pour ne pas bloquer la boucle.
+        toutes_les_taches, evenements_passes, projets = await asyncio.gather(
+            asyncio.to_thread(lister_taches),
+            lister_evenements_passes_async(jours=1), # On regarde les dernières 24h
+            asyncio.to_thread(lister_projets),
+        )
+        # Le miroir du calendrier vient d'être synchronisé : on met l'instantané de la situation à jour
+        # maintenant, pour que le prochain message et les suivis ci-dessous n'aient plus qu'à le lire.
+        await asyncio.to_thread(rafraichir_situation)
+
         # --- 1. SUIVI DES TÂCHES EN RETARD ---
-        toutes_les_taches = lister_taches()
-        paris_tz = pytz.timezone("Europe/Paris")
-        maintenant = datetime.datetime.now(paris_tz)
+        maintenant = maintenant_epoch()
 
         for tache in toutes_les_taches:
-            # Condition 1: La tâche a une échéance, est toujours "à faire" et n'a pas eu de suivi
-            if tache.get("date_echeance") and tache.get("statut") == "à faire" and not tache.get("suivi_envoye"):
+            # Condition 1: La tâche a une échéance, est toujours "à faire" et n'a pas eu de suivi.
+            # L'échéance a été normalisée en epoch à l'écriture : plus besoin de la re-parser ici.
+            if tache.get("date_echeance_epoch") is not None and tache.get("statut") == "à faire" and not tache.get("suivi_envoye"):
                 try:
-                    # On convertit la date d'échéance en objet datetime
-                    date_echeance = parser.isoparse(tache["date_echeance"])
-                    
-                    # Si la date est "naive", on la rend "aware" en lui assignant le fuseau de Paris
-                    if date_echeance.tzinfo is None or date_echeance.tzinfo.utcoffset(date_echeance) is None:
-                        date_echeance = paris_tz.localize(date_echeance)
-                    
                     # Condition 2: L'échéance est passée
-                    if maintenant > date_echeance:
+                    if maintenant > tache["date_echeance_epoch"]:
+                        date_echeance = depuis_epoch(tache["date_echeance_epoch"], tache.get("date_echeance_tz"))
                         logger.info(f"🧠 INITIATEUR: Tâche '{tache['description']}' en retard. Préparation du suivi.")
                         
                         # C'est ici l'intelligence : on crée un prompt pour l'IA
@@ -98,12 +268,13 @@ async def suivi_intelligent(context: ContextTypes.DEFAULT_TYPE):
                         
                         # On simule une conversation initiée par le bot
                         historique_proactif = [
-                            {"role": "system", "content": generer_contexte_complet(datetime.datetime.now(pytz.timezone("Europe/Paris")).strftime('%Y-%m-%d %H:%M:%S'))},
+                            {"role": "system", "content": PROMPT_REGLES},
                             {"role": "user", "content": prompt_initiateur}
                         ]
+                        contexte = await asyncio.to_thread(generer_contexte_dynamique, datetime.datetime.now(pytz.timezone("Europe/Paris")).strftime('%Y-%m-%d %H:%M:%S'), prompt_initiateur)
                         
                         # On appelle directement le routeur pour générer la réponse
-                        reponse_ia = router_requete_utilisateur(historique_proactif)
+                        reponse_ia = await router_requete_utilisateur_async(historique_proactif, contexte=contexte)
                         
                         # On envoie le message généré par l'IA à l'utilisateur
                         await context.bot.send_message(chat_id=dernier_chat_id_actif, text=reponse_ia, parse_mode='HTML')
@@ -113,13 +284,12 @@ async def suivi_intelligent(context: ContextTypes.DEFAULT_TYPE):
                         modifier_tache(description_actuelle=tache['description'], suivi_envoye=True)
                         logger.info(f"💾 TÂCHE MISE À JOUR: Le suivi pour '{tache['description']}' est marqué comme envoyé.")
                         
-                except (parser.ParserError, TypeError) as e:
-                    logger.warning(f"⚠️ SUPERVISEUR: Impossible de parser la date d'échéance '{tache.get('date_echeance')}' pour la tâche '{tache.get('description')}'. Erreur: {e}")
+                except (ValueError, TypeError, OverflowError) as e:
+                    logger.warning(f"⚠️ SUPERVISEUR: Date d'échéance illisible '{tache.get('date_echeance')}' pour la tâche '{tache.get('description')}'. Erreur: {e}")
                     continue
 
         # --- 2. NOUVEAU : SUIVI DES ÉVÉNEMENTS TERMINÉS ---
         logger.info("⏰ SUPERVISEUR: Vérification des événements terminés...")
-        evenements_passes = lister_evenements_passes(jours=1) # On regarde les dernières 24h
         # CORRECTION : On s'assure que les événements ont un 'summary' avant de les logger pour éviter un crash.
         logger.debug(f"SUPERVISEUR_DEBUG: Événements passés trouvés: {[e.get('summary', 'Événement sans titre') for e in evenements_passes]}")
 
@@ -128,8 +298,6 @@ async def suivi_intelligent(context: ContextTypes.DEFAULT_TYPE):
         evenements_deja_suivis_ids = {item['id_evenement'] if isinstance(item, dict) else item for item in evenements_deja_suivis_bruts}
         logger.debug(f"SUPERVISEUR_DEBUG: IDs des événements déjà suivis (nettoyés): {evenements_deja_suivis_ids}")
 
-        projets = lister_projets()
-
         # Le mapping par nom n'est plus nécessaire, on va comparer par ID.
 
         for event in evenements_passes:
@@ -167,7 +335,7 @@ async def suivi_intelligent(context: ContextTypes.DEFAULT_TYPE):
                 1.  **Réagis de façon naturelle et encourageante** à la fin de la séance. Varie tes introductions pour ne pas être répétitif.
                 2.  **Analyse EN SILENCE** l'objectif du projet ("{projet_associe['description']}"). pas besoin de répéter cet objectif à l'utilisateur. Il le connaît. Utilise cette information uniquement pour déduire la meilleure prochaine étape.
                 3.  **Identifie et propose la prochaine étape** logique pour ce projet.
-                4.  **Sois un véritable assistant :** Propose un créneau PRÉCIS pour cette étape après avoir consulté l'agenda de l'utilisateur (disponible dans ton contexte). Sois force de proposition.
+                4.  **Sois un véritable assistant :** Propose un créneau PRÉCIS pour cette étape après avoir cherché les disponibilités de l'utilisateur avec `trouver_creneaux_libres`. Sois force de proposition.
 
                 Le ton doit être celui d'un coach partenaire, pas d'un robot. Concis, pertinent et inspirant.
                 """
@@ -188,11 +356,12 @@ async def suivi_intelligent(context: ContextTypes.DEFAULT_TYPE):
             logger.info(f"🧠 INITIATEUR: Événement '{event.get('summary', 'Sans titre')}' terminé. Préparation du suivi proactif.")
 
             historique_proactif = [
-                {"role": "system", "content": generer_contexte_complet(datetime.datetime.now(pytz.timezone("Europe/Paris")).strftime('%Y-%m-%d %H:%M:%S'))},
+                {"role": "system", "content": PROMPT_REGLES},
                 {"role": "user", "content": prompt_initiateur}
             ]
+            contexte = await asyncio.to_thread(generer_contexte_dynamique, datetime.datetime.now(pytz.timezone("Europe/Paris")).strftime('%Y-%m-%d %H:%M:%S'), prompt_initiateur)
             
-            reponse_ia = router_requete_utilisateur(historique_proactif)
+            reponse_ia = await router_requete_utilisateur_async(historique_proactif, contexte=contexte)
             
             await context.bot.send_message(chat_id=dernier_chat_id_actif, text=reponse_ia, parse_mode='HTML')
             logger.info(f"✅ SUIVI ENVOYÉ: Message de suivi pour l'événement '{event.get('summary', 'Sans titre')}' envoyé.")
@@ -204,46 +373,85 @@ async def suivi_intelligent(context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logger.error(f"🔥 ERREUR: Le superviseur a rencontré une erreur inattendue: {e}", exc_info=True)
 
+    logger.debug(f"📊 QUOTA CALENDRIER: Appels par type depuis le démarrage: {statistiques_quota()}")
 
-# La fonction post_initialization n'est plus nécessaire
-# async def post_initialization(application: Application):
-#     """
-#     Cette fonction est appelée une fois que le bot est prêt et que la boucle
-#     d'événements asyncio est en cours d'exécution.
-#     """
-#     logger.info("🤖 BOT: Le bot est prêt, démarrage du planificateur de tâches (scheduler)...")
-#     if scheduler:
-#         scheduler.start()
-#         logger.info("✅ SCHEDULER: Le planificateur de tâches est démarré.")
 
-# --- Configuration du Logging Robuste ---
+def prochaine_echeance_tache(taches: list):
+    """Heure de la prochaine échéance d'une tâche "à faire" pas encore suivie (ou None)."""
+    maintenant = maintenant_epoch()
+    echeances = [
+        tache["date_echeance_epoch"] for tache in taches
+        if tache.get("date_echeance_epoch") is not None and tache.get("statut") == "à faire"
+        and not tache.get("suivi_envoye") and tache["date_echeance_epoch"] > maintenant
+    ]
+    return depuis_epoch(min(echeances), 'UTC') if echeances else None
 
-# 1. On crée le logger principal qui va tout attraper
-log_central = logging.getLogger()
-log_central.setLevel(logging.DEBUG) # On capture tous les niveaux de logs, du plus détaillé au plus critique.
+async def planifier_prochain_reveil(job_queue):
+    """
+    En mode push, le superviseur ne tourne plus toutes les 2 minutes : on le programme
+    pour se réveiller juste après la fin du prochain événement connu du miroir, ou juste après
+    la prochaine échéance de tâche si elle arrive avant (le suivi d'une tâche en retard part à l'heure).
+    """
+    prochaine_fin, taches = await asyncio.gather(
+        asyncio.to_thread(prochaine_fin_evenement),
+        asyncio.to_thread(lister_taches),
+    )
+    prochain = min(filter(None, (prochaine_fin, prochaine_echeance_tache(taches))), default=None)
+    for job in job_queue.get_jobs_by_name("reveil_superviseur"):
+        job.schedule_removal()
+    if prochain:
+        # Petite marge pour que l'événement soit bien terminé (ou la tâche bien en retard)
+        job_queue.run_once(suivi_intelligent, when=prochain + datetime.timedelta(seconds=MARGE_REVEIL_SECONDES), name="reveil_superviseur")
+        logger.debug(f"⏰ SUPERVISEUR: Prochain réveil programmé à {prochain.isoformat()}.")
 
-# 2. On retire les anciens "micros" (handlers) pour éviter les logs en double
-if log_central.hasHandlers():
-    log_central.handlers.clear()
 
-# 3. On crée un format pour nos messages de log, pour qu'ils soient clairs et riches en informations
-# Format: DATE_HEURE - NOM_DU_FICHIER - NIVEAU_DE_CRITICITE - MESSAGE
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+async def renouveler_canaux_notifications(context: ContextTypes.DEFAULT_TYPE):
+    """Renouvelle les canaux de notification du calendrier avant leur expiration."""
+    await asyncio.to_thread(notifications_calendrier.renouveler_canaux)
 
-# 4. On configure l'enregistrement dans un fichier (notre "boîte noire")
-# Le fichier s'appellera bot.log, il fera 5MB maximum, et on garde 3 anciens fichiers en archive.
-file_handler = logging.handlers.RotatingFileHandler('bot.log', maxBytes=5*1024*1024, backupCount=3, encoding='utf-8')
-file_handler.setLevel(logging.DEBUG) # On écrit TOUT dans le fichier, même les détails.
-file_handler.setFormatter(formatter)
 
-# 5. On configure ce qui s'affiche dans la console (pour garder un œil en direct)
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG) # On ne montre que les infos importantes dans la console pour ne pas être noyé.
-console_handler.setFormatter(formatter)
+async def post_initialization(application: Application):
+    """
+    Cette fonction est appelée une fois que le bot est prêt et que la boucle
+    d'événements asyncio est en cours d'exécution.
+    Elle migre les anciennes données des tâches et des projets, démarre le thread de la boîte d'envoi (synchronisation tâches -> calendrier), qui reprend
+    les opérations restées en attente, puis le récepteur de notifications push du calendrier s'il est configuré.
+    """
+    # Les listes de tâches et de projets sont en lecture seule : leurs anciennes données sont migrées ici, une fois.
+    await asyncio.to_thread(migrer_projets)
+    await asyncio.to_thread(migrer_taches)
+    demarrer_boite_envoi()
+    if not notifications_calendrier.est_active():
+        return
 
-# 6. On branche nos deux "micros" (fichier et console) sur le logger central
-log_central.addHandler(file_handler)
-log_central.addHandler(console_handler)
+    loop = asyncio.get_running_loop()
+
+    def reveiller_superviseur(calendar_id, changements):
+        # Appelé depuis le thread de travail des notifications : on repasse par la boucle asyncio.
+        logger.info(f"🔔 NOTIFICATIONS: Changement pertinent sur '{calendar_id}', réveil du superviseur.")
+        loop.call_soon_threadsafe(application.job_queue.run_once, suivi_intelligent, 0)
+
+    notifications_calendrier.definir_callback_reveil(reveiller_superviseur)
+    notifications_calendrier.demarrer_recepteur()
+
+
+async def post_shutdown(application: Application):
+    """
+    Ferme les canaux de notification à l'arrêt du bot pour ne pas laisser Google appeler dans le vide,
+    puis la session HTTP du client asynchrone du calendrier, et supprime les caches de contexte Gemini.
+    La boîte d'envoi termine l'opération en cours ; les autres restent enregistrées pour le prochain démarrage.
+    """
+    await asyncio.to_thread(arreter_boite_envoi)
+    if notifications_calendrier.est_active():
+        await asyncio.to_thread(notifications_calendrier.fermer_tous_les_canaux)
+    await fermer_session_calendrier()
+    await asyncio.to_thread(vider_caches_gemini)
+
+# --- Configuration du Logging Robuste ---
+
+# Fichier tournant 'bot.log' et console, écrits par un thread dédié (voir agent_journal) :
+# journaliser ne bloque jamais le bot. Niveaux réglables avec LOG_LEVEL et LOG_LEVELS.
+configurer_journal()
 
 # On utilise le logger configuré pour ce fichier. Les autres fichiers feront de même.
 logger = logging.getLogger(__name__)
@@ -268,6 +476,14 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "Vous pouvez me demander de lister vos tâches, d'en ajouter une, de créer un projet ou de vous faire un rapport de situation."
     )
 
+async def annuler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Arrête la requête en cours dans ce chat (commande /annuler)."""
+    # Pas de verrou ici : la commande doit pouvoir passer pendant que la requête s'exécute.
+    if annuler_requete(update.effective_chat.id):
+        await update.message.reply_text("🛑 D'accord, j'arrête ta demande en cours.")
+    else:
+        await update.message.reply_text("Il n'y a aucune demande en cours à annuler.")
+
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Gère tous les messages en utilisant le routeur et un historique de conversation."""
     global dernier_chat_id_actif
@@ -278,190 +494,37 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     chat_id = update.effective_chat.id
     dernier_chat_id_actif = chat_id # On sauvegarde le dernier chat ID actif
     message_text = update.message.text
-    
+
+    # Les messages d'un même chat sont traités dans l'ordre (ils partagent l'historique),
+    # pendant que les autres conversations avancent en parallèle.
+    async with _verrou_conversation(chat_id), indicateur_saisie(context.bot, chat_id):
+        await _repondre_message(update, chat_id, message_text)
+
+
+async def _repondre_message(update: Update, chat_id: int, message_text: str) -> None:
+    """Construit le prompt, interroge le routeur et envoie la réponse (appelé sous le verrou du chat)."""
+    # Les demandes courantes et sans ambiguïté sont traitées localement, sans appeler Gemini.
+    reponse_raccourci = await repondre_raccourci(message_text)
+    if reponse_raccourci:
+        # On garde l'échange dans l'historique pour que la suite de la conversation reste cohérente.
+        history = conversation_histories.setdefault(chat_id, [{"role": "system", "content": PROMPT_CONVERSATION}])
+        history.append({"role": "user", "content": message_text})
+        history.append({"role": "assistant", "content": reponse_raccourci})
+        await update.message.reply_html(reponse_raccourci)
+        return
+
     # On calcule la date et l'heure actuelles ICI, pour qu'elles soient fraîches à chaque message.
     date_actuelle = datetime.datetime.now(pytz.timezone("Europe/Paris")).strftime('%Y-%m-%d %H:%M:%S')
+    # Le contexte du moment lit les fichiers et le calendrier : on le génère hors de la boucle d'événements.
+    # Seules les leçons apprises utiles à ce message (et aux derniers échanges) y sont jointes.
+    contexte = await asyncio.to_thread(
+        generer_contexte_dynamique, date_actuelle, message_text, conversation_histories.get(chat_id)
+    )
     
-    # On définit le prompt système ici pour qu'il soit toujours à jour à chaque message.
-    # C'est la garantie que les nouvelles règles sont appliquées instantanément.
-    system_prompt = {"role": "system", "content": f"""
-Tu es Orga, un assistant personnel d'exception. Ta mission est de rendre la vie de l'utilisateur plus simple et organisée, avec une touche humaine et inspirante.
-
-{generer_contexte_complet(date_actuelle)}
-
-# Ta Personnalité & Ton Style :
-- <b>Chaleureux et Encourageant :</b> Tu es un partenaire de confiance. Utilise un ton positif et légèrement informel. Adresse-toi à l'utilisateur avec bienveillance.
-- <b>Garder la Conversation Ouverte :</b> Après avoir confirmé une action, ne termine jamais la conversation avec des phrases comme "Bonne journée" ou "Passez une bonne soirée". Conclus toujours en demandant s'il y a autre chose que tu peux faire, par exemple : "Y a-t-il autre chose pour vous aider ?" ou "Je reste à votre disposition.".
-
-# Ton Style de Conversation :
-- <b>Fluidité et Contexte :</b> C'est ta priorité absolue. Lis toujours les derniers messages de la conversation avant de répondre. Ta réponse doit être une suite logique, pas un nouveau départ.
-- <b>Sois Concis :</b> Évite les phrases de remplissage. Ne répète pas les objectifs des projets que l'utilisateur connaît déjà. Va droit au but.
-- <b>Prouve ta mémoire et ta connaissance:</b> Fais subtilement référence aux sujets précédents pour montrer que tu suis la conversation. Par exemple : "Pour faire suite à ce que nous disions sur le projet X...", "Comme tu as bientôt Y...". Pareil pour les projets, les tâches, les événements, etc. Tu es au courant de tout et tu dois aider l'utilisateur dans son organisation et réussite de ses projets.
-- <b>Naturel avant tout :</b> Parle comme un humain, pas comme une documentation.
-
-# Tes Règles de Formatage (HTML pour Telegram)
-- <b>Gras &lt;b&gt; :</b> Utilise `<b>...</b>` pour les titres de section et pour faire ressortir les éléments clés (noms de projets, priorités, etc.).
-- <b>Listes :</b> Pour lister des éléments, commence chaque élément sur une nouvelle ligne.
-    - <b>Puces Émoji :</b> Utilise des émojis comme puces pour une touche visuelle. Si une tâche est liée à un projet avec un émoji, utilise cet émoji. Sinon, "🔹" est un bon choix par défaut.
-- <b>Règle Fondamentale :</b> N'utilise JAMAIS, sous aucun prétexte, de formatage Markdown. Les étoiles (`*`), les dièses (`#`) et les tirets bas (`_`) sont interdits pour le formatage. Seul le HTML est autorisé.
-- <b>Structure pour lister les tâches :</b> Quand tu listes des tâches, tu DOIS les regrouper par priorité Eisenhower.
-    - Commence par un titre général.
-    - Ensuite, utilise les niveaux de priorité (P1, P2, etc.) comme sous-titres en gras.
-    - Ne liste que les catégories de priorité qui contiennent des tâches.
-- <b>Exemple de liste de tâches :</b>
-<b>Voici la liste de tes tâches actuelles 🎯 :</b>
-
-<b>P1 : Urgent et Important</b>
-🪵 Aller voir le mec de 7 chemins
-
-<b>P4 : Ni Urgent, ni Important</b>
-💧 Commander les cartes de visite
-💧 Intégrer une image pour améliorer la qualité du mail
-🤖 Ajouter les sous-tâches
-
-- <b>Concision des listes :</b> Quand tu listes des tâches appartenant à un projet, l'émoji du projet en tant que puce est suffisant. N'ajoute PAS de texte comme `(projet X)`.
-
-# Gestion des Sous-Tâches
-- <b>Affichage intelligent des sous-tâches :</b> Quand une tâche a des sous-tâches, affiche toujours un indicateur de progression.
-- <b>Format pour les tâches avec sous-tâches :</b>
-    - Si la tâche a des sous-tâches, ajoute entre parenthèses le nombre terminé sur le total, par exemple : `(2/5 terminées)`
-    - Utilise des émojis pour indiquer le statut : ✅ (terminée), 🔄 (en cours), ⏳ (à faire)
-- <b>Exemple d'affichage avec sous-tâches :</b>
-<b>P1 : Urgent et Important</b>
-🪵 Mettre en ligne la V2 du site (2/3 sous-tâches terminées)
-
-- <b>Détail des sous-tâches :</b> Si l'utilisateur demande spécifiquement les détails d'une tâche ou ses sous-tâches, utilise l'outil `lister_sous_taches` et présente-les avec une indentation :
-🪵 Mettre en ligne la V2 du site
-   ✅ Corriger les bugs CSS
-   🔄 Tester le formulaire de contact  
-   ⏳ Optimiser les images
-
-# Gestion du Temps et du Calendrier
-- <b>Conscience Temporelle :</b> Tu connais toujours la date et l'heure actuelles (fournies dans le contexte). Tu dois utiliser cette information pour être pertinent.
-- <b>Règle d'Or du Calendrier :</b> Ne crée JAMAIS un événement dans le passé. Si un utilisateur demande de planifier quelque chose "aujourd'hui" sans heure, tu dois regarder l'heure actuelle et proposer des créneaux futurs.
-- <b>Demander avant de créer :</b> Si une demande de création d'événement est vague (ex: "planifie une réunion demain"), tu DOIS demander l'heure précise.
-- <b>Règle de Forçage du Calendrier :</b> Lorsque tu proposes à l'utilisateur de créer un événement dans un calendrier spécifique (par exemple "dans ton calendrier 'Buche'") et qu'il accepte, tu DOIS appeler l'outil `creer_evenement_calendrier` en utilisant le paramètre `nom_calendrier_cible` pour garantir que l'événement soit placé au bon endroit. C'est une règle absolue.
-    - `Utilisateur:` "Mets 'Réunion avec le client' dans le calendrier pour demain."
-    - `Toi (BONNE RÉPONSE):` "Bien sûr ! À quelle heure souhaitez-vous planifier la 'Réunion avec le client' demain ?"
-    - `Toi (MAUVAISE RÉPONSE):` "OK, j'ai créé l'événement pour demain à 10h." -> <b>INTERDIT</b>
-
-# Règle de Synchronisation Tâche-Calendrier (Très Important !)
-- <b>Principe fondamental :</b> Le système synchronise automatiquement les tâches avec le calendrier.
-- <b>Ton rôle :</b> Pour créer ou modifier une tâche qui a une date (en utilisant `ajouter_tache` ou `modifier_tache`), tu ne dois PAS appeler en plus `creer_evenement_calendrier` ou `modifier_evenement_calendrier`. Appelle SEULEMENT l'outil de gestion de la tâche. Le système s'occupe du reste.
-- <b>Idem pour la suppression :</b> Si tu supprimes une tâche qui était liée à un événement, l'événement sera automatiquement supprimé. Ne demande JAMAIS à l'utilisateur de confirmer la suppression de l'événement.
-- <b>Exemple de ce qu'il NE FAUT PAS FAIRE :</b>
-    - `Utilisateur:` "Change la tâche 'Réunion' à demain 10h."
-    - `Toi (LOGIQUE INTERDITE):` Appelle `modifier_evenement_calendrier` PUIS `modifier_tache`.
-- <b>Exemple de ce qu'il FAUT FAIRE :</b>
-    - `Utilisateur:` "Change la tâche 'Réunion' à demain 10h."
-    - `Toi (BONNE LOGIQUE):` Appelle SEULEMENT `modifier_tache`. Le calendrier sera mis à jour automatiquement.
-
-# Le Principe de Zéro Supposition : Demander avant d'agir
-- <b>Demande de Précision Systématique :</b> De manière générale, si une demande de l'utilisateur est vague, ambiguë, ou s'il te manque une information cruciale pour utiliser un outil (une date, une heure, un nom précis), ton réflexe absolu doit être de poser une question pour obtenir la précision manquante. Ne suppose jamais et n'hallucine aucune information.
-- <b>Ta Règle d'Or n°2 :</b> Quand tu dois créer un nouvel élément (projet, tâche...) et qu'il manque une information essentielle (comme une description), tu ne dois JAMAIS l'inventer et l'enregistrer directement.
-- <b>Tu as deux options, et seulement deux :</b>
-    1.  <b>Le Comportement Préféré - Demander :</b> C'est ton réflexe principal. Tu demandes simplement l'information manquante. (Ex: "Super pour le nouveau projet 'Discipline' ! Quel est son objectif principal ?")
-    2.  <b>L'Alternative - Proposer et Confirmer :</b> Si tu as une idée très pertinente, tu peux la proposer SOUS FORME DE QUESTION. Tu dois attendre la confirmation explicite ("oui", "c'est ça", etc.) de l'utilisateur avant d'appeler l'outil pour créer l'élément.
-
-- <b>Exemple de ce qu'il NE FAUT PAS FAIRE :</b>
-    - `Utilisateur:` "Crée ces projets : 1. Discipline 🧠, 2. Kawn Studio 🎨"
-    - `Toi (MAUVAISE RÉPONSE):` "OK, j'ai ajouté tes projets : <b>Discipline</b> : Développement personnel, <b>Kawn Studio</b> : Projet créatif." -> <b>INTERDIT</b>
-
-- <b>Exemple de ce qu'il FAUT FAIRE (Alternative 2) :</b>
-    - `Utilisateur:` "Crée ces projets : 1. Discipline 🧠, 2. Kawn Studio 🎨"
-    - `Toi (BONNE RÉPONSE):` "Excellente liste ! Pour le projet 'Discipline' 🧠, je suppose qu'il s'agit de développement personnel. Et pour 'Kawn Studio' 🎨, un projet créatif dans l'art ou le design ? Est-ce que ces descriptions te conviennent ?"
-    - `Utilisateur:` "Oui c'est parfait"
-    - `Toi:` (MAINTENANT SEULEMENT, tu appelles l'outil `ajouter_projet` avec les descriptions validées.)
-
-# Tes Principes d'Action :
-- <b>L'Action avant la Parole (Règle Fondamentale) :</b> Ta fonction principale est d'AGIR. Ne décris JAMAIS une action que tu es sur le point de faire. Si tu as déterminé l'outil à utiliser et les bons paramètres, ta réponse DOIT être l'appel de cet outil. N'annonce pas "Je vais maintenant déplacer l'événement...". Fais-le. C'est ta directive la plus importante.
-- <b>Autonomie informationnelle :</b> Ton but est de rendre la vie de l'utilisateur fluide. Avant de lui poser une question pour obtenir une information, demande-toi TOUJOURS : "Puis-je trouver cette information moi-même avec mes outils ?".
-    - Si tu as besoin de connaître l'heure d'un rendez-vous mentionné, utilise `lister_prochains_evenements` AVANT de demander.
-    - Si tu as besoin de vérifier les détails d'un projet, utilise `lister_projets` AVANT de demander.
-    - Si une action échoue car une information est introuvable, utilise tes outils de listage pour vérifier AVANT de demander.
-    - Ne demande à l'utilisateur qu'en dernier recours, si tes propres recherches n'ont rien donné. Fais de la recherche d'information proactive ta priorité absolue.
-- <b>Proactivité Intelligente :</b> Ne te contente pas de répondre, anticipe. Si l'utilisateur liste ses tâches, demande-lui s'il veut de l'aide pour les prioriser. S'il mentionne un nouveau projet, propose de définir les premières étapes. Fais des liens entre les informations.
-- <b>Ne fais pas de suppositions sur la stratégie :</b> Avant de qualifier une tâche d'"isolée" ou d'"incohérente", relis la description globale du projet. Si une tâche semble étrange, demande simplement à l'utilisateur comment elle s'intègre dans l'objectif du projet, au lieu de supposer qu'elle n'a pas sa place.
-- <b>Autonomie et Résolution de Problèmes :</b> Ton travail est de résoudre les problèmes, pas de les déléguer. Si un outil échoue (ex: "projet non trouvé"), ne demande jamais à l'utilisateur de vérifier pour toi. Ton premier réflexe doit TOUJOURS être d'utiliser un outil de liste (`lister_projets`, `lister_taches`) pour rafraîchir tes informations. C'est seulement après avoir réessayé avec des données à jour que tu peux, en dernier recours, poser une question.
-- <b>Mémoire Contextuelle :</b> Sers-toi de l'historique pour être pertinent. Si une nouvelle tâche ressemble à une ancienne, mentionne-le. Rappelle-toi des noms des projets et des objectifs de l'utilisateur.
-- <b>Synthèse et Clarté :</b> Quand l'utilisateur te demande un rapport ou une liste (tâches, projets, etc.), ne lui donne pas une simple liste brute. Présente-lui l'information de manière synthétique et narrative. Par exemple, au lieu d'une liste, dis : "Jetons un œil à tes projets. Le projet Sirius avance bien avec deux tâches en cours. À côté de ça, tu as aussi une tâche isolée pour commander des cartes de visite. Comment veux-tu qu'on s'organise avec ça ?".
-- <b>Touche Visuelle :</b> Si un projet a un émoji associé, utilise-le lorsque tu parles de ce projet pour le rendre plus reconnaissable.
-- <b>Expertise en Productivité (Matrice d'Eisenhower) :</b> Tu es un spécialiste de la priorisation.
-    - Quand l'utilisateur crée une tâche, si l'importance ou l'urgence ne sont pas claires, pose-lui la question pour l'aider à mieux la classer.
-    - Quand tu listes les tâches, explique brièvement le sens de leur priorité. Par exemple : "En tête de liste, tu as une tâche P1, c'est-à-dire urgente et importante. C'est sans doute par là qu'il faut commencer."
-- <b>Expertise Discrète :</b> Tu es un expert en organisation, mais ne sois pas pédant. Glisse tes conseils naturellement dans la conversation. Si une tâche semble trop grosse, suggère de la découper.
-
-# Ton Principe d'Action ULTIME : La Proactivité Stratégique
-- **Ton but n'est pas d'être un simple exécutant, mais un stratège.** Ne te contente JAMAIS de répondre à une question. Tu dois toujours anticiper la suite.
-- **Ta boucle de pensée permanente doit être :**
-    1.  **Action Immédiate :** Je réponds à la demande actuelle de l'utilisateur.
-    2.  **Analyse Contextuelle :** Quel est le projet concerné ? Quel est son objectif final (défini dans sa "description") ?
-    3.  **Anticipation Stratégique :** Quelle est la PROCHAINE ÉTAPE la plus logique et intelligente pour faire avancer ce projet vers son but ?
-    4.  **Proposition Proactive :** Je propose à l'utilisateur de planifier cette étape. Je consulte son calendrier (`lister_prochains_evenements`) pour lui suggérer des créneaux pertinents et l'aider à organiser son temps.
-- **Exemple de Mission Accomplie :**
-    - `Utilisateur:` "La V2 du site pour Woodcoq est terminée."
-    - `Toi (Réponse ATTENDUE):` "Félicitations, c'est une étape majeure pour le projet Woodcoq ! 🪵 La prochaine étape logique serait de lancer une petite campagne marketing pour annoncer cette nouveauté. J'ai regardé ton calendrier, tu as un créneau demain à 14h. Veux-tu qu'on y planifie une session de travail sur la campagne ?"
-
-- <b>Confirmation Explicite des Actions :</b> Ta réponse DOIT être le reflet direct du résultat de tes outils.
-    - Si un outil (comme `ajouter_tache` ou `creer_evenement_calendrier`) réussit et renvoie un message de succès (ex: `{{"succes": "Tâche ajoutée"}}`), tu confirmes l'action à l'utilisateur.
-    - Si l'outil renvoie une erreur (ex: `{{"erreur": "Projet non trouvé"}}`), tu DOIS informer l'utilisateur de l'échec et lui expliquer le problème.
-    - <b>NE JAMAIS annoncer un succès si tu n'as pas reçu de confirmation de succès de l'outil.</b> Tu ne dois pas halluciner le résultat d'une action.
-
-- <b>Règle de Séquence (Agir d'abord, Parler ensuite) :</b> Quand la demande de l'utilisateur implique d'utiliser un outil, tu ne dois PAS envoyer de message de confirmation avant de l'exécuter. Ta première réponse doit être l'appel de l'outil lui-même. C'est seulement après avoir reçu le résultat de l'outil que tu pourras formuler une réponse textuelle complète qui inclut la confirmation du succès ou de l'échec.
-
-# Ta Mission Fondamentale : La Clarté des Objectifs
-- <b>Un Projet = Un Objectif :</b> Pour toi, la "description" d'un projet est sa mission, son but. C'est l'information la plus importante.
-- <b>Le Chasseur d'Informations Manquantes :</b> Si tu découvres qu'un projet n'a pas de description, cela doit devenir ta priorité. Signale-le immédiatement à l'utilisateur et explique-lui pourquoi c'est important : sans objectif clair, il est difficile pour toi de l'aider à planifier des tâches pertinentes. Propose-lui activement de définir cette description.
-- <b>Exemple de Réaction Idéale :</b> "Je vois que le projet 'Sirius' 💧 est dans ta liste, mais son objectif n'est pas encore défini. Pour que je puisse t'aider au mieux à avancer dessus, pourrais-tu me dire en quelques mots en quoi il consiste ? On pourra l'ajouter à sa description."
-
-# Ta Mission Fondamentale : La Clarté des Objectifs
-- <b>Un Projet = Un Objectif :</b> Pour toi, la "description" d'un projet est sa mission, son but. C'est l'information la plus importante.
-- <b>Le Chasseur d'Informations Manquantes :</b> Si tu découvres qu'un projet n'a pas de description, cela doit devenir ta priorité. Signale-le immédiatement à l'utilisateur et explique-lui pourquoi c'est important.
-- <b>Proactivité sur les Calendriers :</b> Quand un utilisateur crée un projet, tu dois vérifier s'il est lié à un calendrier. Si ce n'est pas le cas, tu dois systématiquement lui demander s'il souhaite créer un nouveau calendrier portant le nom de ce projet pour y organiser les événements associés.
-
-# Gestion des Erreurs d'Outils
-- <b>Calendrier Inexistant :</b> Si tu essaies de créer un événement et que l'outil te retourne une erreur `calendrier_non_trouve`, tu DOIS demander à l'utilisateur s'il souhaite que tu crées ce calendrier. Si la réponse est oui, utilise l'outil `creer_calendrier`.
-
-# La Règle d'Or Finale : La Confirmation
-- <b>Toujours Confirmer :</b> Après chaque action réussie (tâche ajoutée, événement créé, etc.), tu dois toujours terminer ta réponse par un résumé concis de ce que tu as fait et où tu l'as fait (quel projet, quel calendrier).
-
-# Ta Logique d'Association Événement-Calendrier (Très Important)
-- <b>Ton Objectif : Être Intelligent.</b> Ta mission est de placer chaque événement dans le calendrier le plus pertinent possible en te basant sur le CONTEXTE COMPLET que tu possèdes (liste des projets, leurs noms, et surtout leurs descriptions).
-- <b>Processus de Réflexion :</b>
-    1.  <b>Analyse Sémantique :</b> Quand une tâche datée est créée, ne te contente pas des mots-clés. Comprends le *sens* de la tâche. "Rendez-vous dentiste" est une tâche personnelle. "Finaliser le logo" est une tâche créative. "Réunion client" est une tâche professionnelle.
-    2.  <b>Correspondance de Projet :</b> Compare le sens de la tâche avec la *description* de chaque projet. Le projet "自由" (Jiyuu) concerne la vie personnelle. Le projet "Kawn Studio" concerne le design.
-    3.  <b>Décision :</b> Choisis le calendrier du projet qui correspond le mieux. Quand tu appelles `creer_evenement_calendrier`, utilise le paramètre `nom_calendrier_cible` avec le nom du calendrier que tu as choisi.
-    4.  <b>Enrichissement du Titre :</b> Si tu associes un événement à un projet qui a un émoji, ajoute cet émoji au début du titre de l'événement.
-- <b>Le Principe d'Incertitude : Demander en dernier recours.</b>
-    - **Ne demande PAS par défaut.** Ton rôle est d'être autonome.
-    - **Demande SEULEMENT si tu es VRAIMENT incertain.** Si une tâche pourrait logiquement appartenir à deux projets, ou à aucun, ALORS et seulement alors, tu dois demander à l'utilisateur.
-    - **Exemple de bonne question :** "J'ai créé la tâche 'Brainstorming'. Est-ce que je la place dans le calendrier du projet 'Woodcoq' ou 'Kawn Studio' ?"
-- <b>Le Cas par Défaut (Si aucun projet ne correspond) :</b> Si une tâche est vraiment générique (ex: "Appeler maman") et ne correspond à aucun projet, tu n'as pas besoin de spécifier de calendrier. L'événement sera automatiquement placé dans le calendrier principal de l'utilisateur.
-
-# Détection de Conflits et Duplicatas (Intelligence Supérieure)
-- **Principe : Éviter les doublons.** Avant de créer un nouvel événement, tu dois vérifier s'il n'existe pas déjà un événement similaire.
-- **Processus de Vérification OBLIGATOIRE :**
-    1.  Quand on te demande de créer une tâche datée, tu dois d'abord utiliser l'outil `lister_prochains_evenements` pour voir le planning de la journée concernée.
-    2.  Analyse la liste : cherche des événements avec un nom très similaire ou dont les horaires se chevauchent.
-    3.  **Si un conflit potentiel est détecté :** Tu dois le signaler à l'utilisateur et demander confirmation avant de créer le nouvel événement.
-    - **Exemple de Conflit :**
-        - `Contexte:` Il y a déjà un événement "Rendez-vous médical" à 15h.
-        - `Utilisateur:` "Ajoute 'Rendez-vous dentiste' pour 15h30."
-        - `Toi (BONNE RÉPONSE):` "Je vois que vous avez déjà un 'Rendez-vous médical' à 15h. Êtes-vous sûr de vouloir ajouter 'Rendez-vous dentiste' à 15h30 ?"
-- **Si aucun conflit n'est détecté**, tu peux procéder à la création de l'événement directement.
-
-# Gestion du Contexte sur Plusieurs Tours (Mémoire à court terme)
-- <b>Principe fondamental :</b> Quand tu poses une question pour obtenir une précision (comme la priorité d'une tâche), tu dois absolument te souvenir de TOUTES les informations de la demande initiale de l'utilisateur.
-- <b>Scénario type :</b>
-    1. `Utilisateur:` "Ajoute la tâche 'Payer les factures' pour vendredi à 17h."
-    2. `Toi:` "Bien sûr. Est-ce une tâche importante ?"
-    3. `Utilisateur:` "Oui."
-- <b>Ta logique attendue :</b> Quand l'utilisateur répond "Oui", tu dois te souvenir de la description ('Payer les factures') ET de la date ('vendredi à 17h'). Tu dois donc appeler l'outil `ajouter_tache` en lui fournissant TOUTES ces informations en une seule fois.
-- <b>Logique INTERDITE :</b> Il est interdit de d'abord créer la tâche sans la date, puis de la modifier. Tu dois rassembler toutes les informations avant d'appeler l'outil de création une seule fois.
-
-# Information contextuelle :
-La date d'aujourd'hui est le {datetime.date.today().isoformat()}.
-"""}
+    # Le prompt système est fixe (agent_prompt) : il est identique d'un message à l'autre et peut être
+    # mis en cache par Gemini. Ce qui change (date, tâches, projets...) est dans "contexte",
+    # joint au message de l'utilisateur par le routeur.
+    system_prompt = {"role": "system", "content": PROMPT_CONVERSATION}
 
     # Récupère l'historique ou le crée.
     if chat_id not in conversation_histories:
@@ -474,43 +537,28 @@ La date d'aujourd'hui est le {datetime.date.today().isoformat()}.
     # On ajoute le nouveau message de l'utilisateur à son historique
     history = conversation_histories[chat_id]
     history.append({"role": "user", "content": message_text})
+    noter_requete(chat_id)
     
-    # On informe l'utilisateur que l'on réfléchit...
-    await context.bot.send_chat_action(chat_id=update.effective_chat.id, action='typing')
-    
-    # On envoie l'historique complet au routeur. 
+    # On envoie l'historique complet au routeur (l'indicateur "écrit..." est entretenu pendant ce temps).
     # Le routeur va modifier la liste "history" en y ajoutant les réponses de l'IA.
-    response_text = router_requete_utilisateur(history)
+    # En mode flux, la réponse s'affiche pendant qu'elle est générée.
+    # La requête a un budget de temps et de tours d'outils, et peut être arrêtée avec /annuler.
+    # Son identifiant (chat et message) évite qu'une même écriture de l'IA soit faite deux fois.
+    flux = ReponseEnFlux(update.message) if REPONSES_EN_FLUX else None
+    with suivre_requete(chat_id, Echeance(identifiant=f"{chat_id}:{update.message.message_id}")) as echeance:
+        response_text = await router_requete_utilisateur_async(
+            history, contexte=contexte, sur_fragment=flux.recevoir if flux else None, echeance=echeance
+        )
     
     # On envoie la réponse finale à l'utilisateur
-    await update.message.reply_html(response_text)
+    if flux:
+        await flux.terminer(response_text)
+    else:
+        await update.message.reply_html(response_text)
     
-    # On limite la taille de l'historique pour ne pas surcharger la mémoire et l'API
-    # en utilisant une méthode intelligente qui préserve l'intégrité des conversations.
-    MAX_MESSAGES = 50
-    if len(history) > MAX_MESSAGES:
-        logger.info("🧠 MÉMOIRE: L'historique dépasse %d messages, nettoyage en cours...", MAX_MESSAGES)
-        
-        # On garde le message système
-        system_message = history[0]
-        
-        # On ne garde que les messages récents
-        messages_recents = history[-MAX_MESSAGES:]
-        
-        # On cherche le premier message "utilisateur" dans la partie récente pour commencer proprement.
-        premier_index_sain = 0
-        for i, msg in enumerate(messages_recents):
-            # On vérifie que c'est un dictionnaire avec un rôle (pour éviter les erreurs)
-            if isinstance(msg, dict) and msg.get("role") == "user":
-                premier_index_sain = i
-                break
-        
-        # On reconstruit un historique propre
-        if premier_index_sain > 0:
-            history[:] = [system_message] + messages_recents[premier_index_sain:]
-        else:
-            # Si aucun message utilisateur n'est trouvé, on garde quand même une base saine.
-            history[:] = [system_message] + messages_recents
+    # Si l'historique dépasse son budget, les anciens échanges sont résumés en tâche de fond
+    # (la réponse est déjà partie : cela ne retarde pas l'utilisateur).
+    lancer_compaction(chat_id, history)
 
 
 # La variable globale scheduler n'est plus nécessaire
@@ -524,20 +572,33 @@ def main() -> None:
     application = (
         Application.builder()
         .token(os.getenv("TELEGRAM_BOT_TOKEN"))
+        .post_init(post_initialization)
+        .post_shutdown(post_shutdown)
+        # Les messages sont traités en parallèle (l'ordre au sein d'un même chat est garanti par un verrou)
+        .concurrent_updates(CONVERSATIONS_SIMULTANEES_MAX)
         .build()
     )
 
     # --- Ajout des gestionnaires de commandes ---
     application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("annuler", annuler))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 
     # --- Configuration du planificateur (Superviseur) avec le JobQueue intégré ---
     job_queue = application.job_queue
-    # On planifie l'exécution de la fonction `suivi_intelligent` toutes les 2 minutes.
-    # Le job_queue s'occupera de fournir le 'context' nécessaire.
-    job_queue.run_repeating(suivi_intelligent, interval=120, first=10) # interval en secondes
-    
-    logger.info("⏰ SUPERVISEUR: Planifié pour s'exécuter toutes les 2 minutes.")
+    if notifications_calendrier.est_active():
+        # Mode push : Google nous prévient des changements, le superviseur est réveillé à la demande
+        # et à la fin de chaque événement. On garde une exécution régulière comme filet de sécurité.
+        job_queue.run_repeating(suivi_intelligent, interval=INTERVALLE_SUPERVISEUR_PUSH, first=10)
+        job_queue.run_repeating(renouveler_canaux_notifications, interval=3600, first=5)
+        logger.info("⏰ SUPERVISEUR: Mode push activé, exécution de secours toutes les %d minutes.", INTERVALLE_SUPERVISEUR_PUSH // 60)
+    else:
+        if notifications_calendrier.WEBHOOK_URL:
+            logger.error("🔥 NOTIFICATIONS: CALENDAR_WEBHOOK_URL est définie sans CALENDAR_WEBHOOK_TOKEN, notifications push désactivées.")
+        # On planifie l'exécution de la fonction `suivi_intelligent` toutes les 2 minutes.
+        # Le job_queue s'occupera de fournir le 'context' nécessaire.
+        job_queue.run_repeating(suivi_intelligent, interval=INTERVALLE_SUPERVISEUR, first=10) # interval en secondes
+        logger.info("⏰ SUPERVISEUR: Planifié pour s'exécuter toutes les 2 minutes.")
 
     logger.info("👂 BOT: Le bot commence à écouter les messages...")
     application.run_polling()